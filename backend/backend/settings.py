@@ -58,12 +58,79 @@ DATABASES = {
     }
 }
 
+# Holds the per-user summary cache. Its keys come from versions read from
+# the database, so per-process local memory never serves a stale summary;
+# a shared backend such as 'django.core.cache.backends.filebased.FileBasedCache'
+# with a LOCATION only lets workers reuse each other's entries.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'paywise',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Ollama server used for category detection, and how many requests a batch may have in flight
+OLLAMA_URL = os.environ.get('OLLAMA_URL', 'http://localhost:11434')
+OLLAMA_MODEL = 'llama3.2'
+OLLAMA_MAX_WORKERS = 8
+# (connect, read) timeouts in seconds
+OLLAMA_TIMEOUT = (2, 10)
+# At most this many Ollama requests per process; callers wait up to the queue timeout for a slot
+OLLAMA_MAX_CONCURRENCY = 8
+OLLAMA_QUEUE_TIMEOUT = 1.0
+# Consecutive timeouts or server errors that open the circuit, and seconds before it is retried
+OLLAMA_CIRCUIT_FAILURES = 3
+OLLAMA_CIRCUIT_RESET = 30
+
+# Local classifier written by train_category_model; answers at or above the threshold skip Ollama
+CATEGORY_MODEL_PATH = BASE_DIR / 'ml_models' / 'category_model.joblib'
+CATEGORY_MODEL_THRESHOLD = 0.6
+
+# In-process LRU of LLM category detections; SHARED adds the default cache as a second tier
+CATEGORY_DETECTION_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 60 * 60 * 24,
+    'SHARED': True,
+}
+
+# In-process LRU over each user's learned description to category mappings
+CATEGORY_MAPPING_CACHE = {
+    'MAX_ENTRIES': 50000,
+    'TTL': 60 * 10,
+}
+
+# Engine used by process_receipts: 'easyocr' or 'tesseract' (needs the tesseract binary)
+RECEIPT_OCR_ENGINE = 'easyocr'
+RECEIPT_OCR_LANGUAGES = ['en']
+
+# Largest receipt image accepted; bigger uploads are refused before they are read (see expenses.uploads).
+# The limit is per request, not per user: the receipt_upload rate below bounds what one user can send.
+RECEIPT_UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+
+# Largest CSV statement POST /expenses/import/ accepts; bigger uploads are refused before they are read
+STATEMENT_IMPORT_MAX_BYTES = 50 * 1024 * 1024
+
+# Cache alias the upload throttles count requests in. With the local-memory
+# default every worker process keeps its own counts, so N workers let each
+# user through N times the rates below; point this at a cache all workers
+# share before relying on the limits.
+UPLOAD_THROTTLE_CACHE = 'default'
+
 AUTH_USER_MODEL = 'authentication.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_THROTTLE_RATES': {
+        # Per user, for requests carrying files
+        'receipt_upload': '30/minute',
+        # Per user, for POST /expenses/import/
+        'statement_import': '10/hour',
+    },
 }
 
 SIMPLE_JWT = {
@@ -83,4 +150,8 @@ USE_I18N = True
 USE_TZ = True
 
 STATIC_URL = 'static/'
+
+# Uploaded receipts and their cached derivatives (see expenses.derivatives)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
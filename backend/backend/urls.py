@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
@@ -6,3 +8,6 @@ urlpatterns = [
     path('api/auth/', include('authentication.urls')),  # This line is crucial
     path('api/expenses/', include('expenses.urls')),
 ]
+
+# Serves uploads in development only; static() is a no-op when DEBUG is off
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
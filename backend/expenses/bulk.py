@@ -0,0 +1,175 @@
+"""
+Creating many expenses in one request.
+
+ExpenseCreateSerializer.create looks up the category, group and payer of
+each expense on its own and inserts it alone, with the post_save signals
+refreshing visibility, rollups and balances one expense at a time.
+Here every row is validated first, with the fields checked per row and
+all the categories, groups and payers they name fetched in one in_bulk
+query each. Only when no row has an error are the expenses inserted
+with bulk_create, and the work the signals would have done is done once
+for the whole set, in the same transaction: nothing is created unless
+everything is.
+
+Statement imports go through save_expense_rows instead, which takes
+plain tuples and inserts them with multi-row INSERT ... RETURNING
+statements of its own. At import sizes most of bulk_create's time goes
+to building and preparing a model instance per row.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .categorization_jobs import enqueue_categorization
+from .category_mappings import remember_categories
+from .ledger import apply_balance_deltas, expense_obligations
+from .models import Expense, ExpenseCategory, ExpenseGroup
+from .serializers import ExpenseCreateSerializer
+from .visibility import add_visibility, group_members
+
+User = get_user_model()
+
+MAX_EXPENSES = 5000
+
+
+def validate_expenses(user, rows):
+    """
+    Validate every row up front. Returns the validated rows and a list
+    of {'row': index, 'errors': {field: [messages]}}, one per bad row.
+    """
+    child = ExpenseCreateSerializer()
+    validated = []
+    errors = {}
+    for index, row in enumerate(rows):
+        try:
+            validated.append(child.run_validation(row))
+        except ValidationError as error:
+            validated.append(None)
+            errors[index] = error.detail
+
+    references = [row for row in validated if row is not None]
+    categories = ExpenseCategory.objects.in_bulk(
+        {row['category_id'] for row in references if 'category_id' in row}
+    )
+    # Expenses can only go into the user's own groups
+    groups = ExpenseGroup.objects.filter(members=user).in_bulk(
+        {row['group_id'] for row in references if 'group_id' in row}
+    )
+    payers = User.objects.in_bulk(
+        {row['paid_by_id'] for row in references if row.get('paid_by_id') is not None}
+    )
+    members = group_members(list(groups))
+
+    for index, row in enumerate(validated):
+        if row is None:
+            continue
+        row_errors = {}
+        category_id = row.pop('category_id', None)
+        if category_id is not None:
+            row['category'] = categories.get(category_id)
+            if row['category'] is None:
+                row_errors['category_id'] = [f'Unknown category {category_id}.']
+        group_id = row.pop('group_id', None)
+        if group_id is not None:
+            row['group'] = groups.get(group_id)
+            if row['group'] is None:
+                row_errors['group_id'] = [f'Group {group_id} does not exist or you are not a member.']
+        paid_by_id = row.pop('paid_by_id', None)
+        if paid_by_id is None or paid_by_id == user.pk:
+            row['paid_by'] = user
+        elif paid_by_id not in payers:
+            row_errors['paid_by_id'] = [f'Unknown user {paid_by_id}.']
+        elif paid_by_id not in members.get(group_id, ()):
+            row_errors['paid_by_id'] = ['Only you or a member of the expense group can be the payer.']
+        else:
+            row['paid_by'] = payers[paid_by_id]
+        if row_errors:
+            errors[index] = row_errors
+    return validated, [{'row': index, 'errors': errors[index]} for index in sorted(errors)]
+
+
+@transaction.atomic
+def create_expenses(user, rows):
+    """Insert validated rows as expenses created by user; returns the expenses"""
+    return save_expenses([Expense(created_by=user, **row) for row in rows])
+
+
+@transaction.atomic
+def save_expenses(expenses):
+    """
+    bulk_create new expenses and bring everything derived from expenses
+    up to date. Those without an ai_detected_category are queued for the
+    categorization worker.
+    """
+    expenses = Expense.objects.bulk_create(expenses, batch_size=500)
+    remember_categories(expenses)
+    _expenses_added(
+        [expense.pk for expense in expenses],
+        [expense.pk for expense in expenses if not expense.ai_detected_category],
+    )
+    return expenses
+
+
+@transaction.atomic
+def save_expense_rows(fields, rows):
+    """
+    save_expenses for rows given as tuples of values for fields (attnames
+    such as paid_by_id), every other field taking its default. Values go
+    to the database driver as they are, so they must already be plain
+    str, Decimal, date, number or None. The rows carry no category, so
+    there are no learned mappings to record. Returns the new ids in order.
+    """
+    expense_ids = insert_expenses(fields, rows)
+    category = fields.index('ai_detected_category') if 'ai_detected_category' in fields else None
+    _expenses_added(
+        expense_ids,
+        [pk for pk, row in zip(expense_ids, rows) if category is None or not row[category]],
+        grouped='group_id' in fields,
+    )
+    return expense_ids
+
+
+def insert_expenses(fields, rows):
+    """INSERT rows as expenses, with the defaults prepared once, and return their ids in order"""
+    if not connection.features.can_return_rows_from_bulk_insert:
+        expenses = [Expense(**dict(zip(fields, row))) for row in rows]
+        return [expense.pk for expense in Expense.objects.bulk_create(expenses, batch_size=500)]
+
+    now = timezone.now()
+    defaults = []
+    for field in Expense._meta.concrete_fields:
+        if field.primary_key or field.attname in fields:
+            continue
+        value = now if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False) else (
+            field.get_default()
+        )
+        defaults.append((field.column, field.get_db_prep_save(value, connection)))
+
+    quote = connection.ops.quote_name
+    columns = [Expense._meta.get_field(name).column for name in fields] + [column for column, _ in defaults]
+    constants = tuple(value for _, value in defaults)
+    placeholders = f"({', '.join(['%s'] * len(columns))})"
+    batch = max(1, connection.features.max_query_params // len(columns))
+
+    expense_ids = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch):
+            chunk = rows[start:start + batch]
+            cursor.execute(
+                f"INSERT INTO {quote(Expense._meta.db_table)} ({', '.join(map(quote, columns))}) "
+                f"VALUES {', '.join([placeholders] * len(chunk))} RETURNING {quote('id')}",
+                [value for row in chunk for value in (*row, *constants)],
+            )
+            # RETURNING gives the rows in insert order, as bulk_create relies on too
+            expense_ids.extend(expense_id for expense_id, in cursor.fetchall())
+    return expense_ids
+
+
+def _expenses_added(expense_ids, uncategorized_ids, grouped=True):
+    # What the post_save signals do per expense, once for all of them
+    add_visibility(expense_ids)
+    if grouped:
+        # Only group expenses put anyone in debt
+        apply_balance_deltas(expense_obligations(expense_ids))
+    enqueue_categorization(uncategorized_ids)
@@ -0,0 +1,145 @@
+"""
+Keyword-based expense categorization.
+
+The keyword table below is compiled once at import into a token index,
+so classifying a description is one regex tokenization and a set
+intersection with the index, instead of a substring scan per keyword.
+Keywords match whole words, in singular or plural ("banana", "bananas",
+"groceries"), and two-word keywords ("ice cream") match adjacent tokens.
+"""
+import re
+from collections import namedtuple
+
+# (rule, category, keywords) in priority order: when a description hits
+# several rules the earliest one wins. Groceries come first and are the
+# only rule strong enough to override the LLM's answer.
+KEYWORD_TABLE = (
+    ('groceries', 'Food', [
+        'milk', 'curd', 'yogurt', 'paneer', 'butter', 'cheese', 'bread', 'vegetable', 'veggies',
+        'fruit', 'banana', 'apple', 'egg', 'rice', 'wheat', 'atta', 'flour', 'dal', 'lentil',
+        'pulse', 'oil', 'spice', 'sugar', 'salt', 'tea', 'coffee', 'grocery', 'supermarket',
+        'kirana',
+    ]),
+    ('food', 'Food', [
+        'food', 'restaurant', 'dinner', 'lunch', 'breakfast', 'pizza', 'burger', 'snack', 'meal',
+        'cafe', 'bakery', 'sweets', 'chocolate', 'ice cream', 'juice', 'water',
+    ]),
+    ('entertainment', 'Entertainment', [
+        'movie', 'cinema', 'theatre', 'game', 'concert', 'party', 'show', 'ticket',
+        'entertainment', 'fun', 'amusement', 'park', 'museum', 'exhibition', 'festival', 'event',
+        'booking', 'reservation',
+    ]),
+    ('transport', 'Transport', [
+        'uber', 'taxi', 'cab', 'fuel', 'gas', 'parking', 'bus', 'train', 'metro', 'subway',
+        'flight', 'airplane', 'car', 'bike', 'scooter', 'maintenance', 'repair', 'insurance',
+        'toll', 'fare',
+    ]),
+    ('shopping', 'Shopping', [
+        'shirt', 'shoes', 'dress', 'clothes', 'fashion', 'shopping', 'store', 'mall', 'market',
+        'shop', 'buy', 'purchase', 'retail', 'electronics', 'phone', 'laptop', 'accessories',
+        'jewelry',
+    ]),
+    ('bills', 'Bills', [
+        'electricity', 'internet', 'rent', 'bill', 'utility', 'mobile', 'subscription', 'service',
+        'tax', 'fees', 'charges',
+    ]),
+    ('healthcare', 'Healthcare', [
+        'medicine', 'doctor', 'hospital', 'pharmacy', 'medical', 'health', 'dental', 'eye',
+        'vision', 'therapy', 'treatment', 'consultation', 'prescription', 'vitamins',
+        'supplements',
+    ]),
+    ('education', 'Education', [
+        'course', 'book', 'training', 'workshop', 'education', 'school', 'college', 'university',
+        'class', 'lesson', 'tutorial',
+    ]),
+    ('travel', 'Travel', [
+        'hotel', 'vacation', 'tourism', 'travel', 'trip', 'journey', 'accommodation', 'resort',
+        'lodging',
+    ]),
+    ('home', 'Home', [
+        'furniture', 'household', 'home', 'kitchen', 'bathroom', 'bedroom', 'living room',
+        'garden', 'yard',
+    ]),
+)
+
+DEFAULT_CATEGORY = 'Other'
+
+KeywordMatch = namedtuple('KeywordMatch', ['category', 'rule', 'keywords'])
+
+_Entry = namedtuple('_Entry', ['priority', 'position', 'rule', 'category', 'keyword'])
+
+_TOKEN = re.compile(r'[a-z]+')
+
+
+def _inflections(word):
+    """Plural and singular spellings a keyword should also match as a whole word"""
+    forms = {word + 's', word + 'es'}
+    if word.endswith('y') and word[-2:-1] not in 'aeiou':
+        forms.add(word[:-1] + 'ies')
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        forms.add(word[:-1])
+    return forms
+
+
+def _compile(table):
+    """
+    Map every spelling of every keyword to its _Entry. Two-word keywords
+    are keyed as 'first second' and their first words are collected so
+    bigrams are only built for descriptions that could contain one.
+    """
+    index = {}
+    position = 0
+    for priority, (rule, category, keywords) in enumerate(table):
+        for keyword in keywords:
+            key = ' '.join(_TOKEN.findall(keyword))
+            if key in index:
+                raise ValueError(f'Keyword {keyword!r} is listed under two rules')
+            index[key] = _Entry(priority, position, rule, category, keyword)
+            position += 1
+
+    spellings = dict(index)
+    for key, entry in index.items():
+        head, _, last = key.rpartition(' ')
+        for form in _inflections(last):
+            # An exact keyword always beats another keyword's inflection
+            spellings.setdefault(f'{head} {form}' if head else form, entry)
+
+    words = frozenset(key for key in spellings if ' ' not in key)
+    phrases = {key: entry for key, entry in spellings.items() if ' ' in key}
+    phrase_starts = frozenset(key.split(' ', 1)[0] for key in phrases)
+    return spellings, words, phrases, phrase_starts
+
+
+_INDEX, _WORDS, _PHRASES, _PHRASE_STARTS = _compile(KEYWORD_TABLE)
+
+
+def match_keywords(description):
+    """
+    Return the KeywordMatch of the highest-priority rule the description
+    hits, with every keyword of that rule found in it, or None.
+    """
+    tokens = _TOKEN.findall(description.lower())
+    hits = [_INDEX[token] for token in _WORDS.intersection(tokens)]
+    if not _PHRASE_STARTS.isdisjoint(tokens):
+        for first, second in zip(tokens, tokens[1:]):
+            entry = _PHRASES.get(f'{first} {second}')
+            if entry is not None:
+                hits.append(entry)
+    if not hits:
+        return None
+
+    hits.sort()
+    best = hits[0]
+    keywords = []
+    for entry in hits:
+        if entry.priority != best.priority:
+            break
+        if entry.keyword not in keywords:
+            keywords.append(entry.keyword)
+    return KeywordMatch(category=best.category, rule=best.rule, keywords=tuple(keywords))
+
+
+def keyword_category(description):
+    """The keyword category of the description, or DEFAULT_CATEGORY when nothing matches"""
+    match = match_keywords(description)
+    return match.category if match else DEFAULT_CATEGORY
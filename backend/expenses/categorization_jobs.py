@@ -0,0 +1,105 @@
+"""
+Background categorization of new expenses.
+
+Creating an expense only inserts a CategorizationJob row in the same
+transaction; the categorize_expenses worker drains the table in batches
+and fills ai_detected_category and ai_confidence afterwards, so writes
+never wait on the model or Ollama. Each pass claims a batch with a
+token, answers what each creator has categorized before from their
+history, detects every other distinct description once through
+detect_many, and writes the results back with one bulk_update. Finished
+jobs are deleted, so the table only ever holds outstanding work.
+"""
+import logging
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .category_mappings import learned_categories
+from .detection import SOURCE_CONFIDENCE, Detection, detect_many
+from .jobs import claim_jobs, release_jobs
+from .models import CategorizationJob, Expense, ExpenseVisibility
+
+logger = logging.getLogger(__name__)
+
+ENQUEUE_SQL = """
+    INSERT INTO expenses_categorizationjob
+        (expense_id, status, attempts, last_error, claim_token, claimed_at, created_at, updated_at)
+    VALUES (%s, 'pending', 0, '', '', NULL, %s, %s)
+"""
+
+
+def enqueue_categorization(expense_ids):
+    """Queue the given expenses for categorization; one executemany, with no model instance per job"""
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.executemany(ENQUEUE_SQL, [(expense_id, now, now) for expense_id in expense_ids])
+
+
+def process_batch(batch_size):
+    """
+    Run one worker pass. Returns a dict counting the jobs claimed and
+    failed, the expenses categorized, the distinct descriptions the
+    creators' history could not answer and the calls sent towards Ollama.
+    """
+    token = claim_jobs(CategorizationJob, batch_size)
+    jobs = list(
+        CategorizationJob.objects.filter(claim_token=token)
+        .values_list('id', 'expense_id', 'expense__description', 'attempts', 'expense__created_by_id')
+    )
+    stats = {'claimed': len(jobs), 'categorized': 0, 'unique': 0, 'llm_calls': 0, 'failed': 0}
+    if not jobs:
+        return stats
+
+    try:
+        detections = _detect(jobs, stats)
+    except Exception as error:
+        logger.exception('Categorization pass failed for %d jobs', len(jobs))
+        attempts = {job_id: attempt for job_id, _, _, attempt, _ in jobs}
+        stats['failed'] = release_jobs(CategorizationJob, attempts, dict.fromkeys(attempts, error))
+        return stats
+
+    now = timezone.now()
+    expenses = {}
+    for (_, expense_id, *_), detection in zip(jobs, detections):
+        expenses[expense_id] = Expense(
+            pk=expense_id,
+            ai_detected_category=detection.category,
+            ai_confidence=round(detection.confidence, 4),
+            updated_at=now,
+        )
+    with transaction.atomic():
+        Expense.objects.bulk_update(
+            expenses.values(), ['ai_detected_category', 'ai_confidence', 'updated_at']
+        )
+        # Touching the visibility rows moves the ETags of everyone who can see these expenses
+        ExpenseVisibility.objects.filter(expense_id__in=list(expenses)).update(updated_at=now)
+        CategorizationJob.objects.filter(claim_token=token).delete()
+    stats['categorized'] = len(expenses)
+    return stats
+
+
+def _detect(jobs, stats):
+    """Detections for the jobs in order, from each creator's history first and detect_many for the rest"""
+    by_user = {}
+    for _, _, description, _, user_id in jobs:
+        by_user.setdefault(user_id, []).append(description)
+    learned = {
+        user_id: learned_categories(user_id, descriptions) for user_id, descriptions in by_user.items()
+    }
+
+    detections = [None] * len(jobs)
+    rest = []
+    for index, (_, _, description, _, user_id) in enumerate(jobs):
+        category = learned[user_id].get(description)
+        if category is None:
+            rest.append(index)
+        else:
+            detections[index] = Detection(category, 'history', SOURCE_CONFIDENCE['history'], 0.0)
+    if rest:
+        found, stats['unique'], stats['llm_calls'] = detect_many(
+            [jobs[index][2] for index in rest]
+        )
+        for index, detection in zip(rest, found):
+            detections[index] = detection
+    return detections
@@ -0,0 +1,125 @@
+"""
+Per-user memory of the category each user last filed a description under.
+
+Saving an expense with a category upserts a UserCategoryMapping row for
+its creator, keyed on the normalized description, and detection checks
+it before every other tier: someone who keeps filing "Bescom" under Home
+gets Home from then on. Lookups go through a bounded in-process LRU,
+misses included, falling back to the (user, key) unique index. The LRU
+holds category names and expires entries after CATEGORY_MAPPING_CACHE's
+TTL, which bounds how long another process can serve an outdated answer.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from .detection_cache import DetectionCache, normalize_description
+from .models import Expense, UserCategoryMapping
+
+DEFAULTS = {
+    'MAX_ENTRIES': 50000,
+    'TTL': 60 * 10,
+}
+
+# Cached for descriptions the user never categorized, so repeated misses skip the database
+NOT_LEARNED = ''
+
+
+def mapping_key(description):
+    return normalize_description(description)[:500]
+
+
+def _cache_key(user_id, key):
+    return f'{user_id}:{key}'
+
+
+def _build():
+    options = {**DEFAULTS, **getattr(settings, 'CATEGORY_MAPPING_CACHE', {})}
+    return DetectionCache(options['MAX_ENTRIES'], options['TTL'])
+
+
+mapping_cache = _build()
+
+
+def remember_category(expense):
+    """Record the category of a saved expense as its creator's choice for the description"""
+    remember_categories([expense])
+
+
+def remember_categories(expenses):
+    """remember_category for many expenses in one upsert; a later expense wins a shared description"""
+    latest = {}
+    for expense in expenses:
+        key = mapping_key(expense.description)
+        if key and expense.category_id is not None:
+            latest[expense.created_by_id, key] = expense.category_id
+    if not latest:
+        return
+    UserCategoryMapping.objects.bulk_create(
+        [
+            UserCategoryMapping(user_id=user_id, key=key, category_id=category_id)
+            for (user_id, key), category_id in latest.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['user', 'key'],
+        update_fields=['category', 'updated_at'],
+        batch_size=1000,
+    )
+    for user_id, key in latest:
+        mapping_cache.delete(_cache_key(user_id, key))
+
+
+def learned_categories(user_id, descriptions):
+    """Map each description the user has categorized before to that category's name"""
+    keys = {description: mapping_key(description) for description in descriptions}
+    names = {}
+    missing = set()
+    for key in set(keys.values()):
+        name = mapping_cache.get(_cache_key(user_id, key))
+        if name is None:
+            missing.add(key)
+        else:
+            names[key] = name
+
+    if missing:
+        found = dict(
+            UserCategoryMapping.objects.filter(user_id=user_id, key__in=missing)
+            .values_list('key', 'category__name')
+        )
+        for key in missing:
+            names[key] = found.get(key, NOT_LEARNED)
+            mapping_cache.set(_cache_key(user_id, key), names[key])
+
+    return {
+        description: names[key] for description, key in keys.items() if names[key] != NOT_LEARNED
+    }
+
+
+def learned_category(user_id, description):
+    return learned_categories(user_id, [description]).get(description)
+
+
+def rebuild_mappings():
+    """Recompute every mapping from the categorized expenses, the latest save winning; returns the count"""
+    latest = {}
+    rows = (
+        Expense.objects.filter(category__isnull=False)
+        .order_by('updated_at', 'id')
+        .values_list('created_by_id', 'description', 'category_id')
+        .iterator(chunk_size=2000)
+    )
+    for user_id, description, category_id in rows:
+        key = mapping_key(description)
+        if key:
+            latest[user_id, key] = category_id
+
+    with transaction.atomic():
+        UserCategoryMapping.objects.all().delete()
+        UserCategoryMapping.objects.bulk_create(
+            (
+                UserCategoryMapping(user_id=user_id, key=key, category_id=category_id)
+                for (user_id, key), category_id in latest.items()
+            ),
+            batch_size=1000,
+        )
+    mapping_cache.clear()
+    return len(latest)
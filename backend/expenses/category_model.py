@@ -0,0 +1,87 @@
+"""
+Locally trained category classifier.
+
+train_category_model fits a TF-IDF character n-gram vectorizer and a
+logistic regression on our own categorized expenses and saves the
+pipeline with joblib. Detection loads it lazily on first use and reloads
+it when the file on disk changes, so a retrain takes effect without a
+restart. Prediction is in-process and well under a millisecond, and
+predict_proba gives a real confidence for each answer.
+"""
+import os
+import threading
+
+import joblib
+from django.conf import settings
+
+from .detection_cache import normalize_description
+
+_loaded = None
+_loaded_stamp = None
+_lock = threading.Lock()
+
+
+def build_pipeline():
+    # scikit-learn is only imported to train; loading a saved model pulls in what it needs
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+
+    return make_pipeline(
+        TfidfVectorizer(
+            preprocessor=normalize_description,
+            analyzer='char_wb',
+            ngram_range=(2, 5),
+            min_df=2,
+            sublinear_tf=True,
+        ),
+        LogisticRegression(max_iter=1000, class_weight='balanced'),
+    )
+
+
+def save_model(pipeline, path, **metadata):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename, so a running process never loads a half-written file
+    partial = f'{path}.partial'
+    joblib.dump({'pipeline': pipeline, **metadata}, partial)
+    os.replace(partial, path)
+
+
+def load_model():
+    """Return the saved model, or None when none has been trained yet"""
+    global _loaded, _loaded_stamp
+    path = settings.CATEGORY_MODEL_PATH
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    stamp = (str(path), stat.st_mtime_ns, stat.st_size)
+    if stamp != _loaded_stamp:
+        with _lock:
+            if stamp != _loaded_stamp:
+                _loaded = joblib.load(path)
+                _loaded_stamp = stamp
+    return _loaded
+
+
+def predict_categories(descriptions):
+    """
+    Return a (category, probability) pair for each description, or None
+    when no model has been trained.
+    """
+    model = load_model()
+    if model is None:
+        return None
+    pipeline = model['pipeline']
+    probabilities = pipeline.predict_proba(descriptions)
+    best = probabilities.argmax(axis=1)
+    classes = pipeline.classes_
+    return [
+        (str(classes[column]), float(probabilities[row, column]))
+        for row, column in enumerate(best)
+    ]
+
+
+def predict_category(description):
+    predictions = predict_categories([description])
+    return predictions[0] if predictions else None
@@ -0,0 +1,105 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+
+from .models import ExpenseCategory, ExpenseGroup, ExpenseVisibility, GroupBalance
+
+
+def _version(queryset):
+    """
+    Return a token for a queryset from its newest updated_at and row count.
+    A delete leaves the newest updated_at as it was, but not the count.
+    """
+    row = queryset.order_by().aggregate(latest=Max('updated_at'), count=Count('pk'))
+    latest = row['latest']
+    return f"{latest.isoformat() if latest else '-'}/{row['count']}"
+
+
+def _combine(*tokens):
+    return ':'.join(tokens)
+
+
+def categories_version(request):
+    """Version of the shared category list"""
+    return _version(ExpenseCategory.objects.all())
+
+
+def groups_version(request):
+    """Version of the groups the user belongs to; membership changes touch updated_at"""
+    return _version(ExpenseGroup.objects.filter(members=request.user))
+
+
+def expenses_version(request):
+    """
+    Version of everything rendered for the user's expenses: their
+    visibility rows plus the groups and categories embedded in them.
+    """
+    return _combine(
+        _version(ExpenseVisibility.objects.filter(user=request.user)),
+        groups_version(request),
+        categories_version(request),
+    )
+
+
+def summary_version(request):
+    """
+    Version of the summary: the user's expenses, the ledger rows behind
+    the owed amount (rewritten whenever a split or share changes), and
+    today's date, as the current month rolls over.
+    """
+    return _combine(
+        expenses_version(request),
+        _version(GroupBalance.objects.filter(creditor=request.user)),
+        timezone.now().date().isoformat(),
+    )
+
+
+def timeseries_version(request):
+    """Version of a spend series; without an end_date its window ends today"""
+    if request.query_params.get('end_date'):
+        return expenses_version(request)
+    return _combine(expenses_version(request), timezone.now().date().isoformat())
+
+
+def conditional_get(version):
+    """
+    Decorate a viewset read action so it answers If-None-Match with 304
+    Not Modified before the action runs.
+
+    version(request) returns a token that changes whenever the action's
+    output could. The strong ETag also covers the user, the full path and
+    the negotiated format. No Last-Modified is sent: the newest updated_at
+    stays put when a row is deleted, so If-Modified-Since would answer
+    304 for a list that has lost rows. The token is left on
+    request.content_version for actions that cache by it.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            token = version(request)
+            request.content_version = token
+            fingerprint = '|'.join([
+                token,
+                str(request.user.pk),
+                request.get_full_path(),
+                request.accepted_renderer.format,
+            ])
+            etag = quote_etag(hashlib.sha256(fingerprint.encode()).hexdigest()[:32])
+
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+
+            response.headers['ETag'] = etag
+            # Let clients cache privately but revalidate on every use
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Authorization'])
+            return response
+        return wrapper
+    return decorator
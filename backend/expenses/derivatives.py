@@ -0,0 +1,63 @@
+"""
+Cached thumbnail and OCR derivatives of stored receipt images.
+
+A derivative lives next to the media it was made from, under
+derivatives/<kind>/, named after the original with .jpg appended.
+Uploaded files never reuse a name, so the name alone says whether a
+derivative is current.
+Reads never render them, and never touch storage: the serializers only
+build the URL. An expense's receipt_image gets its thumbnail when it is
+saved, a receipt gets both derivatives from the OCR worker, and images
+stored before either are covered by the render_thumbnails command.
+"""
+import logging
+
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from .imaging import SPECS, render
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = 'derivatives'
+
+
+def derivative_name(name, kind):
+    # The original's extension stays in the name: receipt.jpg and receipt.png are different files
+    return f'{DERIVATIVES_DIR}/{kind}/{name}.jpg'
+
+
+def derivative_paths(name, kinds):
+    """Filesystem paths of the original and of each {kind: path} derivative"""
+    return default_storage.path(name), {
+        kind: default_storage.path(derivative_name(name, kind)) for kind in kinds
+    }
+
+
+def ensure_derivatives(name, kinds=tuple(SPECS)):
+    """Render whichever derivatives of the stored image are missing; returns {kind: name}"""
+    names = {kind: derivative_name(name, kind) for kind in kinds}
+    missing = [kind for kind, derivative in names.items() if not default_storage.exists(derivative)]
+    if missing:
+        source, targets = derivative_paths(name, missing)
+        render(source, targets)
+    return names
+
+
+def render_derivatives(name, kinds=tuple(SPECS)):
+    """ensure_derivatives that logs rather than raises when the image cannot be read; returns success"""
+    # A corrupt or non-image upload (UnidentifiedImageError is an OSError) just has no derivative
+    try:
+        ensure_derivatives(name, kinds)
+    except (OSError, Image.DecompressionBombError) as error:
+        logger.warning('Could not render the derivatives of %s: %s', name, error)
+        return False
+    return True
+
+
+def derivative_url(name, kind, request=None):
+    """URL a derivative of the stored image is served at, or None without an image"""
+    if not name:
+        return None
+    url = default_storage.url(derivative_name(name, kind))
+    return request.build_absolute_uri(url) if request is not None else url
@@ -0,0 +1,231 @@
+"""
+Category detection pipeline shared by the detect endpoints and the
+background categorization worker.
+
+Tiers, cheapest first: the category the user filed the same description
+under before, the locally trained model when it is confident, the
+detection cache, the keyword index (batches only), and finally
+Ollama, falling back to keywords whenever Ollama cannot answer.
+"""
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .categorization import keyword_category, match_keywords
+from .category_mappings import learned_categories
+from .category_model import predict_categories
+from .detection_cache import detection_cache, detection_key
+from .ollama import OllamaError, get_client as get_ollama_client
+
+logger = logging.getLogger(__name__)
+
+# Part of the detection cache key with settings.OLLAMA_MODEL: a new prompt must not reuse old answers
+CATEGORY_PROMPT_VERSION = 1
+
+VALID_CATEGORIES = [
+    'Food', 'Entertainment', 'Transport', 'Shopping',
+    'Bills', 'Healthcare', 'Education', 'Travel', 'Home', 'Other'
+]
+
+# Only the local model yields a probability; the other sources report a fixed confidence
+SOURCE_CONFIDENCE = {
+    'history': 0.99,
+    'llm': 0.95,
+    'cache': 0.95,
+    'keywords': 0.6,
+    'fallback': 0.6,
+}
+DETECTION_REASONS = {
+    'history': "You filed this description under '{category}' before",
+    'model': "Local model detected '{category}'",
+    'llm': "AI detected '{category}' using Ollama LLM",
+    'cache': "AI detected '{category}' using Ollama LLM (cached)",
+    'keywords': "Keywords matched '{category}'",
+    'fallback': "Ollama unavailable; keywords matched '{category}'",
+}
+
+Detection = namedtuple('Detection', ['category', 'source', 'confidence', 'seconds'])
+
+
+def cache_key(description):
+    return detection_key(description, settings.OLLAMA_MODEL, CATEGORY_PROMPT_VERSION)
+
+
+def build_prompt(description):
+    # Biased to map groceries → Food. Bump CATEGORY_PROMPT_VERSION when
+    # changing it so cached answers are not reused.
+    return f"""
+        Classify the expense description into ONE of:
+        Food, Entertainment, Transport, Shopping, Bills, Healthcare, Education, Travel, Home, Other.
+
+        Rules:
+        - Return ONLY the category name.
+        - Groceries (milk, curd/yogurt, paneer, bread, butter, cheese, vegetables, fruits, banana, apple, eggs, rice, wheat/flour/atta, dal/lentils/pulses, oil, spices, sugar, tea, coffee, grocery/supermarket/kirana) => Food.
+        - Restaurant, meal, delivery, cafe, snack => Food.
+        - If unsure between Food and Shopping, choose Food.
+
+        Description: "{description}"
+        Category:
+        """
+
+
+def category_from_llm(description, answer):
+    """Map the model's raw answer onto a valid category"""
+    category = answer.replace('"', '').replace("'", "").strip()
+
+    # Keyword hinting: prefer deterministic mapping for groceries → Food
+    match = match_keywords(description)
+    hint = match.category if match and match.rule == 'groceries' else None
+
+    # Find exact match first
+    if category in VALID_CATEGORIES:
+        if hint and category != hint:
+            return hint
+        return category
+
+    # Try to find partial matches
+    for valid_cat in VALID_CATEGORIES:
+        if valid_cat.lower() in category.lower() or category.lower() in valid_cat.lower():
+            return hint or valid_cat
+
+    # Default fallback
+    return hint or 'Other'
+
+
+def ask_llm(description):
+    """Return (category, source) from the cache or Ollama, source being 'cache', 'llm' or 'fallback'"""
+    key = cache_key(description)
+    cached = detection_cache.get(key)
+    if cached is not None:
+        return cached, 'cache'
+
+    try:
+        answer = get_ollama_client().generate(build_prompt(description), options={
+            "temperature": 0.1,  # Low temperature for consistent results
+            "top_p": 0.9
+        })
+    except OllamaError as e:
+        # The client has already logged why
+        logger.info("Category detection fell back to keywords: %s", e)
+        return keyword_category(description), 'fallback'
+
+    category = category_from_llm(description, answer)
+    # Only answers from the model are cached; fallbacks are retried next time
+    detection_cache.set(key, category)
+    return category, 'llm'
+
+
+def _timed_llm(description):
+    started = time.perf_counter()
+    category, source = ask_llm(description)
+    return Detection(category, source, SOURCE_CONFIDENCE[source], time.perf_counter() - started)
+
+
+def detect(description, user=None):
+    """Detect one description, trying the user's history and the local model before Ollama"""
+    started = time.perf_counter()
+    if user is not None:
+        learned = learned_categories(user.pk, [description])
+        if learned:
+            return Detection(
+                learned[description], 'history', SOURCE_CONFIDENCE['history'], time.perf_counter() - started
+            )
+    predictions = predict_categories([description])
+    if predictions:
+        category, probability = predictions[0]
+        if probability >= settings.CATEGORY_MODEL_THRESHOLD:
+            return Detection(category, 'model', probability, time.perf_counter() - started)
+    return _timed_llm(description)
+
+
+def detect_many(descriptions, user=None):
+    """
+    Detect a batch of descriptions. Returns (detections in input order,
+    number of unique descriptions, number sent towards Ollama).
+
+    Descriptions that normalize alike are detected once. Those the user
+    has categorized before are answered from that history; the local model
+    runs one vectorized pass over all of them; the cache and keyword
+    index answer what they can, and only the rest go to Ollama through a
+    thread pool of OLLAMA_MAX_WORKERS.
+    """
+    keys = [cache_key(description) for description in descriptions]
+    unique = {}
+    for key, description in zip(keys, descriptions):
+        unique.setdefault(key, description)
+    results = {}
+
+    if user is not None:
+        started = time.perf_counter()
+        learned = learned_categories(user.pk, unique.values())
+        share = (time.perf_counter() - started) / len(unique)
+        for key, description in unique.items():
+            if description in learned:
+                results[key] = Detection(learned[description], 'history', SOURCE_CONFIDENCE['history'], share)
+
+    remaining = {key: description for key, description in unique.items() if key not in results}
+    started = time.perf_counter()
+    predictions = predict_categories(list(remaining.values())) if remaining else None
+    if predictions:
+        share = (time.perf_counter() - started) / len(remaining)
+        for key, (category, probability) in zip(list(remaining), predictions):
+            if probability >= settings.CATEGORY_MODEL_THRESHOLD:
+                results[key] = Detection(category, 'model', probability, share)
+
+    pending = []
+    for key, description in unique.items():
+        if key in results:
+            continue
+        started = time.perf_counter()
+        cached = detection_cache.get(key)
+        if cached is not None:
+            results[key] = Detection(
+                cached, 'cache', SOURCE_CONFIDENCE['cache'], time.perf_counter() - started
+            )
+            continue
+        match = match_keywords(description)
+        if match:
+            results[key] = Detection(
+                match.category, 'keywords', SOURCE_CONFIDENCE['keywords'], time.perf_counter() - started
+            )
+        else:
+            pending.append((key, description))
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=settings.OLLAMA_MAX_WORKERS) as pool:
+            detections = pool.map(_timed_llm, [description for _, description in pending])
+            for (key, _), detection in zip(pending, detections):
+                results[key] = detection
+
+    return [results[key] for key in keys], len(unique), len(pending)
+
+
+def detect_known(descriptions, user=None):
+    """
+    Detections for those of the descriptions the cheap tiers can answer:
+    the user's history, the detection cache and the keyword index, never
+    the model or Ollama. Returns a dict keyed by description.
+    """
+    descriptions = set(descriptions)
+    learned = learned_categories(user.pk, descriptions) if user is not None else {}
+    found = {}
+    # Descriptions differing only in digits share a cache key; look each key up once
+    cached_by_key = {}
+    for description in descriptions:
+        if description in learned:
+            found[description] = Detection(learned[description], 'history', SOURCE_CONFIDENCE['history'], 0.0)
+            continue
+        key = cache_key(description)
+        if key not in cached_by_key:
+            cached_by_key[key] = detection_cache.get(key)
+        cached = cached_by_key[key]
+        if cached is not None:
+            found[description] = Detection(cached, 'cache', SOURCE_CONFIDENCE['cache'], 0.0)
+            continue
+        match = match_keywords(description)
+        if match:
+            found[description] = Detection(match.category, 'keywords', SOURCE_CONFIDENCE['keywords'], 0.0)
+    return found
@@ -0,0 +1,120 @@
+"""
+Cache of LLM category detections.
+
+Descriptions like "milk" or "uber" come in thousands of times a day, so
+detections are cached on the normalized description together with the
+model and prompt version that produced them. Changing either starts a
+fresh keyspace. The first tier is a bounded in-process LRU with a TTL;
+an optional second tier in Django's cache lets processes share answers.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+_DIGITS = re.compile(r'\d+')
+_WHITESPACE = re.compile(r'\s+')
+
+DEFAULTS = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 60 * 60 * 24,
+    'SHARED': True,
+}
+
+
+def normalize_description(description):
+    """Case-fold, drop digits and collapse whitespace so trivial variants share a key"""
+    text = _DIGITS.sub(' ', description.casefold())
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def detection_key(description, model, prompt_version):
+    return f'{model}:{prompt_version}:{normalize_description(description)}'
+
+
+class DetectionCache:
+    """Thread-safe LRU with per-entry expiry, backed by an optional shared Django cache tier"""
+    shared_prefix = 'expenses:detection:'
+
+    def __init__(self, max_entries, ttl, shared=False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ['hits', 'shared_hits', 'misses', 'evictions', 'expirations'], 0
+        )
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return value
+                del self._entries[key]
+                self._stats['expirations'] += 1
+
+        value = cache.get(self._shared_key(key)) if self.shared else None
+        if value is None:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+
+        # Promote the shared answer; it may outlive the shared copy by up to one TTL
+        self._store(key, value)
+        with self._lock:
+            self._stats['shared_hits'] += 1
+        return value
+
+    def set(self, key, value):
+        self._store(key, value)
+        if self.shared:
+            cache.set(self._shared_key(key), value, timeout=self.ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared:
+            cache.delete(self._shared_key(key))
+
+    def _shared_key(self, key):
+        # Descriptions hold spaces and arbitrary characters; hash them into a portable cache key
+        return self.shared_prefix + hashlib.sha256(key.encode()).hexdigest()
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        """Empty the local tier and zero the counters; the shared tier expires on its own"""
+        with self._lock:
+            self._entries.clear()
+            self._stats = dict.fromkeys(self._stats, 0)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries), max_entries=self.max_entries)
+        lookups = stats['hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits'] + stats['shared_hits']) / lookups if lookups else None
+        return stats
+
+
+def _build():
+    options = {**DEFAULTS, **getattr(settings, 'CATEGORY_DETECTION_CACHE', {})}
+    return DetectionCache(options['MAX_ENTRIES'], options['TTL'], shared=options['SHARED'])
+
+
+detection_cache = _build()
@@ -0,0 +1,65 @@
+"""
+Downscaled derivatives of receipt photos.
+
+Phone photos are 4-8 MB; list views only need a thumbnail and OCR reads
+no better beyond about 1600 px. render decodes the original once and
+writes every requested derivative from it. For JPEG sources, draft()
+asks libjpeg to decode at 1/2, 1/4 or 1/8 scale, so a 12 MP photo is
+never fully decompressed. Plain Pillow, no Django, so the OCR pool
+processes can call it too.
+"""
+import os
+from collections import namedtuple
+
+from PIL import Image, ImageOps
+
+Spec = namedtuple('Spec', ['max_side', 'mode', 'quality'])
+
+SPECS = {
+    'thumbnail': Spec(max_side=320, mode='RGB', quality=80),
+    # Grayscale keeps the text and drops two thirds of the bytes OCR has to read
+    'ocr': Spec(max_side=1600, mode='L', quality=90),
+}
+
+
+def render(source, targets):
+    """Write each {kind: path} in targets from the image at source, as JPEG"""
+    largest = max(SPECS[kind].max_side for kind in targets)
+    with Image.open(source) as original:
+        # draft() only scales while both sides stay at or above the requested size
+        ratio = min(1, largest / max(original.size))
+        original.draft('RGB', (round(original.width * ratio), round(original.height * ratio)))
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        # Largest first, so every smaller derivative shrinks the previous one
+        for kind in sorted(targets, key=lambda kind: SPECS[kind].max_side, reverse=True):
+            spec = SPECS[kind]
+            image.thumbnail((spec.max_side, spec.max_side), Image.LANCZOS)
+            _save(image.convert(spec.mode), targets[kind], spec.quality)
+
+
+def _save(image, path, quality):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename, so a concurrent reader never sees half a file
+    partial = f'{path}.{os.getpid()}.partial'
+    image.save(partial, 'JPEG', quality=quality, optimize=True)
+    os.replace(partial, path)
+
+
+def dhash(source):
+    """
+    64-bit difference hash: each bit says whether a pixel of the 9x8
+    grayscale thumbnail is brighter than its right neighbour. Re-saved,
+    rescaled or recompressed copies of a photo land within a few bits.
+    """
+    with Image.open(source) as original:
+        ratio = min(1, 64 / max(original.size))
+        original.draft('L', (round(original.width * ratio), round(original.height * ratio)))
+        image = ImageOps.exif_transpose(original).convert('L').resize((9, 8), Image.LANCZOS)
+    pixels = image.tobytes()
+    bits = 0
+    for row in range(8):
+        for column in range(8):
+            bits = bits << 1 | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return bits
@@ -0,0 +1,58 @@
+"""
+Claiming and releasing rows of the database-backed job queues.
+
+A job model has status, attempts, last_error, claim_token, claimed_at
+and updated_at fields. Workers claim a batch by stamping a token on it;
+a claim older than CLAIM_LEASE is assumed lost with its worker and can
+be taken over. Finished jobs are deleted by the worker, failed passes
+go back to pending until MAX_ATTEMPTS is reached.
+"""
+import uuid
+from datetime import timedelta
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+CLAIM_LEASE = timedelta(minutes=5)
+MAX_ATTEMPTS = 3
+
+
+def claim_jobs(model, batch_size):
+    """
+    Claim up to batch_size pending or lapsed jobs, oldest first, and
+    return their token. The UPDATE re-checks the claimable condition, so
+    two workers racing for the same rows cannot both get them.
+    """
+    now = timezone.now()
+    claimable = Q(status='pending') | Q(status='running', claimed_at__lt=now - CLAIM_LEASE)
+    ids = list(
+        model.objects.filter(claimable)
+        .order_by('created_at', 'id')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    token = uuid.uuid4().hex
+    model.objects.filter(claimable, id__in=ids).update(
+        status='running', claim_token=token, claimed_at=now,
+        attempts=F('attempts') + 1, updated_at=now,
+    )
+    return token
+
+
+def release_jobs(model, attempts_by_id, errors):
+    """
+    Put claimed jobs back in the queue, failing those out of attempts.
+    attempts_by_id maps job ids to their attempt count and errors maps
+    them to what went wrong. Returns how many failed for good.
+    """
+    groups = {}
+    for job_id, attempts in attempts_by_id.items():
+        status = 'failed' if attempts >= MAX_ATTEMPTS else 'pending'
+        groups.setdefault((status, str(errors[job_id])), []).append(job_id)
+
+    now = timezone.now()
+    for (status, error), ids in groups.items():
+        model.objects.filter(id__in=ids).update(
+            status=status, claim_token='', last_error=error, updated_at=now,
+            **({'claimed_at': None} if status == 'pending' else {}),
+        )
+    return sum(len(ids) for (status, _), ids in groups.items() if status == 'failed')
@@ -0,0 +1,125 @@
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+
+from .models import Expense, ExpenseSplit, GroupBalance
+from .visibility import chunked, group_members
+
+CENT = Decimal('0.01')
+
+
+def expense_obligations(expense_ids):
+    """
+    Who owes whom for the given group expenses, as {(group_id, debtor_id,
+    creditor_id): amount}.
+
+    Expenses with ExpenseSplit rows use their unpaid splits. Other expenses
+    marked is_split are shared equally between the payer and the rest of
+    the group, as the dashboard has always assumed.
+    """
+    obligations = defaultdict(Decimal)
+    for chunk in chunked(expense_ids):
+        _add_obligations(obligations, chunk)
+    return obligations
+
+
+def _add_obligations(obligations, expense_ids):
+    expenses = list(
+        Expense.objects.filter(id__in=expense_ids, group__isnull=False).values_list(
+            'id', 'group_id', 'paid_by_id', 'amount', 'is_split'
+        )
+    )
+    splits = defaultdict(list)
+    for expense_id, user_id, amount, is_paid in ExpenseSplit.objects.filter(
+        expense_id__in=[row[0] for row in expenses]
+    ).values_list('expense_id', 'user_id', 'amount', 'is_paid'):
+        splits[expense_id].append((user_id, amount, is_paid))
+    members = group_members({row[1] for row in expenses if row[4] and row[0] not in splits})
+
+    for expense_id, group_id, paid_by_id, amount, is_split in expenses:
+        if expense_id in splits:
+            for user_id, share, is_paid in splits[expense_id]:
+                if user_id != paid_by_id and not is_paid:
+                    obligations[(group_id, user_id, paid_by_id)] += share
+        elif is_split:
+            others = members.get(group_id, set()) - {paid_by_id}
+            if others:
+                share = (amount / (len(others) + 1)).quantize(CENT, rounding=ROUND_HALF_UP)
+                for user_id in others:
+                    obligations[(group_id, user_id, paid_by_id)] += share
+
+
+def group_obligations(group_ids):
+    return expense_obligations(
+        Expense.objects.filter(group_id__in=list(group_ids)).values_list('id', flat=True)
+    )
+
+
+def subtract(after, before):
+    deltas = defaultdict(Decimal, after)
+    for key, amount in before.items():
+        deltas[key] -= amount
+    return deltas
+
+
+def apply_balance_deltas(deltas):
+    """
+    Net the deltas into the ledger. Each member pair keeps at most one row,
+    pointing from whoever owes to whoever is owed. Returns the ids of the
+    users whose balances moved.
+    """
+    # Fold both directions of a pair into one signed amount owed by the lower id
+    pairs = defaultdict(Decimal)
+    for (group_id, debtor_id, creditor_id), amount in deltas.items():
+        if debtor_id == creditor_id or not amount:
+            continue
+        if debtor_id < creditor_id:
+            pairs[(group_id, debtor_id, creditor_id)] += amount
+        else:
+            pairs[(group_id, creditor_id, debtor_id)] -= amount
+    pairs = {pair: amount for pair, amount in pairs.items() if amount}
+    if not pairs:
+        return set()
+
+    users = {user_id for _, low, high in pairs for user_id in (low, high)}
+    with transaction.atomic():
+        existing = GroupBalance.objects.filter(
+            group_id__in={group_id for group_id, _, _ in pairs},
+            debtor_id__in=users,
+            creditor_id__in=users,
+        ).values_list('id', 'group_id', 'debtor_id', 'creditor_id', 'amount')
+
+        current = defaultdict(Decimal)
+        row_ids = defaultdict(list)
+        for row_id, group_id, debtor_id, creditor_id, amount in existing:
+            if debtor_id < creditor_id:
+                pair, signed = (group_id, debtor_id, creditor_id), amount
+            else:
+                pair, signed = (group_id, creditor_id, debtor_id), -amount
+            if pair in pairs:
+                current[pair] += signed
+                row_ids[pair].append(row_id)
+
+        stale, balances = [], []
+        for pair, delta in pairs.items():
+            group_id, low, high = pair
+            net = current[pair] + delta
+            stale.extend(row_ids[pair])
+            if net > 0:
+                balances.append(GroupBalance(group_id=group_id, debtor_id=low, creditor_id=high, amount=net))
+            elif net < 0:
+                balances.append(GroupBalance(group_id=group_id, debtor_id=high, creditor_id=low, amount=-net))
+
+        GroupBalance.objects.filter(id__in=stale).delete()
+        GroupBalance.objects.bulk_create(balances)
+    return users
+
+
+def rebuild_balances():
+    """Replace the whole ledger with balances recomputed from every group expense"""
+    with transaction.atomic():
+        GroupBalance.objects.all().delete()
+        apply_balance_deltas(
+            expense_obligations(Expense.objects.filter(group__isnull=False).values_list('id', flat=True))
+        )
@@ -0,0 +1,77 @@
+"""Shared helpers for the bench_* management commands (not a command itself)."""
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from expenses.models import Expense, ExpenseCategory, ExpenseGroup
+from expenses.visibility import refresh_visibility
+
+User = get_user_model()
+
+
+@contextmanager
+def scratch_database():
+    """Run the body against a throwaway test database instead of the real one"""
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def make_users(count, prefix='bench'):
+    users = User.objects.bulk_create([
+        User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com',
+             first_name=f'User{i}', last_name='Bench')
+        for i in range(count)
+    ])
+    return list(User.objects.filter(username__startswith=prefix).order_by('id')[:len(users)])
+
+
+def seed_expenses(user, rows, members=5, groups=3):
+    """Create rows expenses for user spread over a few shared groups and categories"""
+    others = make_users(members, prefix=f'member{user.pk}_')
+    categories = [
+        ExpenseCategory.objects.get_or_create(name=name)[0]
+        for name in ['Food', 'Transport', 'Shopping', 'Bills', 'Other']
+    ]
+    expense_groups = []
+    for i in range(groups):
+        group = ExpenseGroup.objects.create(name=f'Group {i}', created_by=user)
+        group.members.add(user, *others)
+        expense_groups.append(group)
+
+    start = date.today()
+    expenses = Expense.objects.bulk_create([
+        Expense(
+            description=f'Expense {i}',
+            amount=10 + i % 500,
+            date=start - timedelta(days=i % 1500),
+            category=categories[i % len(categories)],
+            group=expense_groups[i % len(expense_groups)] if i % 2 else None,
+            paid_by=user,
+            created_by=user,
+        )
+        for i in range(rows)
+    ], batch_size=500)
+    refresh_visibility([expense.pk for expense in expenses])
+    return expenses
+
+
+def measure(func, repeat):
+    """Return (best seconds, query count, result) over repeat runs of func"""
+    best = None
+    for _ in range(repeat):
+        # Seeding can fill the bounded query log, which breaks the capture count
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(queries.captured_queries), result
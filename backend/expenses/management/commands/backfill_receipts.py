@@ -0,0 +1,51 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from expenses.ocr import init_worker
+from expenses.receipt_backfill import backfill_chunk, checkpoint, pending_chunks, reset_checkpoint
+
+
+class Command(BaseCommand):
+    help = 'Read receipts stored before OCR existed, resuming from the last committed chunk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='OCR processes, each loading the engine once; defaults to the CPU count')
+        parser.add_argument('--chunk-size', type=int, default=256,
+                            help='Receipts fetched, read and committed together')
+        parser.add_argument('--restart', action='store_true',
+                            help='Forget the checkpoint and start again from the first receipt')
+
+    def handle(self, *args, **options):
+        if options['restart']:
+            reset_checkpoint()
+        after = checkpoint()
+        if after:
+            self.stdout.write(f'Resuming after receipt {after}')
+
+        totals = {'read': 0, 'queued': 0}
+        engine = (settings.RECEIPT_OCR_ENGINE, tuple(settings.RECEIPT_OCR_LANGUAGES))
+        started = time.perf_counter()
+        with ProcessPoolExecutor(options['workers'], initializer=init_worker, initargs=engine) as pool:
+            for rows in pending_chunks(after, options['chunk_size']):
+                chunk_started = time.perf_counter()
+                stats = backfill_chunk(pool, rows)
+                for name, value in stats.items():
+                    totals[name] += value
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"Read {stats['read']} receipts up to {rows[-1][0]} "
+                    f"at {len(rows) / (time.perf_counter() - chunk_started):.1f}/s "
+                    f"({totals['read']} so far, {sum(totals.values()) / elapsed:.1f}/s overall)"
+                )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {totals['read']} receipts read in {elapsed:.1f}s "
+            f"({sum(totals.values()) / elapsed if elapsed else 0:.1f}/s), "
+            f"{totals['queued']} queued for a retry"
+        ))
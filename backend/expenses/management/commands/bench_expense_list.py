@@ -0,0 +1,76 @@
+import io
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from expenses.models import Expense
+from expenses.serializers import ExpenseListSerializer, ExpenseSerializer
+from expenses.visibility import visible_expenses
+
+from ._benchmark import make_users, measure, scratch_database, seed_expenses
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the lean expense list projection against ExpenseSerializer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500, help='Expenses in the listed page')
+        parser.add_argument('--members', type=int, default=5, help='Members per shared group')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per variant; the best is reported')
+        parser.add_argument('--receipts', type=int, default=50,
+                            help='Listed expenses carrying a receipt image with no thumbnail rendered yet')
+
+    def handle(self, *args, **options):
+        with scratch_database(), tempfile.TemporaryDirectory() as media, override_settings(
+                MEDIA_ROOT=media, ALLOWED_HOSTS=['testserver']):
+            user = make_users(1)[0]
+            expenses = seed_expenses(user, options['rows'], members=options['members'])
+            self.attach_receipts(expenses[:options['receipts']])
+            self.run(user, options['rows'], options['repeat'])
+
+    def attach_receipts(self, expenses):
+        """Store a 3000x4000 photo per expense, the way images attached before thumbnails existed look"""
+        buffer = io.BytesIO()
+        Image.new('RGB', (3000, 4000), 'white').save(buffer, 'JPEG', quality=90)
+        for expense in expenses:
+            expense.receipt_image = default_storage.save('receipts/photo.jpg', ContentFile(buffer.getvalue()))
+        Expense.objects.bulk_update(expenses, ['receipt_image'])
+
+    def run(self, user, rows, repeat):
+        factory = APIRequestFactory()
+        variants = [
+            ('ExpenseSerializer', '', self.full),
+            ('ExpenseListSerializer', '', self.lean),
+            ('ExpenseListSerializer', 'expand=category,group,paid_by', self.lean),
+            ('ExpenseListSerializer', 'fields=id,amount,date,category', self.lean),
+        ]
+        for name, query, render in variants:
+            request = Request(factory.get(f'/api/expenses/expenses/?{query}'))
+            request.user = user
+            queryset = visible_expenses(user).select_related(
+                'category', 'group', 'paid_by', 'created_by'
+            ).order_by('-visible_date', '-visible_created_at', 'visible_id')[:rows]
+
+            # The first run is reported apart: rendering on read would show up there only
+            first, _, _ = measure(lambda: render(queryset, request), 1)
+            seconds, queries, data = measure(lambda: render(queryset, request), repeat)
+            payload = len(JSONRenderer().render(data))
+            label = f'{name} {query}'.strip()
+            self.stdout.write(
+                f'{label:<58} first {first * 1000:9.1f} ms  best {seconds * 1000:9.1f} ms '
+                f'{queries:6d} queries {payload / 1024:9.1f} KiB'
+            )
+
+    def full(self, queryset, request):
+        return ExpenseSerializer(queryset, many=True, context={'request': request}).data
+
+    def lean(self, queryset, request):
+        serializer = ExpenseListSerializer(context={'request': request})
+        return [serializer.to_representation(row) for row in serializer.values(queryset)]
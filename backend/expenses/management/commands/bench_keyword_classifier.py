@@ -0,0 +1,83 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from expenses.categorization import KEYWORD_TABLE, keyword_category
+
+
+def legacy_fallback(description):
+    """The substring-scan fallback the compiled classifier replaced, kept verbatim for comparison"""
+    description_lower = description.lower()
+
+    grocery_words = ['milk', 'curd', 'yogurt', 'paneer', 'butter', 'cheese', 'bread', 'vegetable', 'veggies', 'fruit', 'banana', 'apple', 'egg', 'eggs', 'rice', 'wheat', 'atta', 'flour', 'dal', 'lentil', 'lentils', 'pulse', 'pulses', 'oil', 'spice', 'spices', 'sugar', 'salt', 'tea', 'coffee', 'grocery', 'supermarket', 'kirana']
+    if any(word in description_lower for word in grocery_words):
+        return 'Food'
+
+    if any(word in description_lower for word in ['food', 'restaurant', 'dinner', 'lunch', 'breakfast', 'grocery', 'pizza', 'burger', 'coffee', 'tea', 'snack', 'meal', 'cafe', 'bakery', 'sweets', 'chocolate', 'ice cream', 'juice', 'water']):
+        return 'Food'
+    elif any(word in description_lower for word in ['movie', 'cinema', 'theatre', 'game', 'concert', 'party', 'show', 'ticket', 'entertainment', 'fun', 'amusement', 'park', 'museum', 'exhibition', 'festival', 'event', 'booking', 'reservation']):
+        return 'Entertainment'
+    elif any(word in description_lower for word in ['uber', 'taxi', 'cab', 'fuel', 'gas', 'parking', 'bus', 'train', 'metro', 'subway', 'flight', 'airplane', 'car', 'bike', 'scooter', 'maintenance', 'repair', 'insurance', 'toll', 'fare']):
+        return 'Transport'
+    elif any(word in description_lower for word in ['shirt', 'shoes', 'dress', 'clothes', 'fashion', 'shopping', 'store', 'mall', 'market', 'shop', 'buy', 'purchase', 'retail', 'electronics', 'phone', 'laptop', 'accessories', 'jewelry']):
+        return 'Shopping'
+    elif any(word in description_lower for word in ['electricity', 'water', 'internet', 'rent', 'bill', 'utility', 'phone', 'mobile', 'subscription', 'service', 'maintenance', 'insurance', 'tax', 'fees', 'charges']):
+        return 'Bills'
+    elif any(word in description_lower for word in ['medicine', 'doctor', 'hospital', 'pharmacy', 'medical', 'health', 'dental', 'eye', 'vision', 'therapy', 'treatment', 'consultation', 'prescription', 'vitamins', 'supplements']):
+        return 'Healthcare'
+    elif any(word in description_lower for word in ['course', 'book', 'training', 'workshop', 'education', 'school', 'college', 'university', 'class', 'lesson', 'tutorial']):
+        return 'Education'
+    elif any(word in description_lower for word in ['hotel', 'vacation', 'tourism', 'travel', 'trip', 'journey', 'flight', 'accommodation', 'resort', 'lodging']):
+        return 'Travel'
+    elif any(word in description_lower for word in ['furniture', 'repair', 'maintenance', 'household', 'home', 'kitchen', 'bathroom', 'bedroom', 'living room', 'garden', 'yard']):
+        return 'Home'
+    else:
+        return 'Other'
+
+
+FILLER = [
+    'payment', 'to', 'for', 'at', 'from', 'weekly', 'monthly', 'order', 'upi', 'ref', 'with',
+    'friends', 'family', 'office', 'sharma', 'store', 'online', 'cash', 'card', 'transfer',
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the compiled keyword classifier against the legacy substring scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--descriptions', type=int, default=20000, help='Descriptions to classify')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per classifier; the best is reported')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        keywords = [keyword for _, _, words in KEYWORD_TABLE for keyword in words]
+        descriptions = []
+        for _ in range(options['descriptions']):
+            words = rng.sample(FILLER, rng.randint(1, 5))
+            # A fifth of the descriptions match no keyword and fall through every rule
+            if rng.random() > 0.2:
+                words.insert(rng.randrange(len(words) + 1), rng.choice(keywords))
+            descriptions.append(' '.join(words).title())
+
+        timings = {}
+        for name, classify in (('legacy any() scans', legacy_fallback), ('compiled index', keyword_category)):
+            best = None
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                results = [classify(description) for description in descriptions]
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = (best, results)
+            per_call = best / len(descriptions) * 1e6
+            self.stdout.write(f'{name:<20} {best * 1000:9.1f} ms {per_call:7.2f} us/description')
+
+        legacy, compiled = timings['legacy any() scans'], timings['compiled index']
+        agree = sum(a == b for a, b in zip(legacy[1], compiled[1]))
+        self.stdout.write(f'speedup {legacy[0] / compiled[0]:.1f}x, '
+                          f'{agree}/{len(descriptions)} descriptions classified the same')
+        # Differences come from whole-word matching, e.g. "Store" no longer matching "tea"
+        for description, old, new in zip(descriptions, legacy[1], compiled[1]):
+            if old != new:
+                self.stdout.write(f'  {description!r}: {old} -> {new}')
+                break
@@ -0,0 +1,91 @@
+import io
+import multiprocessing
+import os
+import resource
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.management.base import BaseCommand
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.parsers import MultiPartParser
+from rest_framework.request import Request
+
+from expenses.uploads import ReceiptUploadParser, StreamedImageField
+
+BOUNDARY = 'BenchBoundary'
+
+MODES = {
+    'default': (MultiPartParser, serializers.ImageField),
+    'streaming': (ReceiptUploadParser, StreamedImageField),
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark peak memory of many concurrent receipt uploads, Django defaults against streaming'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uploads', type=int, default=32, help='Concurrent uploads')
+        parser.add_argument(
+            '--size-mb', type=float, nargs='+', default=[2.0, 8.0], help='Upload sizes to try'
+        )
+
+    def handle(self, *args, **options):
+        # Each mode runs in a fresh process, so its peak RSS is its own
+        context = multiprocessing.get_context('fork')
+        with tempfile.TemporaryDirectory() as scratch:
+            for size_mb in options['size_mb']:
+                body = os.path.join(scratch, f'{size_mb}.body')
+                image_bytes = write_body(body, int(size_mb * 1024 * 1024))
+                for mode in MODES:
+                    with context.Pool(1) as pool:
+                        seconds, growth = pool.apply(run, (mode, body, options['uploads']))
+                    self.stdout.write(
+                        f'{mode:<10} {options["uploads"]:3d} x {image_bytes / 1024 / 1024:4.1f} MB '
+                        f'{seconds * 1000:8.1f} ms  peak RSS +{growth / 1024:7.1f} MB'
+                    )
+
+
+def write_body(path, size):
+    """A multipart body holding one incompressible PNG of about size bytes; returns the PNG size"""
+    side = int(size ** 0.5)
+    buffer = io.BytesIO()
+    Image.effect_noise((side, side), 128).save(buffer, 'PNG', compress_level=1)
+    with open(path, 'wb') as body:
+        body.write(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="expense"\r\n\r\n1\r\n'
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="image"; filename="receipt.png"\r\n'
+            f'Content-Type: image/png\r\n\r\n'.encode()
+        )
+        body.write(buffer.getbuffer())
+        body.write(f'\r\n--{BOUNDARY}--\r\n'.encode())
+    return buffer.tell()
+
+
+def run(mode, body, uploads):
+    """Parse and validate uploads copies of body at once; returns (seconds, peak RSS growth in KB)"""
+    parser_class, field_class = MODES[mode]
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Every upload holds its file until all have been validated, as concurrent requests would
+    barrier = threading.Barrier(uploads)
+
+    def upload(_):
+        with open(body, 'rb') as stream:
+            request = Request(WSGIRequest({
+                'REQUEST_METHOD': 'POST',
+                'CONTENT_TYPE': f'multipart/form-data; boundary={BOUNDARY}',
+                'CONTENT_LENGTH': str(os.path.getsize(body)),
+                'wsgi.input': stream,
+            }), parsers=[parser_class()])
+            image = field_class().run_validation(request.data['image'])
+            barrier.wait()
+            image.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(uploads) as executor:
+        list(executor.map(upload, range(uploads)))
+    seconds = time.perf_counter() - started
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
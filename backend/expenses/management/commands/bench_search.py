@@ -0,0 +1,85 @@
+import random
+from datetime import date, timedelta
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+
+from expenses.models import Expense, ExpenseGroup, ExpenseVisibility
+from expenses.search import search_expense_ids
+from expenses.visibility import compute_visibility, index_expenses
+
+from ._benchmark import make_users, measure, scratch_database
+
+WORDS = [
+    'swiggy', 'zomato', 'uber', 'ola', 'metro', 'petrol', 'diesel', 'rent', 'electricity', 'water',
+    'internet', 'mobile', 'recharge', 'netflix', 'spotify', 'movie', 'dinner', 'lunch', 'breakfast',
+    'coffee', 'groceries', 'vegetables', 'milk', 'bread', 'pharmacy', 'doctor', 'gym', 'flight',
+    'train', 'hotel', 'taxi', 'parking', 'toll', 'books', 'stationery', 'shoes', 'shirt', 'gift',
+    'birthday', 'wedding', 'insurance', 'maintenance', 'plumber', 'electrician', 'laundry', 'salon',
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark full-text expense search on a large table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Expenses to seed')
+        parser.add_argument('--users', type=int, default=2000, help='Users, in groups of eight')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query; the best is reported')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            typical, heavy = self.seed(random.Random(0), options['rows'], options['users'])
+            self.stdout.write(f'{Expense.objects.count()} expenses')
+            for user in (typical, heavy):
+                self.run(user, options['repeat'])
+
+    def seed(self, rng, rows, user_count):
+        users = make_users(user_count)
+        groups = []
+        for start in range(0, user_count, 8):
+            group = ExpenseGroup.objects.create(name=f'Group {start}', created_by=users[start])
+            group.members.add(*users[start:start + 8])
+            groups.append(group)
+        # One group sees a tenth of all expenses: the worst case for ranking
+        heavy = ExpenseGroup.objects.create(name='Shared house', created_by=users[0])
+        heavy.members.add(*users[:4])
+
+        today = date.today()
+        for offset in range(0, rows, 10000):
+            expenses = []
+            for i in range(offset, min(offset + 10000, rows)):
+                creator = users[i % user_count] if i % 10 else users[i // 10 % 4]
+                group = heavy if i % 10 == 0 else groups[i % user_count // 8] if i % 3 == 0 else None
+                expenses.append(Expense(
+                    description=' '.join(rng.sample(WORDS, 2)).title(),
+                    notes=' '.join(rng.sample(WORDS, 3)) if i % 4 == 0 else '',
+                    location=rng.choice(['Bengaluru', 'Mumbai', 'Goa', 'Pune']),
+                    amount=10 + i % 500,
+                    date=today - timedelta(days=i % 1500),
+                    group=group,
+                    paid_by=creator,
+                    created_by=creator,
+                ))
+            expenses = Expense.objects.bulk_create(expenses, batch_size=500)
+            # Search only reads the visibility rows and the documents indexed
+            # from them, so the rollups refresh_visibility keeps are skipped
+            ExpenseVisibility.objects.bulk_create(
+                compute_visibility([expense.pk for expense in expenses]).values(), batch_size=500
+            )
+            index_expenses([expense.pk for expense in expenses])
+        return users[user_count // 2], users[0]
+
+    def run(self, user, repeat):
+        visible = ExpenseVisibility.objects.filter(user=user).count()
+        self.stdout.write(f'{user.username}, who can see {visible} of them:')
+        for query in ['dinner', 'uber taxi', 'elec', 'groceries milk bread', 'nothingmatches']:
+            seconds, _, ids = measure(lambda: search_expense_ids(user, query, 20), repeat)
+            self.report(f'  fts5 {query!r}', seconds, len(ids))
+        # The LIKE fallback other databases use, for comparison
+        with mock.patch('expenses.search.connection', mock.Mock(vendor='postgresql')):
+            seconds, _, ids = measure(lambda: search_expense_ids(user, 'dinner', 20), 1)
+        self.report("  like 'dinner'", seconds, len(ids))
+
+    def report(self, label, seconds, results):
+        self.stdout.write(f'{label:<32} {seconds * 1000:9.1f} ms  {results} results')
@@ -0,0 +1,64 @@
+import random
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from expenses.models import ExpenseGroup, GroupBalance
+from expenses.settlement import member_positions, settle
+
+from ._benchmark import make_users, measure, scratch_database
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the settle-up engine on a large group'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=10000, help='Members in the group')
+        parser.add_argument('--balances', type=int, default=20000, help='Ledger rows in the group')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per step; the best is reported')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with scratch_database():
+            group = self.seed(rng, options['members'], options['balances'])
+            self.run(group, options['repeat'])
+
+    def seed(self, rng, members, balances):
+        users = make_users(members)
+        group = ExpenseGroup.objects.create(name='Settle up', created_by=users[0])
+        group.members.add(*users)
+
+        pairs = set()
+        while len(pairs) < min(balances, members * (members - 1) // 2):
+            debtor, creditor = rng.sample(users, 2)
+            if (creditor.pk, debtor.pk) not in pairs:
+                pairs.add((debtor.pk, creditor.pk))
+        GroupBalance.objects.bulk_create([
+            GroupBalance(
+                group=group, debtor_id=debtor_id, creditor_id=creditor_id,
+                amount=Decimal(rng.randint(1, 100000)) / 100,
+            )
+            for debtor_id, creditor_id in pairs
+        ], batch_size=500)
+        return group
+
+    def run(self, group, repeat):
+        seconds, queries, positions = measure(lambda: member_positions(group), repeat)
+        self.report('member_positions', seconds, queries, f'{len(positions)} members')
+
+        seconds, _, transfers = measure(lambda: settle(positions), repeat)
+        self.report('settle', seconds, 0, f'{len(transfers)} transfers')
+
+        # Every member must end at exactly zero
+        remaining = dict(positions)
+        for debtor_id, creditor_id, amount in transfers:
+            remaining[debtor_id] += amount
+            remaining[creditor_id] -= amount
+        unsettled = sum(1 for amount in remaining.values() if amount)
+        if unsettled:
+            self.stderr.write(self.style.ERROR(f'{unsettled} members left unsettled'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All members settled exactly'))
+
+    def report(self, label, seconds, queries, detail):
+        self.stdout.write(f'{label:<20} {seconds * 1000:9.1f} ms {queries:6d} queries  {detail}')
@@ -0,0 +1,66 @@
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from expenses.models import CategorizationJob, Expense
+from expenses.statements import get_profile, import_statement, parse_statement
+
+from ._benchmark import make_users, scratch_database
+
+MERCHANTS = [
+    'SWIGGY', 'ZOMATO', 'UBER INDIA', 'OLA CABS', 'BESCOM', 'AIRTEL', 'JIO RECHARGE', 'NETFLIX',
+    'BIG BAZAAR', 'DMART', 'APOLLO PHARMACY', 'INDIAN OIL PETROL', 'BOOKMYSHOW MOVIE', 'IRCTC TRAIN',
+    'AMAZON', 'FLIPKART', 'SHARMA KIRANA', 'STARBUCKS COFFEE', 'MAKEMYTRIP HOTEL', 'CULT GYM',
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark importing a large CSV bank statement'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000, help='Statement lines to generate')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows saved together')
+
+    def handle(self, *args, **options):
+        profile = get_profile('bank')
+        with tempfile.NamedTemporaryFile('w+', suffix='.csv', newline='') as statement:
+            self.write_statement(statement, random.Random(0), options['rows'])
+
+            statement.seek(0)
+            stats = {'credits': 0, 'invalid': 0}
+            started = time.perf_counter()
+            parsed = sum(1 for _ in parse_statement(statement, profile, stats, []))
+            self.report('parse only', parsed, time.perf_counter() - started)
+
+            # DEBUG logs every query, which a production import does not pay for
+            with scratch_database(), override_settings(DEBUG=False):
+                user, = make_users(1)
+                statement.seek(0)
+                started = time.perf_counter()
+                stats, errors = import_statement(user, statement, profile, chunk_size=options['chunk_size'])
+                self.report('import', stats['imported'], time.perf_counter() - started)
+                self.stdout.write(
+                    f"  {Expense.objects.count()} expenses, {stats['categorized']} categorized on import, "
+                    f"{CategorizationJob.objects.count()} queued, {stats['credits']} credits skipped, "
+                    f"{len(errors)} errors"
+                )
+
+    def write_statement(self, statement, rng, rows):
+        statement.write('Date,Narration,Chq./Ref.No.,Withdrawal,Deposit,Closing Balance\n')
+        day = date.today() - timedelta(days=rows // 100)
+        for i in range(rows):
+            day += timedelta(days=i % 100 == 0)
+            reference = rng.randrange(10 ** 11, 10 ** 12)
+            merchant = rng.choice(MERCHANTS) if rng.random() < 0.8 else f'PAYEE {rng.randrange(5000)}'
+            if i % 10 == 0:
+                line = f'NEFT CR-SALARY {reference},{reference},,"{rng.randrange(1000, 90000)}.00",'
+            else:
+                line = f'UPI/{reference}/{merchant}/PAYMENT,{reference},"{rng.randrange(10, 5000):,}.{i % 100:02}",,'
+            statement.write(f'{day:%d/%m/%y},{line}0.00\n')
+
+    def report(self, label, rows, seconds):
+        self.stdout.write(f'{label:<12} {rows} rows in {seconds:.2f}s  {rows / seconds:10.0f} rows/s')
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from expenses.timeseries import DIMENSIONS, INTERVALS, spending_series
+
+from ._benchmark import make_users, measure, scratch_database, seed_expenses
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the spending time series over a five-year range for a heavy user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help='Expenses visible to the user')
+        parser.add_argument('--years', type=int, default=5, help='Length of the requested range')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per variant; the best is reported')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            user = make_users(1)[0]
+            seed_expenses(user, options['rows'])
+            self.run(user, options['years'], options['repeat'])
+
+    def run(self, user, years, repeat):
+        end = timezone.now().date()
+        start = end - timedelta(days=365 * years)
+        for interval in INTERVALS:
+            for by in (None,) + DIMENSIONS:
+                seconds, queries, data = measure(
+                    lambda: spending_series(user, start, end, interval=interval, by=by), repeat
+                )
+                label = f"{interval} by {by or 'total'}"
+                self.stdout.write(
+                    f"{label:<20} {seconds * 1000:9.1f} ms {queries:6d} queries "
+                    f"{len(data['buckets']):6d} buckets {sum(data['counts']):8d} rows"
+                )
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from expenses.categorization_jobs import process_batch
+
+
+class Command(BaseCommand):
+    help = 'Fill the AI category of newly created expenses from the categorization job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Jobs claimed per pass; repeated descriptions in a pass are detected once')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new jobs instead of exiting once the queue is empty')
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help='Seconds to wait between polls of an empty queue with --loop')
+
+    def handle(self, *args, **options):
+        totals = dict.fromkeys(['claimed', 'categorized', 'unique', 'llm_calls', 'failed'], 0)
+        while True:
+            stats = process_batch(options['batch_size'])
+            for name, value in stats.items():
+                totals[name] += value
+            if stats['claimed']:
+                self.stdout.write(
+                    f"Categorized {stats['categorized']} expenses from {stats['unique']} distinct "
+                    f"descriptions ({stats['llm_calls']} sent to Ollama, {stats['failed']} failed)"
+                )
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {totals['categorized']} expenses categorized, {totals['failed']} jobs failed"
+        ))
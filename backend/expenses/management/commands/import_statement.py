@@ -0,0 +1,63 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses.models import BackfillCheckpoint
+from expenses.statements import (
+    CHUNK_SIZE, StatementError, checkpoint_name, file_digest, get_profile, import_statement, profiles,
+    text_lines,
+)
+
+
+class Command(BaseCommand):
+    help = "Import the spending rows of a CSV bank or card statement as a user's expenses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file exported by the bank or card')
+        parser.add_argument('--user', required=True, help='Username the expenses belong to')
+        parser.add_argument('--profile', default='card', choices=sorted(profiles()),
+                            help='Column mapping of the statement (settings.STATEMENT_PROFILES adds more)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Rows categorized, inserted and committed together')
+        parser.add_argument('--restart', action='store_true',
+                            help='Forget an earlier import of this file and import all of it again')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named '{options['user']}'")
+
+        started = time.perf_counter()
+
+        def progress(stats):
+            self.stdout.write(
+                f"Imported {stats['imported']} rows "
+                f"({stats['imported'] / (time.perf_counter() - started):.0f}/s)"
+            )
+
+        try:
+            profile = get_profile(options['profile'])
+            with open(options['path'], 'rb') as statement:
+                checkpoint = checkpoint_name(user, file_digest(statement))
+                if options['restart']:
+                    BackfillCheckpoint.objects.filter(name=checkpoint).delete()
+                stats, errors = import_statement(
+                    user, text_lines(statement), profile, options['chunk_size'], progress, checkpoint
+                )
+        except StatementError as error:
+            raise CommandError(str(error))
+        if stats['resumed_after']:
+            self.stdout.write(f"Resumed after line {stats['resumed_after']}, committed by an earlier run")
+
+        for error in errors:
+            self.stderr.write(f"Line {error['line']}: {error['error']}")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {stats['imported']} expenses in {elapsed:.1f}s "
+            f"({stats['imported'] / elapsed if elapsed else 0:.0f}/s), "
+            f"{stats['categorized']} categorized, {stats['queued']} queued for the categorization worker, "
+            f"{stats['credits']} credits and {stats['invalid']} invalid rows skipped"
+        ))
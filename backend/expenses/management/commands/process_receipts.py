@@ -0,0 +1,49 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from expenses.ocr import init_worker
+from expenses.receipt_jobs import process_batch
+
+
+class Command(BaseCommand):
+    help = 'Read queued receipt images with OCR in a process pool and store the extracted fields'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='OCR processes, each loading the engine once; defaults to the CPU count')
+        parser.add_argument('--batch-size', type=int, default=64,
+                            help='Jobs claimed per pass; a few per worker keeps every process busy')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new jobs instead of exiting once the queue is empty')
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help='Seconds to wait between polls of an empty queue with --loop')
+
+    def handle(self, *args, **options):
+        totals = dict.fromkeys(['claimed', 'read', 'reused', 'retried', 'failed'], 0)
+        engine = (settings.RECEIPT_OCR_ENGINE, tuple(settings.RECEIPT_OCR_LANGUAGES))
+        # The pool outlives every pass, so each process loads the engine only once
+        with ProcessPoolExecutor(options['workers'], initializer=init_worker, initargs=engine) as pool:
+            while True:
+                started = time.perf_counter()
+                stats = process_batch(pool, options['batch_size'])
+                for name, value in stats.items():
+                    totals[name] += value
+                if stats['claimed']:
+                    self.stdout.write(
+                        f"Read {stats['read']} receipts in {time.perf_counter() - started:.1f}s "
+                        f"({stats['reused']} from duplicates, {stats['retried']} to retry, "
+                        f"{stats['failed']} failed)"
+                    )
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {totals['read']} receipts read ({totals['reused']} from duplicates), "
+            f"{totals['failed']} jobs failed"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from expenses.category_mappings import rebuild_mappings
+
+
+class Command(BaseCommand):
+    help = "Recompute each user's learned description to category mappings from their expense history"
+
+    def handle(self, *args, **options):
+        count = rebuild_mappings()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt category mappings: {count} rows'))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses.rollups import expected_rollups, rebuild_rollups, stored_rollups
+from expenses.visibility import rebuild_visibility
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly expense rollups from scratch and check them against aggregates over the expenses'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only compare the stored rollups with aggregates over the expenses; do not rebuild'
+        )
+        parser.add_argument(
+            '--with-visibility', action='store_true',
+            help='Rebuild the per-user visibility table first'
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            if options['with_visibility']:
+                rebuild_visibility()
+                self.stdout.write(self.style.SUCCESS('Rebuilt expense visibility'))
+            rebuild_rollups()
+            self.stdout.write(self.style.SUCCESS('Rebuilt monthly rollups'))
+
+        stored = stored_rollups()
+        expected = expected_rollups()
+        mismatches = 0
+        for key in sorted(set(stored) | set(expected), key=str):
+            if stored.get(key) != expected.get(key):
+                mismatches += 1
+                user_id, month, category_id = key
+                self.stdout.write(self.style.WARNING(
+                    f'user={user_id} month={month} category={category_id}: '
+                    f'stored={stored.get(key)} expected={expected.get(key)}'
+                ))
+
+        if mismatches:
+            raise CommandError(f'{mismatches} rollup rows differ from the expenses')
+        self.stdout.write(self.style.SUCCESS(f'All {len(stored)} rollup rows match the expenses'))
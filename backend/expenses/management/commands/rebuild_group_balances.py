@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from expenses.ledger import rebuild_balances
+from expenses.models import GroupBalance
+
+
+class Command(BaseCommand):
+    help = 'Recompute the group balance ledger from all group expenses and splits'
+
+    def handle(self, *args, **options):
+        rebuild_balances()
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt group balances: {GroupBalance.objects.count()} rows')
+        )
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from expenses.derivatives import render_derivatives
+from expenses.models import Expense, ExpenseReceipt
+
+
+class Command(BaseCommand):
+    help = 'Render the missing thumbnails of receipt images stored before thumbnails were rendered on save'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Image names fetched per query')
+
+    def handle(self, *args, **options):
+        names = [
+            Expense.objects.exclude(receipt_image__isnull=True).exclude(receipt_image='').values_list('receipt_image', flat=True),
+            ExpenseReceipt.objects.values_list('image', flat=True),
+        ]
+        started = time.perf_counter()
+        seen = failed = 0
+        for queryset in names:
+            for name in queryset.order_by('pk').iterator(chunk_size=options['chunk_size']):
+                seen += 1
+                # Existing thumbnails are skipped, so a rerun only renders what is still missing
+                if not render_derivatives(name, ['thumbnail']):
+                    failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {seen} images in {time.perf_counter() - started:.1f}s, {failed} could not be read'
+        ))
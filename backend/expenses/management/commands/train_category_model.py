@@ -0,0 +1,70 @@
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from expenses.category_model import build_pipeline, save_model
+from expenses.models import Expense
+
+
+class Command(BaseCommand):
+    help = 'Train the local category classifier on categorized expenses and save it to disk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--holdout', type=float, default=0.2,
+                            help='Share of rows held out to report accuracy; 0 trains on everything')
+        parser.add_argument('--min-samples', type=int, default=5,
+                            help='Categories with fewer examples are left out')
+        parser.add_argument('--output', default=None, help='Defaults to settings.CATEGORY_MODEL_PATH')
+
+    def handle(self, *args, **options):
+        rows = list(
+            Expense.objects.filter(category__isnull=False)
+            .exclude(description='')
+            .values_list('description', 'category__name')
+        )
+        counts = Counter(label for _, label in rows)
+        kept = {label for label, count in counts.items() if count >= options['min_samples']}
+        rows = [(description, label) for description, label in rows if label in kept]
+        if len(kept) < 2:
+            raise CommandError(
+                f'Need at least two categories with {options["min_samples"]} or more expenses; '
+                f'found {len(kept)}'
+            )
+        descriptions = [description for description, _ in rows]
+        labels = [label for _, label in rows]
+        self.stdout.write(f'Training on {len(rows)} expenses in {len(kept)} categories')
+
+        if options['holdout']:
+            self.report_holdout(descriptions, labels, options['holdout'])
+
+        started = time.perf_counter()
+        pipeline = build_pipeline().fit(descriptions, labels)
+        path = options['output'] or settings.CATEGORY_MODEL_PATH
+        save_model(
+            pipeline, path,
+            trained_at=timezone.now().isoformat(),
+            samples=len(rows),
+            categories=sorted(kept),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Saved model to {path} in {time.perf_counter() - started:.1f}s'
+        ))
+
+    def report_holdout(self, descriptions, labels, holdout):
+        from sklearn.model_selection import train_test_split
+
+        train_x, test_x, train_y, test_y = train_test_split(
+            descriptions, labels, test_size=holdout, random_state=0, stratify=labels
+        )
+        pipeline = build_pipeline().fit(train_x, train_y)
+        probabilities = pipeline.predict_proba(test_x)
+        correct = pipeline.classes_[probabilities.argmax(axis=1)] == test_y
+        confident = probabilities.max(axis=1) >= settings.CATEGORY_MODEL_THRESHOLD
+        confident_accuracy = correct[confident].mean() if confident.any() else 0.0
+        self.stdout.write(
+            f'Holdout accuracy {correct.mean():.1%}; {confident.mean():.1%} of rows clear the '
+            f'{settings.CATEGORY_MODEL_THRESHOLD} threshold at {confident_accuracy:.1%} accuracy'
+        )
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["-date", "-created_at", "id"],
+                name="expenses_ex_date_1e3d64_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_visibility(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    ExpenseGroup = apps.get_model("expenses", "ExpenseGroup")
+    ExpenseVisibility = apps.get_model("expenses", "ExpenseVisibility")
+
+    members = {}
+    for group_id, user_id in ExpenseGroup.members.through.objects.values_list(
+        "expensegroup_id", "customuser_id"
+    ):
+        members.setdefault(group_id, set()).add(user_id)
+
+    rows = []
+    for expense_id, created_by_id, paid_by_id, group_id, date, created_at in (
+        Expense.objects.values_list(
+            "id", "created_by_id", "paid_by_id", "group_id", "date", "created_at"
+        ).iterator()
+    ):
+        for user_id in {created_by_id, paid_by_id} | members.get(group_id, set()):
+            rows.append(
+                ExpenseVisibility(
+                    user_id=user_id,
+                    expense_id=expense_id,
+                    date=date,
+                    created_at=created_at,
+                )
+            )
+    ExpenseVisibility.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0002_expense_list_order_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExpenseVisibility",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("created_at", models.DateTimeField()),
+                (
+                    "expense",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="visibility",
+                        to="expenses.expense",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="visible_expenses",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-date", "-created_at", "expense"],
+                        name="expenses_ex_user_id_1c4fb5_idx",
+                    )
+                ],
+                "unique_together": {("user", "expense")},
+            },
+        ),
+        migrations.RunPython(populate_visibility, migrations.RunPython.noop),
+    ]
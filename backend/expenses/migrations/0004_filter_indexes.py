@@ -0,0 +1,95 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_filter_columns(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    ExpenseVisibility = apps.get_model("expenses", "ExpenseVisibility")
+
+    expense = Expense.objects.filter(pk=OuterRef("expense_id"))
+    ExpenseVisibility.objects.update(
+        category_id=Subquery(expense.values("category_id")),
+        group_id=Subquery(expense.values("group_id")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0003_expense_visibility"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="expense",
+            name="expenses_ex_categor_20264a_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="expense",
+            name="expenses_ex_group_i_7493d0_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="expense",
+            name="expenses_ex_paid_by_a99d03_idx",
+        ),
+        migrations.AddField(
+            model_name="expensevisibility",
+            name="category",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="expenses.expensecategory",
+            ),
+        ),
+        migrations.AddField(
+            model_name="expensevisibility",
+            name="group",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="expenses.expensegroup",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["category", "date"], name="expenses_ex_categor_9e3535_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["group", "date"], name="expenses_ex_group_i_f6bb8c_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["paid_by", "date"], name="expenses_ex_paid_by_84569b_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expensevisibility",
+            index=models.Index(
+                fields=["user", "category", "-date", "-created_at", "expense"],
+                name="expenses_ex_user_id_79bb17_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expensevisibility",
+            index=models.Index(
+                fields=["user", "group", "-date", "-created_at", "expense"],
+                name="expenses_ex_user_id_f759df_idx",
+            ),
+        ),
+        migrations.RunPython(copy_filter_columns, migrations.RunPython.noop),
+    ]
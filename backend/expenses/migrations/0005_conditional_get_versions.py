@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0004_filter_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="expensevisibility",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name="expensecategory",
+            index=models.Index(
+                fields=["updated_at"], name="expenses_ex_updated_ffaa15_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expensevisibility",
+            index=models.Index(
+                fields=["user", "updated_at"], name="expenses_ex_user_id_6c7bf1_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncMonth
+
+
+def copy_amounts(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    ExpenseVisibility = apps.get_model("expenses", "ExpenseVisibility")
+
+    expense = Expense.objects.filter(pk=OuterRef("expense_id"))
+    ExpenseVisibility.objects.update(amount=Subquery(expense.values("amount")))
+
+
+def populate_rollups(apps, schema_editor):
+    ExpenseVisibility = apps.get_model("expenses", "ExpenseVisibility")
+    ExpenseMonthlyRollup = apps.get_model("expenses", "ExpenseMonthlyRollup")
+
+    rows = (
+        ExpenseVisibility.objects.annotate(month=TruncMonth("date"))
+        .values("user_id", "month", "category_id")
+        .annotate(total=Sum("amount"), count=Count("id"))
+        .order_by()
+    )
+    ExpenseMonthlyRollup.objects.bulk_create(
+        [ExpenseMonthlyRollup(**row) for row in rows], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0005_conditional_get_versions"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="expensevisibility",
+            name="amount",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_amounts, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="ExpenseMonthlyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField(help_text="First day of the month")),
+                (
+                    "total",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "category",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="expenses.expensecategory",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="expense_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["user", "-month"],
+                "unique_together": {("user", "month", "category")},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:57
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+
+
+def populate_balances(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    ExpenseGroup = apps.get_model("expenses", "ExpenseGroup")
+    ExpenseSplit = apps.get_model("expenses", "ExpenseSplit")
+    GroupBalance = apps.get_model("expenses", "GroupBalance")
+
+    members = defaultdict(set)
+    for group_id, user_id in ExpenseGroup.members.through.objects.values_list(
+        "expensegroup_id", "customuser_id"
+    ):
+        members[group_id].add(user_id)
+    splits = defaultdict(list)
+    for expense_id, user_id, amount, is_paid in ExpenseSplit.objects.values_list(
+        "expense_id", "user_id", "amount", "is_paid"
+    ):
+        splits[expense_id].append((user_id, amount, is_paid))
+
+    # Signed amount owed by the lower user id to the higher one
+    net = defaultdict(Decimal)
+
+    def owe(group_id, debtor_id, creditor_id, amount):
+        if debtor_id < creditor_id:
+            net[(group_id, debtor_id, creditor_id)] += amount
+        else:
+            net[(group_id, creditor_id, debtor_id)] -= amount
+
+    for expense_id, group_id, paid_by_id, amount, is_split in Expense.objects.filter(
+        group__isnull=False
+    ).values_list("id", "group_id", "paid_by_id", "amount", "is_split"):
+        if expense_id in splits:
+            for user_id, share, is_paid in splits[expense_id]:
+                if user_id != paid_by_id and not is_paid:
+                    owe(group_id, user_id, paid_by_id, share)
+        elif is_split:
+            others = members[group_id] - {paid_by_id}
+            if others:
+                share = (amount / (len(others) + 1)).quantize(
+                    Decimal("0.01"), rounding=ROUND_HALF_UP
+                )
+                for user_id in others:
+                    owe(group_id, user_id, paid_by_id, share)
+
+    balances = []
+    for (group_id, low, high), amount in net.items():
+        if amount > 0:
+            balances.append(
+                GroupBalance(
+                    group_id=group_id, debtor_id=low, creditor_id=high, amount=amount
+                )
+            )
+        elif amount < 0:
+            balances.append(
+                GroupBalance(
+                    group_id=group_id, debtor_id=high, creditor_id=low, amount=-amount
+                )
+            )
+    GroupBalance.objects.bulk_create(balances, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0006_monthly_rollups"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GroupBalance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=14)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "creditor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="group_credits",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "debtor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="group_debts",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "group",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="balances",
+                        to="expenses.expensegroup",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["group", "-amount"],
+                "indexes": [
+                    models.Index(
+                        fields=["creditor", "amount"],
+                        name="expenses_gr_credito_aa098e_idx",
+                    )
+                ],
+                "unique_together": {("group", "debtor", "creditor")},
+            },
+        ),
+        migrations.RunPython(populate_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0007_group_balances"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="groupbalance",
+            index=models.Index(
+                fields=["group", "creditor", "amount"],
+                name="expenses_gr_group_i_ad2013_idx",
+            ),
+        ),
+    ]
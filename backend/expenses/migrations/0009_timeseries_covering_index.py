@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0008_group_balance_creditor_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="expensevisibility",
+            index=models.Index(
+                fields=["user", "date", "category", "group", "amount"],
+                name="expenses_ex_user_id_f55101_idx",
+            ),
+        ),
+    ]
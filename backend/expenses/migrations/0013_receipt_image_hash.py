@@ -0,0 +1,74 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0012_receipt_ocr_jobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="expensereceipt",
+            name="duplicate_of",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="duplicates",
+                to="expenses.expensereceipt",
+            ),
+        ),
+        migrations.AddField(
+            model_name="expensereceipt",
+            name="hash_band_0",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="expensereceipt",
+            name="hash_band_1",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="expensereceipt",
+            name="hash_band_2",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="expensereceipt",
+            name="hash_band_3",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="expensereceipt",
+            name="image_hash",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="expensereceipt",
+            index=models.Index(
+                fields=["hash_band_0"], name="expenses_ex_hash_ba_a8a0df_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expensereceipt",
+            index=models.Index(
+                fields=["hash_band_1"], name="expenses_ex_hash_ba_189942_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expensereceipt",
+            index=models.Index(
+                fields=["hash_band_2"], name="expenses_ex_hash_ba_4285ea_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expensereceipt",
+            index=models.Index(
+                fields=["hash_band_3"], name="expenses_ex_hash_ba_eed27b_idx"
+            ),
+        ),
+    ]
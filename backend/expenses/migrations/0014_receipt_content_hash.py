@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0013_receipt_image_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="expensereceipt",
+            name="content_hash",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
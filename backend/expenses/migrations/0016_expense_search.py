@@ -0,0 +1,103 @@
+# Full-text search index for expenses (see expenses/search.py). SQLite only:
+# other databases have no FTS5, and search falls back to LIKE there.
+
+from django.db import migrations
+
+RECEIPT_TEXT = """coalesce((
+    SELECT group_concat(extracted_merchant || ' ' || ocr_text, ' ')
+    FROM expenses_expensereceipt WHERE expense_id = {expense}
+), '')"""
+
+VIEWERS = """coalesce((
+    SELECT group_concat('u' || user_id, ' ')
+    FROM expenses_expensevisibility WHERE expense_id = {expense}
+), '')"""
+
+
+def receipts(expense):
+    return (
+        f"UPDATE expenses_search SET receipts = {RECEIPT_TEXT.format(expense=expense)} "
+        f"WHERE rowid = {expense};"
+    )
+
+
+def viewers(expense):
+    return (
+        f"UPDATE expenses_search SET viewers = {VIEWERS.format(expense=expense)} "
+        f"WHERE rowid = {expense};"
+    )
+
+
+CREATE = [
+    # rowid is the expense id; viewers holds a u<user id> token per user who can see it
+    """CREATE VIRTUAL TABLE expenses_search USING fts5(
+        description, notes, location, tags, receipts, viewers,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4'
+    )""",
+    """CREATE TRIGGER expenses_search_expense_insert AFTER INSERT ON expenses_expense BEGIN
+        INSERT INTO expenses_search (rowid, description, notes, location, tags, receipts, viewers)
+        VALUES (new.id, new.description, new.notes, new.location, new.tags, '', '');
+    END""",
+    """CREATE TRIGGER expenses_search_expense_update
+    AFTER UPDATE OF description, notes, location, tags ON expenses_expense BEGIN
+        UPDATE expenses_search
+        SET description = new.description, notes = new.notes, location = new.location, tags = new.tags
+        WHERE rowid = new.id;
+    END""",
+    """CREATE TRIGGER expenses_search_expense_delete AFTER DELETE ON expenses_expense BEGIN
+        DELETE FROM expenses_search WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER expenses_search_receipt_insert AFTER INSERT ON expenses_expensereceipt BEGIN
+        {receipts('new.expense_id')}
+    END""",
+    f"""CREATE TRIGGER expenses_search_receipt_update
+    AFTER UPDATE OF ocr_text, extracted_merchant, expense_id ON expenses_expensereceipt BEGIN
+        {receipts('old.expense_id')}
+        {receipts('new.expense_id')}
+    END""",
+    f"""CREATE TRIGGER expenses_search_receipt_delete AFTER DELETE ON expenses_expensereceipt BEGIN
+        {receipts('old.expense_id')}
+    END""",
+    f"""CREATE TRIGGER expenses_search_visibility_insert AFTER INSERT ON expenses_expensevisibility BEGIN
+        {viewers('new.expense_id')}
+    END""",
+    f"""CREATE TRIGGER expenses_search_visibility_update
+    AFTER UPDATE OF user_id, expense_id ON expenses_expensevisibility BEGIN
+        {viewers('old.expense_id')}
+        {viewers('new.expense_id')}
+    END""",
+    f"""CREATE TRIGGER expenses_search_visibility_delete AFTER DELETE ON expenses_expensevisibility BEGIN
+        {viewers('old.expense_id')}
+    END""",
+    f"""INSERT INTO expenses_search (rowid, description, notes, location, tags, receipts, viewers)
+    SELECT id, description, notes, location, tags,
+        {RECEIPT_TEXT.format(expense='expenses_expense.id')}, {VIEWERS.format(expense='expenses_expense.id')}
+    FROM expenses_expense""",
+]
+
+DROP = [
+    f"DROP TRIGGER IF EXISTS expenses_search_{table}_{event}"
+    for table in ('expense', 'receipt', 'visibility')
+    for event in ('insert', 'update', 'delete')
+] + ["DROP TABLE IF EXISTS expenses_search"]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0015_backfill_checkpoints"),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE), run(DROP)),
+    ]
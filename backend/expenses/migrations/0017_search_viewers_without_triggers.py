@@ -0,0 +1,32 @@
+# The viewers column of expenses_search is written once per expense by
+# expenses.visibility.index_expenses instead of by triggers on every
+# visibility row, which rebuilt the whole document per member and made a
+# group change O(members²). SQLite only, like 0016.
+
+import importlib
+
+from django.db import migrations
+
+search = importlib.import_module("expenses.migrations.0016_expense_search")
+
+TRIGGERS = [
+    statement
+    for statement in search.CREATE
+    if "expenses_search_visibility_" in statement
+]
+
+DROP = [
+    f"DROP TRIGGER IF EXISTS expenses_search_visibility_{event}"
+    for event in ("insert", "update", "delete")
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0016_expense_search"),
+    ]
+
+    operations = [
+        migrations.RunPython(search.run(DROP), search.run(TRIGGERS)),
+    ]
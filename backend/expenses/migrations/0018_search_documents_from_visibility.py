@@ -0,0 +1,30 @@
+# New expenses get their search document from
+# expenses.visibility.index_expenses, written once with its viewers, so
+# the insert trigger's empty first version is no longer needed. SQLite
+# only, like 0016.
+
+import importlib
+
+from django.db import migrations
+
+search = importlib.import_module("expenses.migrations.0016_expense_search")
+
+TRIGGER = next(
+    statement
+    for statement in search.CREATE
+    if "expenses_search_expense_insert" in statement
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0017_search_viewers_without_triggers"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            search.run(["DROP TRIGGER IF EXISTS expenses_search_expense_insert"]),
+            search.run([TRIGGER]),
+        ),
+    ]
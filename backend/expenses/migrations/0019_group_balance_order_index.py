@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-17 08:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0018_search_documents_from_visibility"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="groupbalance",
+            index=models.Index(
+                fields=["group", "-amount"], name="expenses_gr_group_i_24b2a0_idx"
+            ),
+        ),
+    ]
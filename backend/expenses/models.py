@@ -15,6 +15,9 @@ class ExpenseCategory(models.Model):
     class Meta:
         verbose_name_plural = "Expense Categories"
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
 
     def __str__(self):
         return self.name
@@ -122,9 +125,11 @@ class Expense(models.Model):
         ordering = ['-date', '-created_at']
         indexes = [
             models.Index(fields=['date']),
-            models.Index(fields=['category']),
-            models.Index(fields=['group']),
-            models.Index(fields=['paid_by']),
+            models.Index(fields=['category', 'date']),
+            models.Index(fields=['group', 'date']),
+            models.Index(fields=['paid_by', 'date']),
+            # Matches the default ordering so cursor pages are index range scans
+            models.Index(fields=['-date', '-created_at', 'id']),
         ]
 
     def __str__(self):
@@ -168,10 +173,173 @@ class ExpenseReceipt(models.Model):
     extracted_date = models.DateField(null=True, blank=True)
     extracted_merchant = models.CharField(max_length=200, blank=True)
     confidence_score = models.FloatField(null=True, blank=True)
+    # SHA-256 of the uploaded bytes, from the upload handler
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # dHash of the image (signed, to fit a BigIntegerField) and its four
+    # 16-bit bands: any hash within 3 bits shares at least one band exactly
+    image_hash = models.BigIntegerField(null=True, blank=True)
+    hash_band_0 = models.IntegerField(null=True, blank=True)
+    hash_band_1 = models.IntegerField(null=True, blank=True)
+    hash_band_2 = models.IntegerField(null=True, blank=True)
+    hash_band_3 = models.IntegerField(null=True, blank=True)
+    duplicate_of = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='duplicates'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['hash_band_0']),
+            models.Index(fields=['hash_band_1']),
+            models.Index(fields=['hash_band_2']),
+            models.Index(fields=['hash_band_3']),
+        ]
 
     def __str__(self):
         return f"Receipt for {self.expense.description}"
+
+class ExpenseVisibility(models.Model):
+    """Denormalized (user, expense) rows for every expense a user can see"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='visible_expenses')
+    expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name='visibility')
+    # Copied from the expense so reads can range-scan and sort on the index alone
+    date = models.DateField()
+    created_at = models.DateTimeField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    category = models.ForeignKey(
+        ExpenseCategory, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    group = models.ForeignKey(
+        ExpenseGroup, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    # Rows are rewritten whenever the expense or its audience changes, so the
+    # newest updated_at plus the row count versions what a user can see
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['user', 'expense']
+        indexes = [
+            models.Index(fields=['user', 'updated_at']),
+            models.Index(fields=['user', '-date', '-created_at', 'expense']),
+            models.Index(fields=['user', 'category', '-date', '-created_at', 'expense']),
+            models.Index(fields=['user', 'group', '-date', '-created_at', 'expense']),
+            # Covering index for the time series, which reads only these columns
+            models.Index(fields=['user', 'date', 'category', 'group', 'amount']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.email} can see {self.expense.description}"
+
+class ExpenseMonthlyRollup(models.Model):
+    """Per-user monthly totals by category over the expenses the user can see"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expense_rollups')
+    month = models.DateField(help_text='First day of the month')
+    category = models.ForeignKey(
+        ExpenseCategory, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['user', 'month', 'category']
+        ordering = ['user', '-month']
+
+    def __str__(self):
+        return f"{self.user.email} {self.month:%Y-%m} {self.category}: ₹{self.total} ({self.count})"
+
+class GroupBalance(models.Model):
+    """Net amount one group member owes another, kept current from expenses and splits"""
+    group = models.ForeignKey(ExpenseGroup, on_delete=models.CASCADE, related_name='balances')
+    debtor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='group_debts')
+    creditor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='group_credits')
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['group', 'debtor', 'creditor']
+        ordering = ['group', '-amount']
+        indexes = [
+            # Covers SUM(amount) WHERE creditor = ? for the summary's owed amount
+            models.Index(fields=['creditor', 'amount']),
+            # Covers each member's credit total in a group for settle-up
+            models.Index(fields=['group', 'creditor', 'amount']),
+            # Reads a group's balances already in the default ordering
+            models.Index(fields=['group', '-amount']),
+        ]
+
+    def __str__(self):
+        return f"{self.debtor.email} owes {self.creditor.email} ₹{self.amount} in {self.group.name}"
+
+class CategorizationJob(models.Model):
+    """An expense waiting for the background worker to fill its AI category"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    ]
+
+    expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name='categorization_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Set by the worker pass that claimed the job; a lapsed claim is picked up again
+    claim_token = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['claim_token']),
+        ]
+
+    def __str__(self):
+        return f"Categorize {self.expense_id} ({self.status})"
+
+class UserCategoryMapping(models.Model):
+    """The category a user last filed a normalized description under"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='category_mappings')
+    key = models.CharField(max_length=500)
+    category = models.ForeignKey(ExpenseCategory, on_delete=models.CASCADE, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['user', 'key']
+
+    def __str__(self):
+        return f"{self.user.email}: {self.key} → {self.category.name}"
+
+class ReceiptOCRJob(models.Model):
+    """A receipt waiting for the OCR worker to read its image"""
+    STATUS_CHOICES = CategorizationJob.STATUS_CHOICES
+
+    receipt = models.ForeignKey(ExpenseReceipt, on_delete=models.CASCADE, related_name='ocr_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    claim_token = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['claim_token']),
+        ]
+
+    def __str__(self):
+        return f"OCR receipt {self.receipt_id} ({self.status})"
+
+class BackfillCheckpoint(models.Model):
+    """How far a resumable backfill or import has got, by the last id or line it committed"""
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.position}"
@@ -0,0 +1,182 @@
+"""
+Receipt OCR.
+
+Reading a receipt is CPU-bound and loading an OCR model takes seconds,
+so this runs out of request in the process_receipts worker's process
+pool: init_worker loads the engine once in each pool process, and
+extract reads one image there, from its downscaled OCR derivative.
+Neither touches Django or the database, so they work under any
+multiprocessing start method. parse_receipt pulls the amount, date and
+merchant out of the recognized text.
+"""
+import os
+import re
+from datetime import date
+from decimal import Decimal
+
+from .imaging import dhash, render
+
+ENGINES = ('easyocr', 'tesseract')
+
+# Tesseract names its language packs differently from easyocr
+TESSERACT_LANGUAGES = {'en': 'eng', 'hi': 'hin'}
+
+_read = None
+
+_AMOUNT = re.compile(r'(?<![\d.])(\d{1,3}(?:,\d{2,3})+|\d+)(?:\.(\d{1,2}))?(?![\d%])')
+_TOTAL = re.compile(r'\b(grand\s*total|net\s*amount|total|amount\s*(?:due|paid)|to\s*pay)\b', re.I)
+_SUBTOTAL = re.compile(r'\bsub\s*-?\s*total\b', re.I)
+_NUMERIC_DATE = re.compile(r'\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{4}|\d{2})\b')
+_ISO_DATE = re.compile(r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b')
+_NAMED_DATE = re.compile(r'\b(\d{1,2})[\s-]*([A-Za-z]{3})[a-z]*[\s,.-]*(\d{4}|\d{2})\b')
+_MONTHS = {
+    name: number for number, name in enumerate(
+        ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], 1
+    )
+}
+_LETTERS = re.compile(r'[A-Za-z]{3}')
+_NOT_MERCHANT = re.compile(r'\b(invoice|receipt|bill|tax|gst|date|time|phone|tel|cashier)\b', re.I)
+
+
+def load_engine(engine, languages):
+    """Return a function reading an image path into (text, confidence) lines"""
+    if engine == 'easyocr':
+        import easyocr
+
+        reader = easyocr.Reader(list(languages), gpu=False, verbose=False)
+
+        def read(path):
+            return [(text, float(confidence)) for _, text, confidence in reader.readtext(path)]
+
+        return read
+
+    if engine == 'tesseract':
+        import pytesseract
+        from PIL import Image
+
+        lang = '+'.join(TESSERACT_LANGUAGES.get(language, language) for language in languages)
+
+        def read(path):
+            with Image.open(path) as image:
+                data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+            # Tesseract reports words; join them back into lines
+            lines = {}
+            for index, word in enumerate(data['text']):
+                confidence = float(data['conf'][index])
+                if word.strip() and confidence >= 0:
+                    key = (data['block_num'][index], data['par_num'][index], data['line_num'][index])
+                    lines.setdefault(key, []).append((word, confidence / 100))
+            return [
+                (' '.join(word for word, _ in words), sum(c for _, c in words) / len(words))
+                for words in lines.values()
+            ]
+
+        return read
+
+    raise ValueError(f'Unknown OCR engine {engine!r}; expected one of {", ".join(ENGINES)}')
+
+
+def init_worker(engine, languages):
+    """Pool initializer: load the engine once for every receipt this process will read"""
+    global _read
+    _read = load_engine(engine, languages)
+
+
+def extract(task):
+    """
+    Read one receipt in a pool process. task is (receipt_id, original
+    path, {kind: derivative path}); derivatives that do not exist yet are
+    rendered first and OCR reads the 'ocr' one. Returns (receipt_id,
+    fields, error), fields being the ExpenseReceipt values to write back
+    or None when reading failed.
+    """
+    receipt_id, source, derivatives = task
+    try:
+        missing = {kind: path for kind, path in derivatives.items() if not os.path.exists(path)}
+        if missing:
+            render(source, missing)
+        lines = _read(derivatives['ocr'])
+    except Exception as error:
+        return receipt_id, None, f'{type(error).__name__}: {error}'
+    text = '\n'.join(text for text, _ in lines)
+    confidence = sum(c for _, c in lines) / len(lines) if lines else None
+    return receipt_id, {'ocr_text': text, 'confidence_score': confidence, **parse_receipt(text)}, None
+
+
+def extract_with_hash(task):
+    """
+    extract, for receipts stored before uploads were fingerprinted: the
+    fields also carry the dHash of the original as image_hash, or None
+    if it could not be computed.
+    """
+    receipt_id, fields, error = extract(task)
+    if fields is not None:
+        try:
+            fields['image_hash'] = dhash(task[1])
+        except Exception:
+            fields['image_hash'] = None
+    return receipt_id, fields, error
+
+
+def _amounts(line, priced_only=False):
+    """Figures on a line with its dates blanked out; priced_only keeps those with paise"""
+    line = _ISO_DATE.sub(' ', _NUMERIC_DATE.sub(' ', line))
+    return [
+        Decimal(f"{whole.replace(',', '')}.{fraction or '0'}")
+        for whole, fraction in _AMOUNT.findall(line)
+        if fraction or not priced_only
+    ]
+
+
+def _parse_date(text):
+    candidates = []
+    for day, month, year in _NUMERIC_DATE.findall(text):
+        candidates.append((year, month, day))
+    for year, month, day in _ISO_DATE.findall(text):
+        candidates.append((year, month, day))
+    for day, month, year in _NAMED_DATE.findall(text):
+        if month.lower() in _MONTHS:
+            candidates.append((year, _MONTHS[month.lower()], day))
+    for year, month, day in candidates:
+        year = int(year)
+        if year < 100:
+            year += 2000
+        try:
+            return date(year, int(month), int(day))
+        except ValueError:
+            continue
+    return None
+
+
+def parse_receipt(text):
+    """
+    Return extracted_amount, extracted_date and extracted_merchant from
+    receipt text. The amount is the largest figure on a total line (not
+    a subtotal), else the largest figure with paise; dates are read day
+    first; the merchant is the first line that looks like a name.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+
+    totals = [
+        amount for line in lines
+        if _TOTAL.search(line) and not _SUBTOTAL.search(line)
+        for amount in _amounts(line)
+    ]
+    if not totals:
+        # Without a total line, bare integers are as likely phone or bill numbers as prices
+        totals = [amount for line in lines for amount in _amounts(line, priced_only=True)]
+    amount = max(totals) if totals else None
+    # ExpenseReceipt.extracted_amount is DecimalField(max_digits=10, decimal_places=2)
+    if amount is not None and amount >= Decimal('1e8'):
+        amount = None
+
+    merchant = next(
+        (line for line in lines if _LETTERS.search(line) and not _NOT_MERCHANT.search(line)
+         and not _TOTAL.search(line)),
+        '',
+    )
+    return {
+        'extracted_amount': amount.quantize(Decimal('0.01')) if amount is not None else None,
+        'extracted_date': _parse_date(text),
+        'extracted_merchant': merchant[:200],
+    }
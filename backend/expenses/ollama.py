@@ -0,0 +1,182 @@
+"""
+Shared client for the Ollama server used by category detection.
+
+One pooled requests.Session keeps connections alive across calls. A
+semaphore caps how many requests a process has in flight; callers that
+cannot get a slot within the queue deadline give up instead of tying up
+a WSGI worker. A circuit breaker opens after repeated timeouts or server
+errors and fails every call immediately until a cool-off has passed, so
+a slow or dead Ollama costs callers nothing but the keyword fallback.
+"""
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaError(Exception):
+    """Ollama could not answer; callers fall back to keyword detection"""
+
+
+class CircuitOpen(OllamaError):
+    pass
+
+
+class QueueTimeout(OllamaError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Closed until failure_threshold consecutive failures, then open for
+    reset_timeout seconds. After that one trial call is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self._opened_at is None:
+            return 'closed'
+        if now - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_running:
+                    logger.warning('Ollama circuit opened after %d failures', self._failures)
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class OllamaClient:
+    def __init__(self, base_url, model, timeout, max_concurrency, queue_timeout,
+                 failure_threshold, reset_timeout):
+        self.generate_url = f"{base_url.rstrip('/')}/api/generate"
+        self.model = model
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def generate(self, prompt, options=None):
+        """Return the model's completion for prompt, or raise OllamaError"""
+        # Fail fast without queueing while the circuit is open
+        if self.breaker.state == 'open':
+            raise CircuitOpen('Ollama circuit is open')
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise QueueTimeout(f'No Ollama slot free within {self.queue_timeout}s')
+        try:
+            if not self.breaker.allow():
+                raise CircuitOpen('Ollama circuit is open')
+            started = time.perf_counter()
+            try:
+                answer = self._post(prompt, options)
+            except requests.HTTPError as error:
+                # A 4xx means Ollama is up but rejected this request (e.g. an unknown model)
+                if error.response is not None and error.response.status_code < 500:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+                logger.warning('Ollama request failed: %s', error)
+                raise OllamaError(str(error)) from error
+            except (requests.RequestException, ValueError) as error:
+                self.breaker.record_failure()
+                logger.warning('Ollama request failed: %s', error)
+                raise OllamaError(str(error)) from error
+            except Exception as error:
+                # Anything else still counts against Ollama and ends a half-open
+                # trial, or the breaker would wait on that trial forever
+                self.breaker.record_failure()
+                logger.exception('Ollama request failed unexpectedly')
+                raise OllamaError(str(error)) from error
+        finally:
+            self._slots.release()
+
+        self.breaker.record_success()
+        logger.debug('Ollama answered in %.0f ms', (time.perf_counter() - started) * 1000)
+        return answer
+
+    def _post(self, prompt, options):
+        response = self.session.post(
+            self.generate_url,
+            json={
+                'model': self.model,
+                'prompt': prompt,
+                'stream': False,
+                'options': options or {},
+            },
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        body = response.json()
+        if not isinstance(body, dict) or not isinstance(body.get('response', ''), str):
+            raise ValueError(f'Unexpected Ollama response: {body!r:.200}')
+        return body.get('response', '')
+
+_client = None
+_client_config = None
+_client_lock = threading.Lock()
+
+
+def _config():
+    return (
+        settings.OLLAMA_URL,
+        settings.OLLAMA_MODEL,
+        settings.OLLAMA_TIMEOUT,
+        settings.OLLAMA_MAX_CONCURRENCY,
+        settings.OLLAMA_QUEUE_TIMEOUT,
+        settings.OLLAMA_CIRCUIT_FAILURES,
+        settings.OLLAMA_CIRCUIT_RESET,
+    )
+
+
+def get_client():
+    """The process-wide client, rebuilt if the Ollama settings have changed"""
+    global _client, _client_config
+    config = _config()
+    with _client_lock:
+        if _client is None or config != _client_config:
+            _client = OllamaClient(*config)
+            _client_config = config
+        return _client
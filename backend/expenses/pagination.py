@@ -0,0 +1,112 @@
+from datetime import date, datetime
+
+from django.core import signing
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class ExpenseCursorPagination(BasePagination):
+    """
+    Keyset pagination over the (-date, -created_at, id) expense ordering.
+
+    The continuation token is a signed encoding of the last row's sort key,
+    so every page is a single indexed range scan starting right after that
+    row, however deep the client has scrolled. The sort key is read from the
+    annotations added by visibility.visible_expenses().
+    """
+    ordering = ('-visible_date', '-visible_created_at', 'visible_id')
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+    signing_salt = 'expenses.pagination.cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = self.filter_after(queryset, position)
+
+        # Fetch one extra row to find out whether there is a next page.
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        self.next_position = self.get_position(self.page[-1]) if self.has_next else None
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def get_position(self, row):
+        """Return the (date, created_at, id) sort key of a model instance or values() row"""
+        if isinstance(row, dict):
+            return row['visible_date'], row['visible_created_at'], row['visible_id']
+        return row.visible_date, row.visible_created_at, row.visible_id
+
+    def filter_after(self, queryset, position):
+        row_date, created_at, row_id = position
+        # The leading date bound gives the planner a range to seek on; the
+        # OR chain then resolves ties within the boundary date.
+        return queryset.filter(visible_date__lte=row_date).filter(
+            Q(visible_date__lt=row_date)
+            | Q(visible_date=row_date, visible_created_at__lt=created_at)
+            | Q(visible_date=row_date, visible_created_at=created_at, visible_id__gt=row_id)
+        )
+
+    def encode_cursor(self, position):
+        row_date, created_at, row_id = position
+        return signing.dumps(
+            [row_date.isoformat(), created_at.isoformat(), row_id],
+            salt=self.signing_salt,
+        )
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            row_date, created_at, row_id = signing.loads(token, salt=self.signing_salt)
+            return date.fromisoformat(row_date), datetime.fromisoformat(created_at), int(row_id)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,87 @@
+"""
+OCR backfill for receipts stored before OCR was wired in.
+
+Those receipts have empty OCR fields and no ReceiptOCRJob. The
+backfill_receipts command streams their ids in id order with
+iterator(), reads each chunk in a process pool like the one
+process_receipts uses, and writes the fields back with one bulk_update.
+The last id of a chunk is saved as a BackfillCheckpoint in the same
+transaction as its results, so after a crash the next run starts at the
+first chunk that was not committed. Receipts that could not be read are
+handed to the OCR queue, whose worker retries them. Their dHash is
+filled in along the way, so old receipts take part in duplicate
+detection too.
+"""
+import logging
+
+from django.db import transaction
+
+from .derivatives import derivative_paths
+from .imaging import SPECS
+from .models import BackfillCheckpoint, ExpenseReceipt
+from .ocr import extract_with_hash
+from .receipt_duplicates import RESULT_FIELDS, hash_fields
+from .receipt_jobs import enqueue_ocr
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT = 'receipt_ocr'
+
+HASH_FIELDS = ['image_hash', 'hash_band_0', 'hash_band_1', 'hash_band_2', 'hash_band_3']
+
+
+def checkpoint():
+    """Id of the last receipt a previous run committed, 0 if none"""
+    return (
+        BackfillCheckpoint.objects.filter(name=CHECKPOINT).values_list('position', flat=True).first() or 0
+    )
+
+
+def reset_checkpoint():
+    BackfillCheckpoint.objects.filter(name=CHECKPOINT).delete()
+
+
+def pending_chunks(after, chunk_size):
+    """Yield lists of up to chunk_size (id, image name) for never-read receipts past after, by id"""
+    rows = (
+        ExpenseReceipt.objects.filter(pk__gt=after, ocr_text='', ocr_jobs__isnull=True)
+        .order_by('pk')
+        .values_list('id', 'image')
+        .iterator(chunk_size=chunk_size)
+    )
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def backfill_chunk(pool, rows):
+    """
+    Read one chunk with pool.map, store the results and move the
+    checkpoint past it. Returns a dict counting the receipts read and
+    those queued for a retry.
+    """
+    tasks = [(receipt_id, *derivative_paths(image, SPECS)) for receipt_id, image in rows]
+    receipts = []
+    hashed = []
+    failed = []
+    for receipt_id, fields, error in pool.map(extract_with_hash, tasks, chunksize=1):
+        if fields is None:
+            logger.warning('Could not read receipt %s: %s', receipt_id, error)
+            failed.append(receipt_id)
+            continue
+        image_hash = fields.pop('image_hash')
+        receipts.append(ExpenseReceipt(pk=receipt_id, **fields))
+        if image_hash is not None:
+            hashed.append(ExpenseReceipt(pk=receipt_id, **hash_fields(image_hash)))
+
+    with transaction.atomic():
+        ExpenseReceipt.objects.bulk_update(receipts, RESULT_FIELDS, batch_size=500)
+        ExpenseReceipt.objects.bulk_update(hashed, HASH_FIELDS, batch_size=500)
+        enqueue_ocr(failed)
+        BackfillCheckpoint.objects.update_or_create(name=CHECKPOINT, defaults={'position': rows[-1][0]})
+    return {'read': len(receipts), 'queued': len(failed)}
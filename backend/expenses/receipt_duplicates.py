@@ -0,0 +1,103 @@
+"""
+Near-duplicate detection for uploaded receipts.
+
+Group members often upload the same receipt, or a re-shot of it, more
+than once. Each upload is fingerprinted with a 64-bit dHash, stored on
+ExpenseReceipt with its four 16-bit bands. Two hashes within
+MAX_DISTANCE (3) bits of each other differ in at most three bands, so
+they share at least one exactly: the lookup is an OR of four indexed
+equality matches, and only those candidates get their Hamming distance
+checked. A duplicate reuses the OCR results of the receipt it matches
+instead of being read again. A byte-for-byte copy is recognized from
+the content hash the upload handler computed, without decoding it.
+
+Only receipts on expenses the uploader can already see are candidates,
+so OCR text never travels between people who do not share expenses.
+"""
+from django.db.models import Q
+from PIL import Image
+
+from .imaging import dhash
+from .models import ExpenseReceipt
+
+BANDS = 4
+BAND_BITS = 16
+MAX_DISTANCE = BANDS - 1
+
+RESULT_FIELDS = [
+    'ocr_text', 'confidence_score', 'extracted_amount', 'extracted_date', 'extracted_merchant'
+]
+
+
+def hash_fields(image_hash):
+    """ExpenseReceipt field values for an unsigned 64-bit hash"""
+    bands = {
+        f'hash_band_{band}': image_hash >> (band * BAND_BITS) & (1 << BAND_BITS) - 1
+        for band in range(BANDS)
+    }
+    # BigIntegerField is signed
+    signed = image_hash - (1 << 64) if image_hash >= 1 << 63 else image_hash
+    return {'image_hash': signed, **bands}
+
+
+def distance(first, second):
+    """Hamming distance between two stored (signed) hashes"""
+    return bin((first ^ second) & (1 << 64) - 1).count('1')
+
+
+def match_upload(user, upload):
+    """
+    ExpenseReceipt fields for a new upload: its hashes and, when it
+    matches a receipt the user can see, duplicate_of and that receipt's
+    OCR results if it has been read.
+    """
+    visible = ExpenseReceipt.objects.filter(expense__visibility__user=user)
+    fields = {'content_hash': getattr(upload, 'sha256', '')}
+    original = fields['content_hash'] and (
+        visible.filter(content_hash=fields['content_hash']).order_by('created_at', 'id').first()
+    )
+    if original:
+        fields['image_hash'] = original.image_hash
+        fields.update((f'hash_band_{band}', getattr(original, f'hash_band_{band}')) for band in range(BANDS))
+    else:
+        try:
+            fields.update(hash_fields(dhash(upload)))
+        except (OSError, Image.DecompressionBombError):
+            return fields
+        finally:
+            upload.seek(0)
+        original = find_duplicate(visible, fields)
+    if original:
+        fields['duplicate_of'] = original
+        fields.update(ocr_finished([original.pk]).get(original.pk, {}))
+    return fields
+
+
+def find_duplicate(receipts, fields):
+    """The closest of receipts within MAX_DISTANCE of the hash in fields, else None"""
+    if fields['image_hash'] == 0:
+        # A blank or flat image has no gradients to compare; every such upload would match
+        return None
+    bands = Q()
+    for band in range(BANDS):
+        bands |= Q(**{f'hash_band_{band}': fields[f'hash_band_{band}']})
+    candidates = (
+        receipts.filter(bands)
+        .order_by('created_at', 'id')
+        .only('id', 'image_hash')
+    )
+    best = None
+    for candidate in candidates:
+        gap = distance(candidate.image_hash, fields['image_hash'])
+        if gap <= MAX_DISTANCE and (best is None or gap < best[0]):
+            best = gap, candidate
+    return best[1] if best else None
+
+
+def ocr_finished(receipt_ids):
+    """The OCR result fields of those receipts that are no longer queued, by receipt id"""
+    return {
+        row.pop('id'): row
+        for row in ExpenseReceipt.objects.filter(id__in=receipt_ids, ocr_jobs__isnull=True)
+        .values('id', *RESULT_FIELDS)
+    }
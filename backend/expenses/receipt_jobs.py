@@ -0,0 +1,84 @@
+"""
+Background OCR of uploaded receipts.
+
+Uploading a receipt only saves the image and queues a ReceiptOCRJob, so
+upload latency does not depend on OCR cost. The process_receipts worker
+claims batches of jobs and fans the images out over a process pool,
+one OCR engine loaded per process. Each receipt is read from its
+downscaled OCR derivative, rendered there along with the thumbnail if
+missing. Every result is then written back with one bulk_update and the
+finished jobs are dropped. Receipts that could not be
+read go back to the queue until they run out of attempts. A near
+duplicate whose original has been read by now copies its results
+rather than going to the pool (see receipt_duplicates).
+"""
+from django.db import transaction
+
+from .derivatives import derivative_paths
+from .imaging import SPECS
+from .jobs import claim_jobs, release_jobs
+from .models import ExpenseReceipt, ReceiptOCRJob
+from .ocr import extract
+from .receipt_duplicates import RESULT_FIELDS, ocr_finished
+
+
+def enqueue_ocr(receipt_ids):
+    """Queue the given receipts for OCR"""
+    ReceiptOCRJob.objects.bulk_create(ReceiptOCRJob(receipt_id=receipt_id) for receipt_id in receipt_ids)
+
+
+def process_batch(pool, batch_size):
+    """
+    Run one worker pass over up to batch_size jobs, reading their images
+    with pool.map. Returns a dict counting the jobs claimed, the receipts
+    read (reused counts those copied from an original instead), the jobs
+    put back for a retry and the jobs failed for good.
+    """
+    token = claim_jobs(ReceiptOCRJob, batch_size)
+    jobs = list(
+        ReceiptOCRJob.objects.filter(claim_token=token)
+        .values_list('id', 'receipt_id', 'receipt__image', 'attempts', 'receipt__duplicate_of_id')
+    )
+    stats = {'claimed': len(jobs), 'read': 0, 'reused': 0, 'retried': 0, 'failed': 0}
+    if not jobs:
+        return stats
+
+    # Duplicates uploaded while their original was still queued
+    originals = ocr_finished([original for *_, original in jobs if original is not None])
+    results = {
+        receipt_id: (originals[original], None)
+        for _, receipt_id, _, _, original in jobs if original in originals
+    }
+    stats['reused'] = len(results)
+
+    # The pool renders the derivatives too, so the full-size decode also runs in parallel
+    tasks = [
+        (receipt_id, *derivative_paths(image, SPECS))
+        for _, receipt_id, image, _, _ in jobs if receipt_id not in results
+    ]
+    # One receipt per task: reading takes far longer than shipping it to a process
+    results.update(
+        (receipt_id, (fields, error)) for receipt_id, fields, error in pool.map(extract, tasks, chunksize=1)
+    )
+
+    receipts = []
+    done = []
+    attempts = {}
+    errors = {}
+    for job_id, receipt_id, _, attempt, _ in jobs:
+        fields, error = results[receipt_id]
+        if fields is None:
+            attempts[job_id] = attempt
+            errors[job_id] = error
+        else:
+            receipts.append(ExpenseReceipt(pk=receipt_id, **fields))
+            done.append(job_id)
+
+    with transaction.atomic():
+        ExpenseReceipt.objects.bulk_update(receipts, RESULT_FIELDS, batch_size=500)
+        ReceiptOCRJob.objects.filter(id__in=done).delete()
+    if attempts:
+        stats['failed'] = release_jobs(ReceiptOCRJob, attempts, errors)
+    stats['read'] = len(receipts)
+    stats['retried'] = len(attempts) - stats['failed']
+    return stats
@@ -0,0 +1,126 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import Expense, ExpenseMonthlyRollup, ExpenseVisibility
+
+
+def month_of(day):
+    return day.replace(day=1)
+
+
+def rollup_deltas(removed, added):
+    """
+    Net (total, count) change per (user_id, month, category_id) when the
+    visibility rows in removed are replaced by those in added. Rows are
+    (user_id, date, category_id, amount) tuples.
+    """
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for rows, sign in ((removed, -1), (added, 1)):
+        for user_id, day, category_id, amount in rows:
+            delta = deltas[(user_id, month_of(day), category_id)]
+            delta[0] += sign * amount
+            delta[1] += sign
+    return {key: delta for key, delta in deltas.items() if delta[0] or delta[1]}
+
+
+def apply_rollup_deltas(deltas):
+    """Add deltas to the rollup table; call inside the transaction that changed the visibility rows"""
+    if not deltas:
+        return
+    with transaction.atomic():
+        emptied = False
+        for (user_id, month, category_id), (total, count) in deltas.items():
+            updated = ExpenseMonthlyRollup.objects.filter(
+                user_id=user_id, month=month, category_id=category_id
+            ).update(total=F('total') + total, count=F('count') + count)
+            if not updated:
+                ExpenseMonthlyRollup.objects.create(
+                    user_id=user_id, month=month, category_id=category_id,
+                    total=total, count=count
+                )
+            emptied = emptied or count < 0
+        if emptied:
+            ExpenseMonthlyRollup.objects.filter(
+                user_id__in={user_id for user_id, _, _ in deltas}, count=0
+            ).delete()
+
+
+def merge_category_rollups(category_id):
+    """Fold a category's rollups into the uncategorized bucket before the category is deleted"""
+    with transaction.atomic():
+        rows = list(
+            ExpenseMonthlyRollup.objects.filter(category_id=category_id)
+            .values_list('user_id', 'month', 'total', 'count')
+        )
+        ExpenseMonthlyRollup.objects.filter(category_id=category_id).delete()
+        apply_rollup_deltas({
+            (user_id, month, None): [total, count] for user_id, month, total, count in rows
+        })
+
+
+def live_rollups():
+    """Aggregate the rollups straight from the expense rows behind every visibility row"""
+    rows = (
+        ExpenseVisibility.objects.annotate(month=TruncMonth('expense__date'))
+        .values('user_id', 'month', 'expense__category_id')
+        .annotate(total=Sum('expense__amount'), count=Count('id'))
+        .order_by()
+    )
+    return {
+        (row['user_id'], row['month'], row['expense__category_id']): (row['total'], row['count'])
+        for row in rows
+    }
+
+
+def expected_rollups():
+    """
+    Aggregate the rollups from the expenses themselves, without going through
+    the visibility table: every expense counts once for its creator, its payer
+    and each member of its group. Used to check the visibility-derived rollups.
+    """
+    audiences = (
+        Expense.objects.annotate(viewer=F('created_by')),
+        Expense.objects.exclude(paid_by=F('created_by')).annotate(viewer=F('paid_by')),
+        Expense.objects.annotate(viewer=F('group__members')).filter(viewer__isnull=False)
+        .exclude(viewer=F('created_by')).exclude(viewer=F('paid_by')),
+    )
+    expected = defaultdict(lambda: (Decimal('0'), 0))
+    for expenses in audiences:
+        rows = (
+            expenses.annotate(month=TruncMonth('date')).order_by()
+            .values_list('viewer', 'month', 'category_id')
+            .annotate(total=Sum('amount'), count=Count('id'))
+        )
+        for user_id, month, category_id, total, count in rows:
+            key = (user_id, month, category_id)
+            expected[key] = (expected[key][0] + total, expected[key][1] + count)
+    return dict(expected)
+
+
+def stored_rollups():
+    return {
+        (user_id, month, category_id): (total, count)
+        for user_id, month, category_id, total, count in ExpenseMonthlyRollup.objects.values_list(
+            'user_id', 'month', 'category_id', 'total', 'count'
+        )
+    }
+
+
+def rebuild_rollups():
+    """Replace the rollup table with a fresh aggregate over the expenses"""
+    with transaction.atomic():
+        ExpenseMonthlyRollup.objects.all().delete()
+        ExpenseMonthlyRollup.objects.bulk_create(
+            [
+                ExpenseMonthlyRollup(
+                    user_id=user_id, month=month, category_id=category_id,
+                    total=total, count=count
+                )
+                for (user_id, month, category_id), (total, count) in live_rollups().items()
+            ],
+            batch_size=500,
+        )
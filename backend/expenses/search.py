@@ -0,0 +1,92 @@
+"""
+Full-text search over expenses and the text of their receipts.
+
+On SQLite, migration 0016 builds expenses_search, an FTS5 table with
+one row per expense (rowid = expense id). It holds the description,
+notes, location, tags, the OCR text and merchant of every receipt, and
+a viewers column with a u<id> token for each user in the expense's
+visibility rows. visibility.index_expenses writes the whole document
+whenever an expense's visibility rows are written, which every path
+creating an expense goes through, so each new expense is indexed once.
+Triggers on the expense and receipt tables keep the text in step after
+that, so bulk_update() and update() calls that bypass signals (the OCR
+and categorization workers use them) are covered too. A per-row trigger
+on the visibility table used to rewrite the document for every member.
+Tokens of deleted users are left behind, which is harmless as SQLite
+does not reuse their ids.
+
+Visibility is a term of the query itself: "viewers : u42 AND ..."
+intersects the user's doclist with the search terms inside the index,
+so a common word does not drag in the matches of every other user
+before they are filtered out. Results are ranked with bm25, weighted
+towards the description; the viewers column has no weight.
+
+Other databases have no FTS5, and search falls back to LIKE over the
+same text among the user's visible expenses, newest first.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+
+from .models import ExpenseReceipt
+from .visibility import visible_expenses
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_TERMS = 10
+
+# bm25 weights, in the table's column order
+WEIGHTS = {'description': 10.0, 'notes': 2.0, 'location': 3.0, 'tags': 5.0, 'receipts': 1.0, 'viewers': 0.0}
+
+_TERM = re.compile(r'\w+')
+
+SEARCH_SQL = f"""
+    SELECT rowid FROM expenses_search
+    WHERE expenses_search MATCH %s
+    ORDER BY bm25(expenses_search, {', '.join(map(str, WEIGHTS.values()))})
+    LIMIT %s
+"""
+
+
+def search_terms(query):
+    """The words of a user's query, lowercased; punctuation and FTS5 syntax are dropped"""
+    return [term.lower() for term in _TERM.findall(query)][:MAX_TERMS]
+
+
+def match_expression(user_id, terms):
+    """
+    FTS5 query for expenses user_id can see matching every term. Each
+    term is quoted, so none can be read as an operator; the last one
+    also matches as a prefix, for search as you type.
+    """
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    content = ' '.join(column for column in WEIGHTS if column != 'viewers')
+    return f'viewers : u{user_id} AND {{{content}}} : ({" ".join(quoted)})'
+
+
+def search_expense_ids(user, query, limit):
+    """Ids of up to limit expenses visible to user that match query, best first"""
+    terms = search_terms(query)
+    if not terms:
+        return []
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(SEARCH_SQL, [match_expression(user.pk, terms), limit])
+            return [expense_id for expense_id, in cursor.fetchall()]
+
+    matches = Q()
+    for term in terms:
+        in_receipts = ExpenseReceipt.objects.filter(
+            Q(ocr_text__icontains=term) | Q(extracted_merchant__icontains=term), expense=OuterRef('pk'),
+        )
+        matches &= (
+            Q(description__icontains=term) | Q(notes__icontains=term) | Q(location__icontains=term)
+            | Q(tags__icontains=term) | Q(Exists(in_receipts))
+        )
+    return list(
+        visible_expenses(user).filter(matches)
+        .order_by('-visible_date', '-visible_created_at', '-visible_id')
+        .values_list('id', flat=True)[:limit]
+    )
@@ -1,6 +1,9 @@
 from rest_framework import serializers
-from .models import ExpenseCategory, ExpenseGroup, Expense, ExpenseSplit, ExpenseReceipt
+from .models import ExpenseCategory, ExpenseGroup, Expense, ExpenseSplit, ExpenseReceipt, GroupBalance
+from .derivatives import derivative_url, render_derivatives
+from .uploads import StreamedImageField
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 
 User = get_user_model()
 
@@ -60,6 +63,8 @@ class ExpenseSerializer(serializers.ModelSerializer):
     # AI category detection
     ai_detected_category = serializers.CharField(read_only=True)
     ai_confidence = serializers.FloatField(read_only=True)
+    receipt_image = StreamedImageField(max_length=100, required=False, allow_null=True)
+    receipt_thumbnail = serializers.SerializerMethodField()
 
     class Meta:
         model = Expense
@@ -68,11 +73,21 @@ class ExpenseSerializer(serializers.ModelSerializer):
             'custom_category', 'date', 'time', 'location', 'group', 'group_id',
             'paid_by', 'paid_by_id', 'payment_method', 'payment_status',
             'split_type', 'is_split', 'ai_detected_category', 'ai_confidence',
-            'notes', 'receipt_image', 'tags', 'final_category', 'is_ai_detected',
+            'notes', 'receipt_image', 'receipt_thumbnail', 'tags', 'final_category', 'is_ai_detected',
             'created_at', 'updated_at', 'created_by'
         ]
         read_only_fields = ['created_at', 'updated_at', 'created_by']
 
+    def get_receipt_thumbnail(self, obj):
+        return derivative_url(obj.receipt_image.name, 'thumbnail', self.context.get('request'))
+
+    def save(self, **kwargs):
+        expense = super().save(**kwargs)
+        if self.validated_data.get('receipt_image'):
+            # Rendered once here, so reads only ever build the thumbnail's URL
+            render_derivatives(expense.receipt_image.name, ['thumbnail'])
+        return expense
+
     def create(self, validated_data):
         # Set the current user as creator and paid_by if not specified
         user = self.context['request'].user
@@ -140,6 +155,109 @@ class ExpenseSerializer(serializers.ModelSerializer):
         
         return super().update(instance, validated_data)
 
+class ExpenseListSerializer(serializers.BaseSerializer):
+    """
+    Read-only projection for the expense list, rendered from values() rows.
+
+    Related objects are returned as ids unless named in ?expand=, and
+    ?fields= limits the response to the listed fields. Everything is read
+    in the single list query, so no per-row queries are issued.
+    """
+    FIELDS = [
+        'id', 'description', 'amount', 'currency', 'category',
+        'custom_category', 'date', 'time', 'location', 'group',
+        'paid_by', 'payment_method', 'payment_status', 'split_type',
+        'is_split', 'ai_detected_category', 'ai_confidence', 'notes',
+        'receipt_image', 'receipt_thumbnail', 'tags', 'final_category', 'is_ai_detected',
+        'created_at', 'updated_at', 'created_by'
+    ]
+    # Related fields and the columns rendered when they are expanded
+    EXPANDABLE = {
+        'category': ['id', 'name', 'icon', 'color'],
+        'group': ['id', 'name', 'description'],
+        'paid_by': ['id', 'email', 'first_name', 'last_name'],
+        'created_by': ['id', 'email', 'first_name', 'last_name'],
+    }
+    # Computed fields and the columns they are derived from
+    DERIVED = {
+        'final_category': ['category__name', 'ai_detected_category', 'custom_category'],
+        'is_ai_detected': ['ai_detected_category'],
+        'receipt_thumbnail': ['receipt_image'],
+    }
+    # Sort key columns the cursor paginator reads from every row
+    SORT_KEY = ['visible_date', 'visible_created_at', 'visible_id']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        params = request.query_params if request is not None else {}
+        self.request = request
+        self.field_names = self._parse_list(params.get('fields'), self.FIELDS, 'fields') or self.FIELDS
+        self.expand = set(self._parse_list(params.get('expand'), self.EXPANDABLE, 'expand'))
+
+        self._amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+        self._datetime = serializers.DateTimeField()
+        self._renderers = [(name, self._renderer(name)) for name in self.field_names]
+
+    def _parse_list(self, raw, allowed, param):
+        names = [name.strip() for name in (raw or '').split(',') if name.strip()]
+        unknown = [name for name in names if name not in allowed]
+        if unknown:
+            raise serializers.ValidationError({param: [f"Unknown field: {name}" for name in unknown]})
+        return names
+
+    @property
+    def columns(self):
+        """Columns to pass to values() for the requested projection"""
+        columns = list(self.SORT_KEY)
+        for name in self.field_names:
+            if name in self.DERIVED:
+                columns.extend(self.DERIVED[name])
+            elif name in self.expand:
+                columns.extend(f'{name}__{column}' for column in self.EXPANDABLE[name])
+            elif name in self.EXPANDABLE:
+                columns.append(f'{name}_id')
+            else:
+                columns.append(name)
+        return list(dict.fromkeys(columns))
+
+    def values(self, queryset):
+        return queryset.values(*self.columns)
+
+    def _renderer(self, name):
+        if name in self.expand:
+            keys = [(column, f'{name}__{column}') for column in self.EXPANDABLE[name]]
+            return lambda row: (
+                {column: row[key] for column, key in keys} if row[f'{name}__id'] is not None else None
+            )
+        if name in self.EXPANDABLE:
+            key = f'{name}_id'
+            return lambda row: row[key]
+        if name == 'final_category':
+            return lambda row: row['category__name'] or row['ai_detected_category'] or row['custom_category']
+        if name == 'is_ai_detected':
+            return lambda row: bool(row['ai_detected_category'])
+        if name == 'amount':
+            return lambda row: self._amount.to_representation(row['amount'])
+        if name in ('created_at', 'updated_at'):
+            return lambda row: self._datetime.to_representation(row[name])
+        if name in ('date', 'time'):
+            return lambda row: row[name].isoformat() if row[name] is not None else None
+        if name == 'receipt_image':
+            return lambda row: self._file_url(row['receipt_image'])
+        if name == 'receipt_thumbnail':
+            return lambda row: derivative_url(row['receipt_image'], 'thumbnail', self.request)
+        return lambda row: row[name]
+
+    def _file_url(self, name):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        return self.request.build_absolute_uri(url) if self.request is not None else url
+
+    def to_representation(self, row):
+        return {name: render(row) for name, render in self._renderers}
+
 class ExpenseCreateSerializer(serializers.ModelSerializer):
     """Simplified serializer for creating expenses"""
     category_id = serializers.IntegerField(required=False)
@@ -207,18 +325,44 @@ class ExpenseSplitSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
 
+class GroupBalanceSerializer(serializers.ModelSerializer):
+    """Serializer for the net balance between two group members"""
+    debtor = UserSerializer(read_only=True)
+    creditor = UserSerializer(read_only=True)
+
+    class Meta:
+        model = GroupBalance
+        fields = ['id', 'debtor', 'creditor', 'amount', 'updated_at']
+
 class ExpenseReceiptSerializer(serializers.ModelSerializer):
     """Serializer for expense receipts"""
     expense = serializers.PrimaryKeyRelatedField(queryset=Expense.objects.all())
+    image = StreamedImageField(max_length=100)
+    thumbnail = serializers.SerializerMethodField()
+    likely_duplicate = serializers.SerializerMethodField()
 
     class Meta:
         model = ExpenseReceipt
         fields = [
-            'id', 'expense', 'image', 'ocr_text', 'extracted_amount',
-            'extracted_date', 'extracted_merchant', 'confidence_score', 'created_at'
+            'id', 'expense', 'image', 'thumbnail', 'ocr_text', 'extracted_amount',
+            'extracted_date', 'extracted_merchant', 'confidence_score',
+            'likely_duplicate', 'duplicate_of', 'created_at'
         ]
         read_only_fields = ['ocr_text', 'extracted_amount', 'extracted_date', 
-                           'extracted_merchant', 'confidence_score', 'created_at']
+                           'extracted_merchant', 'confidence_score', 'duplicate_of', 'created_at']
+
+    def get_thumbnail(self, obj):
+        return derivative_url(obj.image.name, 'thumbnail', self.context.get('request'))
+
+    def save(self, **kwargs):
+        receipt = super().save(**kwargs)
+        if 'image' in self.validated_data:
+            # The OCR derivative is left to the worker, which reads it
+            render_derivatives(receipt.image.name, ['thumbnail'])
+        return receipt
+
+    def get_likely_duplicate(self, obj):
+        return obj.duplicate_of_id is not None
 
 class AICategoryDetectionSerializer(serializers.Serializer):
     """Serializer for AI category detection requests"""
@@ -226,6 +370,14 @@ class AICategoryDetectionSerializer(serializers.Serializer):
     amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
     context = serializers.CharField(max_length=1000, required=False)
 
+class AICategoryBatchDetectionSerializer(serializers.Serializer):
+    """Serializer for batch AI category detection requests"""
+    descriptions = serializers.ListField(
+        child=serializers.CharField(max_length=500),
+        min_length=1,
+        max_length=500
+    )
+
 class AICategoryDetectionResponseSerializer(serializers.Serializer):
     """Serializer for AI category detection responses"""
     category = serializers.CharField(max_length=100)
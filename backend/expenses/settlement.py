@@ -0,0 +1,101 @@
+import heapq
+from decimal import Decimal
+
+from django.db.models import DecimalField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import ExpenseGroup, GroupBalance
+
+
+def _ledger_total(side):
+    """Correlated SUM of one side of the member's ledger rows in the group"""
+    return Coalesce(
+        Subquery(
+            GroupBalance.objects.filter(
+                group_id=OuterRef('expensegroup_id'), **{side: OuterRef('customuser_id')}
+            ).order_by().values(side).annotate(total=Sum('amount')).values('total'),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+        Decimal('0'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def member_positions(group):
+    """
+    Net position of everyone in the group's ledger: positive when the user
+    is owed money, negative when they owe.
+
+    Current members come from one aggregate query. Someone removed from the
+    group keeps the explicit splits they still owe or are owed, so when the
+    members' positions don't sum to zero the rest of the ledger is added by
+    user, and the positions always balance.
+    """
+    members = ExpenseGroup.members.through.objects.filter(expensegroup=group)
+    memberships = members.annotate(
+        credit=_ledger_total('creditor'),
+        debit=_ledger_total('debtor'),
+    ).values_list('customuser_id', 'credit', 'debit')
+    positions = {user_id: credit - debit for user_id, credit, debit in memberships}
+    if sum(positions.values()):
+        member_ids = members.values('customuser_id')
+        ledger = GroupBalance.objects.filter(group=group).order_by()
+        for side, sign in (('creditor_id', 1), ('debtor_id', -1)):
+            totals = (
+                ledger.exclude(**{f'{side}__in': member_ids})
+                .values_list(side).annotate(total=Sum('amount'))
+            )
+            for user_id, total in totals:
+                positions[user_id] = positions.get(user_id, Decimal('0')) + sign * total
+    return positions
+
+
+def settle(positions):
+    """
+    Turn net positions into a short list of (debtor_id, creditor_id, amount)
+    transfers that brings everyone to zero.
+
+    Exactly opposite positions are paired off first. The rest is matched
+    greedily, always settling the largest debtor against the largest
+    creditor from two heaps. Each transfer closes out at least one member,
+    so there are at most n - 1 transfers, found in O(n log n). Amounts are
+    Decimal throughout, so nothing is lost to rounding.
+    """
+    transfers = []
+
+    # Pair members whose positions cancel exactly; each match removes two at once
+    waiting = {}
+    remaining = []
+    for user_id, amount in sorted(positions.items()):
+        if not amount:
+            continue
+        match = waiting.get(-amount)
+        if match:
+            other = match.pop()
+            if not match:
+                del waiting[-amount]
+            if amount < 0:
+                transfers.append((user_id, other, -amount))
+            else:
+                transfers.append((other, user_id, amount))
+        else:
+            waiting.setdefault(amount, []).append(user_id)
+    for amount, user_ids in waiting.items():
+        remaining.extend((user_id, amount) for user_id in user_ids)
+
+    # Max-heaps keyed on the outstanding amount, ties broken by user id
+    creditors = [(-amount, user_id) for user_id, amount in remaining if amount > 0]
+    debtors = [(amount, user_id) for user_id, amount in remaining if amount < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    while creditors and debtors:
+        owed, creditor_id = heapq.heappop(creditors)
+        owes, debtor_id = heapq.heappop(debtors)
+        amount = min(-owed, -owes)
+        transfers.append((debtor_id, creditor_id, amount))
+        if -owed > amount:
+            heapq.heappush(creditors, (owed + amount, creditor_id))
+        if -owes > amount:
+            heapq.heappush(debtors, (owes + amount, debtor_id))
+    return transfers
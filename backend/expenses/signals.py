@@ -0,0 +1,142 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .category_mappings import mapping_cache, remember_category
+from .ledger import apply_balance_deltas, expense_obligations, group_obligations, subtract
+from .models import Expense, ExpenseCategory, ExpenseGroup, ExpenseSplit
+from .rollups import merge_category_rollups
+from .visibility import refresh_membership_visibility, refresh_visibility, remove_visibility
+
+
+def _deletion(origin):
+    """
+    State shared by the signals of one delete() call, kept on its origin:
+    the expenses it deletes, and for each other expense losing splits,
+    its obligations before and how many of its splits are left. The
+    collector sends every pre_delete before deleting any row.
+    """
+    return origin.__dict__.setdefault('_deletion', {'expenses': set(), 'splits': {}})
+
+
+@receiver(pre_save, sender=Expense)
+def expense_saving(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._obligations_before = expense_obligations([instance.pk]) if instance.pk else {}
+
+
+@receiver(post_save, sender=Expense)
+def expense_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_visibility([instance.pk])
+    apply_balance_deltas(subtract(
+        expense_obligations([instance.pk]), getattr(instance, '_obligations_before', {})
+    ))
+    remember_category(instance)
+
+
+@receiver(pre_delete, sender=Expense)
+def expense_deleting(sender, instance, origin=None, **kwargs):
+    _deletion(origin)['expenses'].add(instance.pk)
+    # The cascade would drop the visibility rows without touching the rollups
+    remove_visibility([instance.pk])
+    apply_balance_deltas(subtract({}, expense_obligations([instance.pk])))
+
+
+@receiver(pre_save, sender=ExpenseSplit)
+def split_saving(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance._obligations_before = expense_obligations([instance.expense_id])
+
+
+@receiver(post_save, sender=ExpenseSplit)
+def split_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        apply_balance_deltas(subtract(
+            expense_obligations([instance.expense_id]), instance._obligations_before
+        ))
+
+
+@receiver(pre_delete, sender=ExpenseSplit)
+def split_deleting(sender, instance, origin=None, **kwargs):
+    splits = _deletion(origin)['splits']
+    if instance.expense_id not in splits:
+        splits[instance.expense_id] = [expense_obligations([instance.expense_id]), 0]
+    splits[instance.expense_id][1] += 1
+
+
+@receiver(post_delete, sender=ExpenseSplit)
+def split_deleted(sender, instance, origin=None, **kwargs):
+    deletion = _deletion(origin)
+    pending = deletion['splits'][instance.expense_id]
+    pending[1] -= 1
+    if pending[1]:
+        return
+    # The last split of this expense in the batch is gone; apply the change once
+    del deletion['splits'][instance.expense_id]
+    if instance.expense_id in deletion['expenses']:
+        # expense_deleting already took all of its obligations out
+        return
+    apply_balance_deltas(subtract(
+        expense_obligations([instance.expense_id]), pending[0]
+    ))
+
+
+def _changed_memberships(instance, action, reverse, pk_set):
+    """The (group ids, user ids) whose membership the change touches"""
+    changed = instance._cleared_ids if action.endswith('_clear') else list(pk_set or [])
+    if reverse:
+        return changed, [instance.pk]
+    return [instance.pk], changed
+
+
+@receiver(m2m_changed, sender=ExpenseGroup.members.through)
+def group_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # Clear sends no pk_set and the memberships are gone by post_clear
+        related = instance.member_groups if reverse else instance.members
+        instance._cleared_ids = list(related.values_list('id', flat=True))
+
+    group_ids, user_ids = _changed_memberships(instance, action, reverse, pk_set)
+    if action.startswith('pre_'):
+        # Equal shares depend on the member count, so snapshot them first
+        instance._obligations_before = group_obligations(group_ids)
+        return
+
+    # Only the users joining or leaving see different expenses; everyone
+    # else's visibility rows and rollups stay as they are
+    refresh_membership_visibility(group_ids, user_ids)
+    apply_balance_deltas(subtract(group_obligations(group_ids), instance._obligations_before))
+    # Membership is part of the group payload and its conditional-GET version
+    ExpenseGroup.objects.filter(pk__in=group_ids).update(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=ExpenseGroup)
+def group_deleting(sender, instance, **kwargs):
+    # Deleting a group nulls Expense.group with a bulk UPDATE, so post_save
+    # never fires for its expenses; remember them for post_delete.
+    instance._expense_ids = list(instance.expense_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=ExpenseGroup)
+def group_deleted(sender, instance, origin=None, **kwargs):
+    # Expenses deleted by the same call (a creator's own, when deleting the
+    # creator removes the group) are still in the table but already out of
+    # the visibility rows; refreshing them would bring those back
+    deleted = _deletion(origin)['expenses']
+    refresh_visibility([pk for pk in getattr(instance, '_expense_ids', []) if pk not in deleted])
+
+
+@receiver(pre_delete, sender=ExpenseCategory)
+def category_deleting(sender, instance, **kwargs):
+    merge_category_rollups(instance.pk)
+
+
+@receiver(post_save, sender=ExpenseCategory)
+@receiver(post_delete, sender=ExpenseCategory)
+def category_changed(sender, instance, raw=False, **kwargs):
+    # Learned mappings are cached by category name
+    if not raw:
+        mapping_cache.clear()
@@ -0,0 +1,241 @@
+"""
+Importing bank and card statements exported as CSV.
+
+The file is read through csv.reader one line at a time and never held in
+memory. A profile says which columns hold the date, description and
+amount, and which date formats to try. The amount is either one column,
+with spending positive or negative, or separate debit and credit
+columns. STATEMENT_PROFILES in settings adds profiles or replaces the
+built-in ones. Only spending becomes an expense: credits and zero
+amounts are skipped, and rows that do not parse are skipped and reported
+by line number.
+
+Rows become expenses CHUNK_SIZE at a time. Each chunk is categorized by
+the cheap tiers over its distinct descriptions (the user's history, the
+detection cache and the keyword index) and saved as plain rows with
+bulk.save_expense_rows. Whatever those tiers cannot answer is queued for the
+categorize_expenses worker, like any new expense.
+
+Each chunk is its own transaction, so a long import holds the database
+write lock for one chunk at a time. When the caller names a checkpoint,
+keyed by the user and the file's SHA-256 (checkpoint_name), the CSV
+line the chunk ended on is saved as a BackfillCheckpoint in the same
+transaction. Importing the same file again, after a crash or a dropped
+connection, starts after the last committed chunk; a file already
+imported in full adds nothing.
+"""
+import csv
+import hashlib
+import io
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+
+from .bulk import save_expense_rows
+from .detection import detect_known
+from .models import BackfillCheckpoint, Expense
+
+CHUNK_SIZE = 2000
+# The columns import_chunk fills; the rest take their defaults
+EXPENSE_FIELDS = (
+    'description', 'amount', 'date', 'paid_by_id', 'created_by_id', 'ai_detected_category', 'ai_confidence',
+)
+# Unparseable rows reported back; the rest are only counted
+MAX_ERRORS = 100
+
+DEFAULT_PROFILES = {
+    # Card statements list purchases as positive amounts and payments as negative ones
+    'card': {
+        'date': 'Date',
+        'description': 'Description',
+        'amount': 'Amount',
+        'spending': 'positive',
+        'date_formats': ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y'],
+    },
+    # Bank account statements with separate withdrawal and deposit columns
+    'bank': {
+        'date': 'Date',
+        'description': 'Narration',
+        'debit': 'Withdrawal',
+        'credit': 'Deposit',
+        'date_formats': ['%d/%m/%Y', '%d/%m/%y', '%d-%m-%Y', '%Y-%m-%d'],
+    },
+}
+
+DESCRIPTION_LENGTH = Expense._meta.get_field('description').max_length
+MAX_AMOUNT = Decimal(10) ** 8
+CENT = Decimal('0.01')
+
+
+class StatementError(ValueError):
+    """The statement cannot be imported at all, e.g. a column the profile needs is missing"""
+
+
+def profiles():
+    return {**DEFAULT_PROFILES, **getattr(settings, 'STATEMENT_PROFILES', {})}
+
+
+def get_profile(name):
+    try:
+        return profiles()[name]
+    except KeyError:
+        raise StatementError(f"Unknown statement profile '{name}'.") from None
+
+
+def file_digest(stream):
+    """SHA-256 of a binary file, read in blocks; the file is rewound afterwards"""
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(1024 * 1024), b''):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def checkpoint_name(user, digest):
+    """Checkpoint of one user's import of the file with this SHA-256"""
+    return f'statement:{user.pk}:{digest}'
+
+
+def text_lines(stream):
+    """Text lines of a binary file, decoded as it is read; a UTF-8 byte order mark is dropped"""
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+
+
+class _Row:
+    """Reads the fields a profile names out of one CSV row"""
+
+    def __init__(self, header, profile):
+        names = {name.strip().lower(): index for index, name in enumerate(header)}
+        self.columns = {}
+        fields = ['date', 'description'] + (['amount'] if 'amount' in profile else ['debit', 'credit'])
+        for field in fields:
+            column = profile[field]
+            if column.strip().lower() not in names:
+                raise StatementError(f"The statement has no '{column}' column.")
+            self.columns[field] = names[column.strip().lower()]
+        self.sign = -1 if profile.get('spending') == 'negative' else 1
+        self.formats = list(profile['date_formats'])
+
+    def get(self, row, field):
+        index = self.columns[field]
+        return row[index].strip() if index < len(row) else ''
+
+    def date(self, row):
+        text = self.get(row, 'date')
+        for position, date_format in enumerate(self.formats):
+            try:
+                day = datetime.strptime(text, date_format).date()
+            except ValueError:
+                continue
+            if position:
+                # A statement sticks to one format; try it first from now on
+                self.formats.insert(0, self.formats.pop(position))
+            return day
+        raise ValueError(f"Unrecognized date '{text}'.")
+
+    def amount(self, row):
+        """The amount spent, or None for a credit"""
+        if 'amount' in self.columns:
+            amount = self.sign * _decimal(self.get(row, 'amount'))
+        else:
+            debit = self.get(row, 'debit')
+            amount = _decimal(debit) if debit else -_decimal(self.get(row, 'credit') or '0')
+        return amount if amount > 0 else None
+
+
+def _decimal(text):
+    try:
+        return Decimal(text.replace(',', ''))
+    except InvalidOperation:
+        raise ValueError(f"Unrecognized amount '{text}'.") from None
+
+
+def parse_statement(lines, profile, stats, errors, after=0):
+    """
+    Yield (line, date, description, amount) for every spending row of
+    the CSV lines past line number after. Rows skipped are counted in
+    stats; the unparseable ones are also added to errors as {'line':
+    number, 'error': message}.
+    """
+    reader = csv.reader(lines, delimiter=profile.get('delimiter', ','))
+    header = next(reader, None)
+    if header is None:
+        raise StatementError('The statement is empty.')
+    fields = _Row(header, profile)
+
+    for row in reader:
+        if reader.line_num <= after or not any(row):
+            continue
+        try:
+            day = fields.date(row)
+            amount = fields.amount(row)
+            description = fields.get(row, 'description')[:DESCRIPTION_LENGTH]
+            if not description:
+                raise ValueError('Missing description.')
+            if amount is not None and amount >= MAX_AMOUNT:
+                raise ValueError(f'Amount {amount} is too large.')
+        except ValueError as error:
+            stats['invalid'] += 1
+            if len(errors) < MAX_ERRORS:
+                errors.append({'line': reader.line_num, 'error': str(error)})
+            continue
+        amount = amount and amount.quantize(CENT)
+        if not amount:
+            stats['credits'] += 1
+            continue
+        yield reader.line_num, day, description, amount
+
+
+def import_chunk(user, rows):
+    """Save one chunk of parsed rows as the user's expenses; returns the number categorized"""
+    detections = detect_known((description for _, _, description, _ in rows), user=user)
+    expenses = []
+    for _, day, description, amount in rows:
+        detection = detections.get(description)
+        expenses.append((
+            description, amount, day, user.pk, user.pk,
+            detection.category if detection else '',
+            round(detection.confidence, 4) if detection else None,
+        ))
+    save_expense_rows(EXPENSE_FIELDS, expenses)
+    return sum(1 for expense in expenses if expense[5])
+
+
+def import_statement(user, lines, profile, chunk_size=CHUNK_SIZE, progress=None, checkpoint=None):
+    """
+    Import the spending rows of a CSV statement as the user's expenses,
+    committing them a chunk at a time. Returns a dict of counts and the
+    list of row errors; resumed_after is the line a previous run under
+    the same checkpoint name had committed. progress, if given, is
+    called with the counts after every chunk.
+    """
+    after = 0
+    if checkpoint:
+        after = (
+            BackfillCheckpoint.objects.filter(name=checkpoint).values_list('position', flat=True).first() or 0
+        )
+    stats = {'imported': 0, 'categorized': 0, 'queued': 0, 'credits': 0, 'invalid': 0, 'resumed_after': after}
+    errors = []
+    chunk = []
+
+    def flush():
+        with transaction.atomic():
+            categorized = import_chunk(user, chunk)
+            if checkpoint:
+                BackfillCheckpoint.objects.update_or_create(name=checkpoint, defaults={'position': chunk[-1][0]})
+        stats['imported'] += len(chunk)
+        stats['categorized'] += categorized
+        stats['queued'] += len(chunk) - categorized
+        chunk.clear()
+        if progress:
+            progress(stats)
+
+    for row in parse_statement(lines, profile, stats, errors, after):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return stats, errors
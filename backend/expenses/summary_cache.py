@@ -0,0 +1,62 @@
+"""
+Per-user cache of the summary payload.
+
+The payload is stored under a key built from the summary's version
+(conditional.summary_version), which is read from the database on every
+request: the user's visibility rows, groups, categories and ledger rows,
+and today's date. Any change that could alter the summary changes that
+version, so a stale payload is never read again and simply ages out
+with the timeout. Nothing has to be invalidated, and every process
+agrees on what is current whatever the cache backend; a shared one
+(file, Memcached, Redis) only adds hits across processes and makes the
+counters global.
+"""
+import hashlib
+
+from django.core.cache import cache
+
+SUMMARY_TIMEOUT = 60 * 60 * 24
+KEY_PREFIX = 'expenses:summary'
+HITS_KEY = f'{KEY_PREFIX}:hits'
+MISSES_KEY = f'{KEY_PREFIX}:misses'
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # incr() fails on a missing key; add() keeps a racing first write
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def cached_summary(user, version, compute):
+    """
+    Return the user's summary from the cache, calling compute() to fill it
+    on a miss. version is the summary_version() token of this request.
+    """
+    key = ':'.join([KEY_PREFIX, str(user.pk), hashlib.sha256(version.encode()).hexdigest()[:32]])
+    summary = cache.get(key)
+    if summary is not None:
+        _count(HITS_KEY)
+        return summary
+
+    _count(MISSES_KEY)
+    summary = compute()
+    cache.set(key, summary, timeout=SUMMARY_TIMEOUT)
+    return summary
+
+
+def summary_cache_stats():
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else None,
+    }
+
+
+def reset_summary_cache_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,2117 @@
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from functools import partial
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image, ImageDraw
+from rest_framework.test import APIClient
+
+from . import statements
+from .categorization import keyword_category, match_keywords
+from .categorization_jobs import enqueue_categorization, process_batch
+from .category_mappings import learned_categories, learned_category, mapping_cache, mapping_key
+from .derivatives import derivative_name, ensure_derivatives, render_derivatives
+from .detection_cache import DetectionCache, detection_cache, detection_key
+from .imaging import dhash
+from .jobs import CLAIM_LEASE, MAX_ATTEMPTS, claim_jobs
+from .ledger import rebuild_balances
+from .ocr import parse_receipt
+from .ollama import CircuitOpen, OllamaClient, OllamaError, QueueTimeout
+from .models import (
+    BackfillCheckpoint, CategorizationJob, Expense, ExpenseCategory, ExpenseGroup, ExpenseMonthlyRollup,
+    ExpenseReceipt, ExpenseSplit, ExpenseVisibility, GroupBalance, ReceiptOCRJob, UserCategoryMapping,
+)
+from .pagination import ExpenseCursorPagination
+from .receipt_duplicates import MAX_DISTANCE, distance, hash_fields
+from .receipt_jobs import process_batch as process_receipt_batch
+from .serializers import ExpenseListSerializer
+from .uploads import ReceiptUploadHandler, ReceiptUploadThrottle, StatementImportThrottle, StatementUploadHandler
+from .summary_cache import summary_cache_stats
+from .visibility import rebuild_visibility, visible_expenses
+
+User = get_user_model()
+
+
+class ExpenseQueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on every query an endpoint issues and fails on
+    full table scans or temp B-tree sorts, so a missing index or a filter
+    that falls off the visibility table shows up as a test failure.
+    """
+    # "SCAN t" alone is a full table scan; "SCAN t USING [COVERING] INDEX" is an ordered index walk
+    FULL_SCAN = re.compile(r'^SCAN (?!.*\bUSING (COVERING )?INDEX\b)')
+    TEMP_SORT = re.compile(r'USE TEMP B-TREE')
+    # Full-text search: MATCH is answered from the FTS5 index, and ranking
+    # by bm25 has to sort the matches, as no index can hold a score
+    FTS_SEARCH = (re.compile(r'\bFROM expenses_search\b'), re.compile(r'VIRTUAL TABLE INDEX \d+:M|USE TEMP B-TREE FOR ORDER BY'))
+    # A user's groups are found through the membership table but ordered by
+    # the group's created_at, so no one index serves both; the sort is over
+    # the handful of groups that user belongs to
+    USER_GROUPS = (
+        re.compile(r'FROM "expenses_expensegroup" INNER JOIN "expenses_expensegroup_members"'),
+        re.compile(r'^USE TEMP B-TREE FOR ORDER BY$'),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass',
+            first_name='Owner', last_name='User'
+        )
+        cls.friend = User.objects.create_user(
+            username='friend', email='friend@example.com', password='pass',
+            first_name='Friend', last_name='User'
+        )
+        cls.food = ExpenseCategory.objects.create(name='Food')
+        cls.travel = ExpenseCategory.objects.create(name='Travel')
+        cls.group = ExpenseGroup.objects.create(name='Trip', created_by=cls.user)
+        cls.group.members.add(cls.user, cls.friend)
+
+        today = date.today()
+        for i in range(30):
+            Expense.objects.create(
+                description=f'Expense {i}',
+                amount=10 + i,
+                date=today - timedelta(days=i),
+                category=cls.food if i % 2 else cls.travel,
+                group=cls.group if i % 3 else None,
+                paid_by=cls.friend if i % 5 == 0 else cls.user,
+                created_by=cls.user,
+                is_split=bool(i % 3),
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexedQueries(self, url, allowed=()):
+        """allowed holds (sql pattern, plan step pattern) pairs of known, commented exceptions"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+
+        problems = []
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            # The SQLite backend captures SQL with its parameters quoted inline
+            for step in self.plan(sql):
+                if any(query.search(sql) and expected.search(step) for query, expected in allowed):
+                    continue
+                if self.FULL_SCAN.search(step) or self.TEMP_SORT.search(step):
+                    problems.append(f'{step}\n    in: {sql}')
+        self.assertFalse(problems, f'{url}:\n' + '\n'.join(problems))
+        return response
+
+    def test_list(self):
+        self.assertIndexedQueries('/api/expenses/expenses/')
+
+    def test_list_next_page(self):
+        response = self.assertIndexedQueries('/api/expenses/expenses/?page_size=5')
+        self.assertIndexedQueries(response.json()['next'])
+
+    def test_list_expanded(self):
+        self.assertIndexedQueries('/api/expenses/expenses/?expand=category,group,paid_by,created_by')
+
+    def test_list_by_category_id(self):
+        self.assertIndexedQueries(f'/api/expenses/expenses/?category_id={self.food.id}')
+
+    def test_list_by_category_name(self):
+        self.assertIndexedQueries('/api/expenses/expenses/?category=Food')
+
+    def test_list_by_group_id(self):
+        self.assertIndexedQueries(f'/api/expenses/expenses/?group_id={self.group.id}')
+
+    def test_list_by_group_name(self):
+        self.assertIndexedQueries('/api/expenses/expenses/?group=Trip')
+
+    def test_list_by_date_range(self):
+        start = date.today() - timedelta(days=10)
+        self.assertIndexedQueries(
+            f'/api/expenses/expenses/?start_date={start}&end_date={date.today()}'
+        )
+
+    def test_list_by_category_and_date_range(self):
+        start = date.today() - timedelta(days=10)
+        self.assertIndexedQueries(
+            f'/api/expenses/expenses/?category_id={self.food.id}&start_date={start}'
+        )
+
+    def test_retrieve(self):
+        expense = Expense.objects.filter(group=self.group).first()
+        self.assertIndexedQueries(f'/api/expenses/expenses/{expense.id}/')
+
+    def test_summary(self):
+        self.assertIndexedQueries('/api/expenses/expenses/summary/')
+
+    def test_categories(self):
+        self.assertIndexedQueries('/api/expenses/categories/')
+
+    def test_groups(self):
+        self.assertIndexedQueries('/api/expenses/groups/', [self.USER_GROUPS])
+
+    def test_group_balances(self):
+        self.assertIndexedQueries(f'/api/expenses/groups/{self.group.id}/balances/')
+
+    def test_search(self):
+        response = self.assertIndexedQueries('/api/expenses/expenses/search/?q=expense', [self.FTS_SEARCH])
+        self.assertEqual(len(response.json()['results']), 20)
+
+    def test_group_settle_up(self):
+        response = self.assertIndexedQueries(f'/api/expenses/groups/{self.group.id}/settle-up/')
+        data = response.json()
+        positions = {int(user_id): Decimal(amount) for user_id, amount in data['positions'].items()}
+        self.assertTrue(any(positions.values()))
+
+        # Applying the transfers must bring every member to exactly zero
+        for transfer in data['transfers']:
+            amount = Decimal(transfer['amount'])
+            positions[transfer['from_user']] += amount
+            positions[transfer['to_user']] -= amount
+        self.assertFalse(any(positions.values()), positions)
+
+    def test_timeseries(self):
+        response = self.assertIndexedQueries('/api/expenses/expenses/timeseries/?interval=week')
+        data = response.json()
+        self.assertEqual(len(data['buckets']), len(data['totals']))
+        self.assertEqual(sum(data['counts']), 30)
+
+    def test_timeseries_by_category(self):
+        response = self.assertIndexedQueries(
+            '/api/expenses/expenses/timeseries/?interval=day&by=category'
+        )
+        series = {row['name']: row for row in response.json()['series']}
+        self.assertEqual(sum(series['Food']['counts']), 15)
+        self.assertEqual(sum(series['Food']['totals']), sum(10 + i for i in range(1, 30, 2)))
+
+
+class ExpenseListFieldsTests(TestCase):
+    """The list projection: ?fields= picks fields, ?expand= inlines related objects"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass', first_name='Owner', last_name='User'
+        )
+        cls.food = ExpenseCategory.objects.create(name='Food', icon='🍔', color='#f00')
+        cls.group = ExpenseGroup.objects.create(name='Trip', description='Goa', created_by=cls.user)
+        cls.group.members.add(cls.user)
+        today = date.today()
+        cls.filed = Expense.objects.create(
+            description='Dinner', amount=Decimal('12.50'), date=today, category=cls.food, group=cls.group,
+            ai_detected_category='Entertainment', paid_by=cls.user, created_by=cls.user,
+        )
+        cls.detected = Expense.objects.create(
+            description='Movie', amount=8, date=today - timedelta(days=1), ai_detected_category='Entertainment',
+            custom_category='Fun', paid_by=cls.user, created_by=cls.user,
+        )
+        cls.custom = Expense.objects.create(
+            description='Gift', amount=5, date=today - timedelta(days=2), custom_category='Presents',
+            paid_by=cls.user, created_by=cls.user,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def results(self, query):
+        response = self.client.get(f'/api/expenses/expenses/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def test_every_field_by_default_with_related_ids(self):
+        row = self.results('')[0]
+        self.assertEqual(list(row), ExpenseListSerializer.FIELDS)
+        self.assertEqual(
+            (row['id'], row['amount'], row['category'], row['group'], row['paid_by'], row['created_by']),
+            (self.filed.pk, '12.50', self.food.pk, self.group.pk, self.user.pk, self.user.pk),
+        )
+        self.assertIsNone(row['receipt_thumbnail'])
+
+    def test_fields_limit_and_order_the_response(self):
+        rows = self.results('fields=amount, description')
+        self.assertEqual(rows[0], {'amount': '12.50', 'description': 'Dinner'})
+        self.assertEqual(list(rows[0]), ['amount', 'description'])
+
+    def test_unknown_names_are_rejected(self):
+        response = self.client.get('/api/expenses/expenses/?fields=id,password,visibility')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': ['Unknown field: password', 'Unknown field: visibility']})
+        response = self.client.get('/api/expenses/expenses/?expand=notes')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'expand': ['Unknown field: notes']})
+
+    def test_derived_fields(self):
+        rows = self.results('fields=description,final_category,is_ai_detected')
+        self.assertEqual(rows, [
+            # The chosen category beats the AI's guess, which beats free text
+            {'description': 'Dinner', 'final_category': 'Food', 'is_ai_detected': True},
+            {'description': 'Movie', 'final_category': 'Entertainment', 'is_ai_detected': True},
+            {'description': 'Gift', 'final_category': 'Presents', 'is_ai_detected': False},
+        ])
+
+    def test_expanded_relations(self):
+        rows = self.results('fields=category,group,paid_by&expand=category,group,paid_by')
+        user = {'id': self.user.pk, 'email': 'owner@example.com', 'first_name': 'Owner', 'last_name': 'User'}
+        self.assertEqual(rows[0], {
+            'category': {'id': self.food.pk, 'name': 'Food', 'icon': '🍔', 'color': '#f00'},
+            'group': {'id': self.group.pk, 'name': 'Trip', 'description': 'Goa'},
+            'paid_by': user,
+        })
+        self.assertEqual(rows[1], {'category': None, 'group': None, 'paid_by': user})
+
+        # Expanding a field that is not requested adds nothing
+        self.assertEqual(self.results('fields=id&expand=category')[0], {'id': self.filed.pk})
+
+
+class ExpenseCursorPaginationTests(TestCase):
+    """Keyset pages over (-date, -created_at, id), with a signed cursor"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass'
+        )
+        today = date.today()
+        # Every expense on a day shares created_at too, so only the id breaks ties
+        stamp = timezone.now()
+        with mock.patch('django.utils.timezone.now', return_value=stamp):
+            for day, count in [(today, 7), (today - timedelta(days=1), 4)]:
+                for i in range(count):
+                    Expense.objects.create(
+                        description=f'{day} #{i}', amount=10, date=day, paid_by=cls.user, created_by=cls.user
+                    )
+        cls.expected = list(Expense.objects.order_by('-date', 'id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        return [row['id'] for row in body['results']], body['next']
+
+    def test_pages_through_ties_without_gaps_or_duplicates(self):
+        for page_size in (1, 3, 5, 11):
+            seen, url = [], f'/api/expenses/expenses/?fields=id&page_size={page_size}'
+            while url:
+                ids, url = self.page(url)
+                self.assertLessEqual(len(ids), page_size)
+                seen.extend(ids)
+            self.assertEqual(seen, self.expected, page_size)
+
+    def test_page_size_is_clamped(self):
+        with mock.patch.object(ExpenseCursorPagination, 'max_page_size', 4):
+            ids, next_url = self.page('/api/expenses/expenses/?page_size=100')
+        self.assertEqual(ids, self.expected[:4])
+        self.assertIsNotNone(next_url)
+        # Nonsense falls back to the default size
+        for page_size in ('0', '-3', 'many'):
+            with mock.patch.object(ExpenseCursorPagination, 'page_size', 2):
+                ids, _ = self.page(f'/api/expenses/expenses/?page_size={page_size}')
+            self.assertEqual(ids, self.expected[:2], page_size)
+
+    def test_tampered_or_unsigned_cursors_are_not_found(self):
+        _, next_url = self.page('/api/expenses/expenses/?page_size=2')
+        cursor = parse_qs(urlparse(next_url).query)['cursor'][0]
+        position = signing.loads(cursor, salt=ExpenseCursorPagination.signing_salt)
+        position[2] = self.expected[-1]
+        for forged in [
+            cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B'),
+            signing.dumps(position, salt=ExpenseCursorPagination.signing_salt).split(':')[0],
+            signing.dumps(position, salt='another.salt'),
+            signing.dumps(['not a date', position[1], position[2]], salt=ExpenseCursorPagination.signing_salt),
+            'garbage',
+        ]:
+            response = self.client.get('/api/expenses/expenses/', {'cursor': forged})
+            self.assertEqual(response.status_code, 404, forged)
+
+
+class GroupLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.payer, cls.first, cls.second, cls.late = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='pass')
+            for name in ['payer', 'first', 'second', 'late']
+        ]
+        # Created by someone outside it: deleting a group's creator deletes the group
+        cls.group = ExpenseGroup.objects.create(name='Flat', created_by=cls.late)
+        cls.group.members.add(cls.payer, cls.first, cls.second)
+
+    def expense(self, amount=300, paid_by=None, **fields):
+        paid_by = paid_by or self.payer
+        return Expense.objects.create(
+            description='Groceries', amount=amount, date=date.today(), group=self.group,
+            paid_by=paid_by, created_by=paid_by, **fields
+        )
+
+    def split(self, expense, user, amount, **fields):
+        return ExpenseSplit.objects.create(expense=expense, user=user, amount=amount, **fields)
+
+    def ledger(self):
+        return {
+            (row.debtor.username, row.creditor.username): row.amount
+            for row in GroupBalance.objects.select_related('debtor', 'creditor')
+        }
+
+    def assertLedger(self, expected):
+        """The maintained ledger is expected and is what a rebuild from scratch produces"""
+        expected = {pair: Decimal(amount) for pair, amount in expected.items()}
+        self.assertEqual(self.ledger(), expected)
+        rebuild_balances()
+        self.assertEqual(self.ledger(), expected)
+
+    def test_splits_follow_create_edit_pay_and_delete(self):
+        expense = self.expense()
+        first = self.split(expense, self.first, 100)
+        second = self.split(expense, self.second, 120)
+        self.assertLedger({('first', 'payer'): 100, ('second', 'payer'): 120})
+
+        first.amount = 150
+        first.save()
+        self.assertLedger({('first', 'payer'): 150, ('second', 'payer'): 120})
+
+        second.is_paid = True
+        second.save()
+        self.assertLedger({('first', 'payer'): 150})
+
+        first.delete()
+        self.assertLedger({})
+
+    def test_opposite_debts_net_into_one_row(self):
+        self.split(self.expense(), self.first, 100)
+        self.split(self.expense(paid_by=self.first), self.payer, 40)
+        self.assertLedger({('first', 'payer'): 60})
+
+        self.split(self.expense(paid_by=self.first), self.payer, 90)
+        self.assertLedger({('payer', 'first'): 30})
+
+    def test_expense_edits_and_deletes(self):
+        expense = self.expense()
+        self.split(expense, self.first, 100)
+        self.split(self.expense(), self.second, 50)
+
+        expense.paid_by = self.second
+        expense.save()
+        self.assertLedger({('first', 'second'): 100, ('second', 'payer'): 50})
+
+        expense.delete()
+        self.assertLedger({('second', 'payer'): 50})
+
+    def test_equal_shares_follow_membership(self):
+        self.expense(amount=300, is_split=True)
+        self.assertLedger({('first', 'payer'): 100, ('second', 'payer'): 100})
+
+        self.group.members.add(self.late)
+        self.assertLedger({('first', 'payer'): 75, ('second', 'payer'): 75, ('late', 'payer'): 75})
+
+        self.late.member_groups.remove(self.group)
+        self.group.members.remove(self.second)
+        self.assertLedger({('first', 'payer'): 150})
+
+        self.group.members.clear()
+        self.assertLedger({})
+
+    def test_rebuild_command_repairs_the_ledger(self):
+        self.split(self.expense(), self.first, 100)
+        GroupBalance.objects.update(amount=1)
+        GroupBalance.objects.create(group=self.group, debtor=self.second, creditor=self.payer, amount=5)
+
+        out = io.StringIO()
+        call_command('rebuild_group_balances', stdout=out)
+        self.assertIn('1 rows', out.getvalue())
+        self.assertEqual(self.ledger(), {('first', 'payer'): Decimal(100)})
+
+    def test_balances_endpoint_lists_the_groups_ledger(self):
+        self.split(self.expense(), self.first, 100)
+        self.split(self.expense(paid_by=self.second), self.first, 30)
+        client = APIClient()
+        client.force_authenticate(self.first)
+        response = client.get(f'/api/expenses/groups/{self.group.pk}/balances/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['debtor']['email'], row['creditor']['email'], row['amount'])
+             for row in response.json()],
+            [('first@example.com', 'payer@example.com', '100.00'),
+             ('first@example.com', 'second@example.com', '30.00')],
+        )
+
+        client.force_authenticate(self.late)
+        response = client.get(f'/api/expenses/groups/{self.group.pk}/balances/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_deleting_several_splits_at_once_applies_them_once(self):
+        expense = self.expense()
+        self.split(expense, self.first, 100)
+        self.split(expense, self.second, 100)
+        ExpenseSplit.objects.filter(expense=expense).delete()
+        self.assertLedger({})
+
+    def test_deleting_a_user_removes_their_expenses_and_splits_once(self):
+        expense = self.expense()
+        self.split(expense, self.first, 100)
+        self.split(expense, self.second, 100)
+        other = self.expense(paid_by=self.first)
+        self.split(other, self.second, 50)
+        self.payer.delete()
+        self.assertLedger({('second', 'first'): 50})
+
+    def test_settle_up_keeps_removed_members_who_still_owe(self):
+        self.split(self.expense(), self.first, 100)
+        self.split(self.expense(paid_by=self.second), self.payer, 40)
+        self.group.members.remove(self.first)
+        self.assertLedger({('first', 'payer'): 100, ('payer', 'second'): 40})
+
+        client = APIClient()
+        client.force_authenticate(self.payer)
+        response = client.get(f'/api/expenses/groups/{self.group.pk}/settle-up/')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(
+            {int(user_id): Decimal(amount) for user_id, amount in body['positions'].items()},
+            {self.payer.pk: Decimal(60), self.second.pk: Decimal(40), self.first.pk: Decimal(-100)},
+        )
+        self.assertEqual(
+            sorted((row['from_user'], row['to_user'], Decimal(row['amount'])) for row in body['transfers']),
+            sorted([(self.first.pk, self.payer.pk, Decimal(60)), (self.first.pk, self.second.pk, Decimal(40))]),
+        )
+
+
+class ExpenseVisibilityTests(TestCase):
+    """Who sees an expense follows its edits and its group, and matches a rebuild"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.friend, cls.late = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='pass')
+            for name in ['owner', 'friend', 'late']
+        ]
+        cls.group = ExpenseGroup.objects.create(name='Trip', created_by=cls.owner)
+        cls.group.members.add(cls.owner, cls.friend)
+
+    def expense(self, description, group=None, user=None):
+        user = user or self.owner
+        return Expense.objects.create(
+            description=description, amount=10, date=date.today(), group=group, paid_by=user, created_by=user
+        )
+
+    def visible(self):
+        return {
+            user.username: set(visible_expenses(user).values_list('description', flat=True))
+            for user in User.objects.all()
+        }
+
+    def assertVisible(self, expected):
+        """The maintained visibility rows are expected and are what a rebuild from scratch produces"""
+        expected = {username: set(expected.get(username, ())) for username in self.visible()}
+        self.assertEqual(self.visible(), expected)
+        rebuild_visibility()
+        self.assertEqual(self.visible(), expected)
+
+    def test_follows_expense_edits(self):
+        expense = self.expense('Taxi')
+        self.assertVisible({'owner': {'Taxi'}})
+
+        expense.group = self.group
+        expense.save()
+        self.assertVisible({'owner': {'Taxi'}, 'friend': {'Taxi'}})
+
+        expense.group = None
+        expense.paid_by = self.late
+        expense.save()
+        self.assertVisible({'owner': {'Taxi'}, 'late': {'Taxi'}})
+
+    def test_follows_membership_from_either_side(self):
+        self.expense('Taxi', group=self.group)
+        self.group.members.add(self.late)
+        self.assertVisible({'owner': {'Taxi'}, 'friend': {'Taxi'}, 'late': {'Taxi'}})
+
+        self.friend.member_groups.remove(self.group)
+        self.assertVisible({'owner': {'Taxi'}, 'late': {'Taxi'}})
+
+        self.late.member_groups.clear()
+        self.assertVisible({'owner': {'Taxi'}})
+
+        self.friend.member_groups.add(self.group)
+        self.group.members.clear()
+        # The creator still sees the expense through having paid it
+        self.assertVisible({'owner': {'Taxi'}})
+
+    def test_membership_changes_leave_other_members_rows_alone(self):
+        self.expense('Taxi', group=self.group)
+        self.expense('Hotel', group=self.group, user=self.friend)
+        rows = set(ExpenseVisibility.objects.exclude(user=self.late).values_list('id', flat=True))
+
+        self.group.members.add(self.late)
+        self.late.member_groups.remove(self.group)
+        self.assertEqual(set(ExpenseVisibility.objects.values_list('id', flat=True)), rows)
+
+    def test_deleting_a_group_keeps_its_expenses_for_their_payers(self):
+        self.expense('Taxi', group=self.group)
+        self.expense('Hotel', group=self.group, user=self.friend)
+        self.group.delete()
+        self.assertVisible({'owner': {'Taxi'}, 'friend': {'Hotel'}})
+
+    def test_deleting_a_group_creator(self):
+        self.expense('Taxi', group=self.group)
+        self.expense('Hotel', group=self.group, user=self.friend)
+        owner_id = self.owner.pk
+        # Deleting the creator deletes the group along with the creator's expenses
+        self.owner.delete()
+        self.assertEqual(
+            set(ExpenseMonthlyRollup.objects.values_list('user_id', 'count')), {(self.friend.pk, 1)}
+        )
+        self.assertFalse(visible_expenses(owner_id).exists())
+        self.assertVisible({'friend': {'Hotel'}})
+
+
+class ExpenseRollupTests(TestCase):
+    """The monthly rollups move with every change and match a rebuild from the expenses"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.friend, cls.late = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='pass')
+            for name in ['owner', 'friend', 'late']
+        ]
+        cls.food = ExpenseCategory.objects.create(name='Food')
+        cls.travel = ExpenseCategory.objects.create(name='Travel')
+        cls.group = ExpenseGroup.objects.create(name='Trip', created_by=cls.owner)
+        cls.group.members.add(cls.owner, cls.friend)
+
+    def expense(self, amount, day, category=None, group=None, user=None):
+        user = user or self.owner
+        return Expense.objects.create(
+            description='Dinner', amount=amount, date=day, category=category, group=group,
+            paid_by=user, created_by=user
+        )
+
+    def rollups(self):
+        return {
+            (row.user.username, f'{row.month:%Y-%m}', row.category and row.category.name): (row.total, row.count)
+            for row in ExpenseMonthlyRollup.objects.select_related('user', 'category')
+        }
+
+    def assertRollups(self, expected):
+        """The maintained rollups are expected and are what a rebuild from scratch produces"""
+        expected = {key: (Decimal(total), count) for key, (total, count) in expected.items()}
+        self.assertEqual(self.rollups(), expected)
+        rebuild_visibility()
+        self.assertEqual(self.rollups(), expected)
+
+    def test_category_and_amount_edits(self):
+        expense = self.expense(100, date(2024, 1, 10), self.food)
+        self.expense(20, date(2024, 1, 20), self.food)
+        self.assertRollups({('owner', '2024-01', 'Food'): (120, 2)})
+
+        expense.category = self.travel
+        expense.amount = 150
+        expense.save()
+        self.assertRollups({('owner', '2024-01', 'Food'): (20, 1), ('owner', '2024-01', 'Travel'): (150, 1)})
+
+    def test_date_changes_move_between_months(self):
+        expense = self.expense(100, date(2024, 1, 31), self.food)
+        expense.date = date(2024, 2, 1)
+        expense.save()
+        self.assertRollups({('owner', '2024-02', 'Food'): (100, 1)})
+
+    def test_membership_changes_move_group_expenses(self):
+        self.expense(90, date(2024, 1, 5), self.food, group=self.group)
+        self.assertRollups({('owner', '2024-01', 'Food'): (90, 1), ('friend', '2024-01', 'Food'): (90, 1)})
+
+        self.group.members.add(self.late)
+        self.group.members.remove(self.friend)
+        self.assertRollups({('owner', '2024-01', 'Food'): (90, 1), ('late', '2024-01', 'Food'): (90, 1)})
+
+    def test_deleting_a_category_folds_it_into_uncategorized(self):
+        self.expense(100, date(2024, 1, 10), self.food)
+        self.expense(30, date(2024, 1, 12))
+        self.expense(40, date(2024, 1, 14), self.travel)
+        self.food.delete()
+        self.assertRollups({('owner', '2024-01', None): (130, 2), ('owner', '2024-01', 'Travel'): (40, 1)})
+
+    def test_check_catches_visibility_drift(self):
+        """A missing visibility row whose rollup went with it is still caught against the expenses"""
+        self.expense(90, date(2024, 1, 5), self.food, group=self.group)
+        self.expense(40, date(2024, 1, 8), self.travel, user=self.friend)
+        call_command('rebuild_expense_rollups', '--check', stdout=io.StringIO())
+
+        ExpenseVisibility.objects.filter(user=self.friend, expense__group=self.group).delete()
+        ExpenseMonthlyRollup.objects.filter(user=self.friend, category=self.food).delete()
+        with self.assertRaisesMessage(CommandError, '1 rollup rows differ from the expenses'):
+            call_command('rebuild_expense_rollups', '--check', stdout=io.StringIO())
+        with self.assertRaises(CommandError):
+            call_command('rebuild_expense_rollups', stdout=io.StringIO())
+
+        call_command('rebuild_expense_rollups', '--with-visibility', stdout=io.StringIO())
+        self.assertEqual(self.rollups()[('friend', '2024-01', 'Food')], (Decimal(90), 1))
+
+
+class SummaryCacheTests(TestCase):
+    """The cached summary is served until a change that touches the user moves its version"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass'
+        )
+        cls.friend = User.objects.create_user(
+            username='friend', email='friend@example.com', password='pass'
+        )
+        cls.stranger = User.objects.create_user(
+            username='stranger', email='stranger@example.com', password='pass'
+        )
+        cls.food = ExpenseCategory.objects.create(name='Food')
+        cls.group = ExpenseGroup.objects.create(name='Trip', created_by=cls.user)
+        cls.group.members.add(cls.user, cls.friend)
+
+    def setUp(self):
+        cache.clear()
+
+    def summary(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/expenses/expenses/summary/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def add_expense(self, amount, group=None, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Expense.objects.create(
+                description='Dinner', amount=amount, date=date.today(), category=self.food,
+                group=group, paid_by=self.user, created_by=self.user, **fields
+            )
+
+    def test_repeat_reads_hit_the_cache(self):
+        self.summary(self.user)
+        self.summary(self.user)
+        stats = summary_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_expense_changes_invalidate_its_audience_only(self):
+        self.assertEqual(self.summary(self.friend)['total_count'], 0)
+        self.summary(self.stranger)
+
+        expense = self.add_expense(30, group=self.group, is_split=True)
+        self.assertEqual(self.summary(self.friend)['total_count'], 1)
+        self.summary(self.stranger)
+        self.assertEqual(summary_cache_stats()['hits'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            expense.delete()
+        self.assertEqual(self.summary(self.friend)['total_count'], 0)
+
+    def test_split_payment_invalidates_owed_amount(self):
+        expense = self.add_expense(40, group=self.group, is_split=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            split = ExpenseSplit.objects.create(expense=expense, user=self.friend, amount=20)
+        self.assertEqual(self.summary(self.user)['owed_amount'], 20)
+
+        split.is_paid = True
+        with self.captureOnCommitCallbacks(execute=True):
+            split.save()
+        self.assertEqual(self.summary(self.user)['owed_amount'], 0)
+
+    def test_split_payment_changes_the_summary_etag(self):
+        expense = self.add_expense(40, group=self.group, is_split=True)
+        split = ExpenseSplit.objects.create(expense=expense, user=self.friend, amount=20)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        etag = client.get('/api/expenses/expenses/summary/')['ETag']
+        response = client.get('/api/expenses/expenses/summary/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        split.is_paid = True
+        split.save()
+        response = client.get('/api/expenses/expenses/summary/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['owed_amount'], 0)
+
+    def test_default_timeseries_window_rolls_over_with_the_date(self):
+        self.add_expense(10)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = '/api/expenses/expenses/timeseries/?interval=day'
+        etag = client.get(url)['ETag']
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        tomorrow = timezone.now() + timedelta(days=1)
+        with mock.patch('django.utils.timezone.now', return_value=tomorrow):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['end'], tomorrow.date().isoformat())
+
+    def test_membership_change_invalidates(self):
+        self.add_expense(25, group=self.group)
+        self.assertEqual(self.summary(self.stranger)['total_count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.members.add(self.stranger)
+        self.assertEqual(self.summary(self.stranger)['total_count'], 1)
+
+    def test_category_rename_invalidates_everyone(self):
+        self.add_expense(10)
+        self.summary(self.user)
+        self.food.name = 'Groceries'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.food.save()
+        breakdown = self.summary(self.user)['category_breakdown']
+        self.assertEqual(breakdown[0]['category__name'], 'Groceries')
+
+
+class ConditionalGetTests(TestCase):
+    """Read endpoints answer If-None-Match with 304 until their payload could have changed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass'
+        )
+        cls.friend = User.objects.create_user(
+            username='friend', email='friend@example.com', password='pass'
+        )
+        cls.food = ExpenseCategory.objects.create(name='Food')
+        cls.group = ExpenseGroup.objects.create(name='Trip', created_by=cls.user)
+        cls.group.members.add(cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertRevalidates(self, url, change):
+        """url answers 304 to its own ETag, and 200 with a new ETag once change() has run"""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_categories(self):
+        self.assertRevalidates(
+            '/api/expenses/categories/', lambda: ExpenseCategory.objects.create(name='Travel')
+        )
+        self.assertRevalidates('/api/expenses/categories/', lambda: self.food.delete())
+
+    def test_groups_follow_membership(self):
+        self.assertRevalidates('/api/expenses/groups/', lambda: self.group.members.add(self.friend))
+        self.assertRevalidates(
+            f'/api/expenses/groups/{self.group.id}/', lambda: self.friend.member_groups.remove(self.group)
+        )
+
+    def test_deleting_an_expense(self):
+        expense = Expense.objects.create(
+            description='Taxi', amount=10, date=date.today(), paid_by=self.user, created_by=self.user
+        )
+        # The newest updated_at is unchanged by the delete; the ETag must still move
+        self.assertRevalidates(
+            '/api/expenses/expenses/',
+            lambda: self.client.delete(f'/api/expenses/expenses/{expense.id}/'),
+        )
+        self.assertFalse(Expense.objects.exists())
+        # With no Last-Modified to compare against, If-Modified-Since never answers 304
+        since = http_date(time.time() + 60)
+        response = self.client.get('/api/expenses/expenses/', HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+
+
+class KeywordClassifierTests(SimpleTestCase):
+    def test_whole_words_only(self):
+        # Substring scans read "car" in "card" and "oil" in "toilet"
+        self.assertEqual(keyword_category('Card payment'), 'Other')
+        self.assertEqual(keyword_category('Toilet cleaner'), 'Other')
+
+    def test_plurals_and_phrases(self):
+        self.assertEqual(match_keywords('Groceries and 2 bananas').keywords, ('banana', 'grocery'))
+        self.assertEqual(match_keywords('Ice creams for the kids').keywords, ('ice cream',))
+        self.assertEqual(keyword_category('Monthly fee'), 'Bills')
+
+    def test_earlier_rule_wins(self):
+        match = match_keywords('Milk and movie tickets')
+        self.assertEqual((match.category, match.rule), ('Food', 'groceries'))
+        self.assertEqual(keyword_category('Uber to the hotel'), 'Transport')
+
+
+class DetectionCacheTests(SimpleTestCase):
+    def test_key_ignores_case_digits_and_spacing(self):
+        self.assertEqual(
+            detection_key('  Milk 2L ', 'llama3.2', 1), detection_key('milk  l', 'llama3.2', 1)
+        )
+        self.assertNotEqual(
+            detection_key('milk', 'llama3.2', 1), detection_key('milk', 'llama3.2', 2)
+        )
+
+    def test_least_recently_used_entry_is_evicted(self):
+        detections = DetectionCache(max_entries=2, ttl=60)
+        detections.set('milk', 'Food')
+        detections.set('uber', 'Transport')
+        detections.get('milk')
+        detections.set('rent', 'Bills')
+        self.assertIsNone(detections.get('uber'))
+        self.assertEqual(detections.get('milk'), 'Food')
+        stats = detections.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (2, 1, 1))
+
+    def test_entries_expire(self):
+        detections = DetectionCache(max_entries=10, ttl=60)
+        detections.set('milk', 'Food')
+        with mock.patch('expenses.detection_cache.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(detections.get('milk'))
+        self.assertEqual(detections.stats()['expirations'], 1)
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Answers /api/generate like Ollama, picking the category from the quoted description"""
+    answers = {'netflix': 'Entertainment', 'electrician': 'Home'}
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.prompts.append(payload['prompt'])
+        description = re.search(r'Description: "(.*)"', payload['prompt']).group(1).lower()
+        if 'slow' in description:
+            time.sleep(0.5)
+        answer = next((category for word, category in self.answers.items() if word in description), 'Other')
+        body = json.dumps([answer] if 'listed' in description else {'response': answer}).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            if 'garbled' in description:
+                # A chunk size that is not hex breaks the chunked decoding
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                self.wfile.write(b'zz\r\n' + body + b'\r\n0\r\n\r\n')
+                return
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on a slow answer
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_ollama():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubOllamaHandler)
+    server.prompts = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class BatchCategoryDetectionTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_stub_ollama()
+        cls.ollama = override_settings(
+            OLLAMA_URL=f'http://127.0.0.1:{cls.server.server_port}',
+            CATEGORY_MODEL_PATH=os.path.join(tempfile.gettempdir(), 'no-such-category-model.joblib'),
+        )
+        cls.ollama.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ollama.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass'
+        )
+
+    def setUp(self):
+        cache.clear()
+        detection_cache.clear()
+        self.server.prompts.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def detect(self, descriptions):
+        response = self.client.post(
+            '/api/expenses/expenses/detect_category/batch/', {'descriptions': descriptions}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_results_follow_input_order(self):
+        descriptions = ['Netflix 12', 'Milk', 'Electrician visit', 'netflix', 'Uber home']
+        data = self.detect(descriptions)
+        self.assertEqual([item['description'] for item in data['results']], descriptions)
+        self.assertEqual(
+            [(item['category'], item['source']) for item in data['results']],
+            [('Entertainment', 'llm'), ('Food', 'keywords'), ('Home', 'llm'),
+             ('Entertainment', 'llm'), ('Transport', 'keywords')],
+        )
+        self.assertTrue(all(item['latency_ms'] >= 0 for item in data['results']))
+
+    def test_duplicates_and_cached_answers_skip_the_model(self):
+        data = self.detect(['Netflix', 'NETFLIX 2', 'Netflix'])
+        self.assertEqual((data['unique'], data['llm_calls']), (1, 1))
+        self.assertEqual(len(self.server.prompts), 1)
+
+        data = self.detect(['netflix'])
+        self.assertEqual(data['results'][0]['source'], 'cache')
+        self.assertEqual(len(self.server.prompts), 1)
+
+    def test_many_lines_fan_out(self):
+        descriptions = [f'Electrician call {chr(97 + i // 26)}{chr(97 + i % 26)}' for i in range(60)]
+        data = self.detect(descriptions)
+        self.assertEqual(data['llm_calls'], 60)
+        self.assertEqual(len(self.server.prompts), 60)
+        self.assertEqual({item['category'] for item in data['results']}, {'Home'})
+
+    def test_rejects_oversized_batches(self):
+        response = self.client.post(
+            '/api/expenses/expenses/detect_category/batch/',
+            {'descriptions': ['Milk'] * 501}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class OllamaClientTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_stub_ollama()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.prompts.clear()
+
+    def ollama(self, **options):
+        config = {
+            'base_url': f'http://127.0.0.1:{self.server.server_port}', 'model': 'llama3.2',
+            'timeout': (1, 0.2), 'max_concurrency': 2, 'queue_timeout': 0.1,
+            'failure_threshold': 2, 'reset_timeout': 60,
+        }
+        return OllamaClient(**{**config, **options})
+
+    def prompt(self, description):
+        return f'Description: "{description}"'
+
+    def test_answers_over_a_kept_alive_session(self):
+        client = self.ollama()
+        self.assertEqual(client.generate(self.prompt('Netflix')), 'Entertainment')
+        self.assertEqual(client.generate(self.prompt('Electrician')), 'Home')
+        self.assertEqual(client.breaker.state, 'closed')
+
+    def test_circuit_opens_after_repeated_timeouts(self):
+        client = self.ollama()
+        for _ in range(2):
+            with self.assertRaises(OllamaError):
+                client.generate(self.prompt('slow netflix'))
+        self.assertEqual(client.breaker.state, 'open')
+
+        started = time.perf_counter()
+        with self.assertRaises(CircuitOpen):
+            client.generate(self.prompt('Netflix'))
+        self.assertLess(time.perf_counter() - started, 0.05)
+        self.assertEqual(len(self.server.prompts), 2)
+
+    def test_half_open_trial_closes_the_circuit(self):
+        client = self.ollama(reset_timeout=0.3)
+        for _ in range(2):
+            with self.assertRaises(OllamaError):
+                client.generate(self.prompt('slow netflix'))
+        time.sleep(0.3)
+        self.assertEqual(client.breaker.state, 'half-open')
+        self.assertEqual(client.generate(self.prompt('Netflix')), 'Entertainment')
+        self.assertEqual(client.breaker.state, 'closed')
+
+    def test_malformed_answers_are_failures(self):
+        client = self.ollama()
+        with self.assertRaises(OllamaError):
+            client.generate(self.prompt('listed netflix'))
+        with self.assertRaises(OllamaError):
+            client.generate(self.prompt('garbled netflix'))
+        self.assertEqual(client.breaker.state, 'open')
+
+    def test_a_failed_half_open_trial_lets_the_next_one_through(self):
+        client = self.ollama(reset_timeout=0.3)
+        for _ in range(2):
+            with self.assertRaises(OllamaError):
+                client.generate(self.prompt('slow netflix'))
+        time.sleep(0.3)
+        with mock.patch.object(client.session, 'post', side_effect=RuntimeError('unexpected')):
+            with self.assertRaises(OllamaError):
+                client.generate(self.prompt('Netflix'))
+        self.assertEqual(client.breaker.state, 'open')
+
+        time.sleep(0.3)
+        self.assertEqual(client.generate(self.prompt('Netflix')), 'Entertainment')
+        self.assertEqual(client.breaker.state, 'closed')
+
+    def test_callers_past_the_queue_deadline_give_up(self):
+        client = self.ollama(max_concurrency=1, timeout=(1, 2))
+        busy = threading.Thread(target=client.generate, args=(self.prompt('slow netflix'),))
+        busy.start()
+        time.sleep(0.1)
+        with self.assertRaises(QueueTimeout):
+            client.generate(self.prompt('Netflix'))
+        busy.join()
+        # Waiting for a slot says nothing about Ollama's health
+        self.assertEqual(client.breaker.state, 'closed')
+
+
+class CategoryModelTests(TestCase):
+    TRAINING = {
+        'Entertainment': ['Netflix', 'Movie tickets', 'Concert pass', 'Spotify', 'Cinema night',
+                          'Netflix plan', 'Bowling alley', 'Theatre show', 'Gaming pass', 'Hotstar'],
+        'Transport': ['Uber ride', 'Ola cab', 'Metro card', 'Petrol refill', 'Uber to office',
+                      'Rapido bike', 'Train ticket', 'Bus pass', 'Parking fee', 'Ola auto'],
+        'Food': ['Swiggy order', 'Zomato dinner', 'Milk', 'Vegetables', 'Swiggy lunch',
+                 'Zomato pizza', 'Bakery', 'Groceries', 'Cafe coffee', 'Swiggy instamart'],
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass'
+        )
+        for name, descriptions in cls.TRAINING.items():
+            category = ExpenseCategory.objects.create(name=name)
+            for description in descriptions:
+                Expense.objects.create(
+                    description=description, amount=100, date=date.today(), category=category,
+                    paid_by=cls.user, created_by=cls.user,
+                )
+
+    def setUp(self):
+        cache.clear()
+        detection_cache.clear()
+        self.server = start_stub_ollama()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.model_path = os.path.join(directory.name, 'category_model.joblib')
+        settings = override_settings(
+            CATEGORY_MODEL_PATH=self.model_path,
+            CATEGORY_MODEL_THRESHOLD=0.5,
+            OLLAMA_URL=f'http://127.0.0.1:{self.server.server_port}',
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def detect(self, description):
+        response = self.client.post(
+            '/api/expenses/expenses/detect_category/', {'description': description}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_confident_predictions_skip_ollama(self):
+        call_command('train_category_model', holdout=0, stdout=open(os.devnull, 'w'))
+        data = self.detect('Swiggy breakfast')
+        self.assertEqual(data['category'], 'Food')
+        self.assertGreaterEqual(data['confidence'], 0.5)
+        self.assertLess(data['confidence'], 1)
+        self.assertEqual(self.server.prompts, [])
+
+    def test_unsure_predictions_escalate_to_ollama(self):
+        call_command('train_category_model', holdout=0, stdout=open(os.devnull, 'w'))
+        with override_settings(CATEGORY_MODEL_THRESHOLD=0.99):
+            data = self.detect('Electrician visit')
+        self.assertEqual((data['category'], data['confidence']), ('Home', 0.95))
+        self.assertEqual(len(self.server.prompts), 1)
+
+    def test_without_a_model_ollama_answers(self):
+        # The owner has filed plain "Netflix" before, which history would answer
+        self.assertEqual(self.detect('Netflix yearly')['category'], 'Entertainment')
+        self.assertEqual(len(self.server.prompts), 1)
+
+
+class CategorizationJobTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_stub_ollama()
+        cls.ollama = override_settings(
+            OLLAMA_URL=f'http://127.0.0.1:{cls.server.server_port}',
+            CATEGORY_MODEL_PATH=os.path.join(tempfile.gettempdir(), 'no-such-category-model.joblib'),
+        )
+        cls.ollama.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ollama.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass'
+        )
+
+    def setUp(self):
+        cache.clear()
+        detection_cache.clear()
+        self.server.prompts.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, description):
+        response = self.client.post(
+            '/api/expenses/expenses/',
+            {'description': description, 'amount': '120.00', 'date': date.today().isoformat()},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def work(self):
+        call_command('categorize_expenses', stdout=open(os.devnull, 'w'))
+
+    def test_worker_fills_the_ai_category_after_create(self):
+        for description in ['Netflix', 'netflix 2', 'NETFLIX', 'Electrician visit', 'Milk']:
+            self.create(description)
+        self.assertEqual(CategorizationJob.objects.count(), 5)
+        self.assertFalse(Expense.objects.exclude(ai_detected_category='').exists())
+        self.assertEqual(self.server.prompts, [])
+
+        self.work()
+        self.assertEqual(
+            dict(Expense.objects.values_list('description', 'ai_detected_category')),
+            {'Netflix': 'Entertainment', 'netflix 2': 'Entertainment', 'NETFLIX': 'Entertainment',
+             'Electrician visit': 'Home', 'Milk': 'Food'},
+        )
+        self.assertEqual(Expense.objects.get(description='Milk').ai_confidence, 0.6)
+        # The three spellings of netflix are detected once; milk never leaves the keyword index
+        self.assertEqual(len(self.server.prompts), 2)
+        self.assertFalse(CategorizationJob.objects.exists())
+
+    def test_categorizing_changes_the_expense_list_etag(self):
+        self.create('Netflix')
+        etag = self.client.get('/api/expenses/expenses/')['ETag']
+        self.work()
+        response = self.client.get('/api/expenses/expenses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['final_category'], 'Entertainment')
+
+    def test_failed_passes_are_retried_then_given_up(self):
+        self.create('Netflix')
+        with mock.patch('expenses.categorization_jobs.detect_many', side_effect=RuntimeError('boom')):
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                with self.assertLogs('expenses.categorization_jobs', 'ERROR'):
+                    stats = process_batch(10)
+                self.assertEqual(stats['claimed'], 1)
+                job = CategorizationJob.objects.get()
+                self.assertEqual(job.attempts, attempt)
+            self.assertEqual((job.status, job.last_error), ('failed', 'boom'))
+            self.assertEqual(process_batch(10)['claimed'], 0)
+
+    def test_lapsed_claims_are_picked_up_again(self):
+        self.create('Netflix')
+        claim_jobs(CategorizationJob, 10)
+        self.assertEqual(process_batch(10)['claimed'], 0)
+        CategorizationJob.objects.update(claimed_at=timezone.now() - CLAIM_LEASE - timedelta(seconds=1))
+        self.assertEqual(process_batch(10)['categorized'], 1)
+        self.assertEqual(Expense.objects.get().ai_detected_category, 'Entertainment')
+
+
+class CategoryMappingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass'
+        )
+        cls.other = User.objects.create_user(
+            username='other', email='other@example.com', password='pass'
+        )
+        cls.home = ExpenseCategory.objects.create(name='Home')
+        cls.bills = ExpenseCategory.objects.create(name='Bills')
+
+    def setUp(self):
+        mapping_cache.clear()
+        detection_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Ollama is unreachable; anything history does not answer falls back to keywords
+        settings = override_settings(
+            OLLAMA_URL='http://127.0.0.1:9',
+            CATEGORY_MODEL_PATH=os.path.join(tempfile.gettempdir(), 'no-such-category-model.joblib'),
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def expense(self, description, category, user=None):
+        return Expense.objects.create(
+            description=description, amount=100, date=date.today(), category=category,
+            paid_by=user or self.user, created_by=user or self.user,
+        )
+
+    def detect(self, description):
+        response = self.client.post(
+            '/api/expenses/expenses/detect_category/', {'description': description}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_the_latest_choice_answers_before_other_tiers(self):
+        expense = self.expense('BESCOM 0423', self.bills)
+        self.assertEqual(self.detect('Bescom 0524')['category'], 'Bills')
+        expense.category = self.home
+        expense.save()
+        data = self.detect('bescom')
+        self.assertEqual((data['category'], data['confidence']), ('Home', 0.99))
+
+    def test_mappings_are_per_user(self):
+        self.expense('Bescom', self.bills, user=self.other)
+        self.assertEqual(learned_categories(self.user.pk, ['Bescom']), {})
+        self.assertEqual(learned_category(self.other.pk, 'bescom'), 'Bills')
+
+    def test_misses_are_cached(self):
+        self.assertIsNone(learned_category(self.user.pk, 'Bescom'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(learned_category(self.user.pk, 'Bescom'))
+
+    def test_worker_uses_the_creators_history(self):
+        self.expense('Bescom', self.bills)
+        expense = self.expense('Bescom', None)
+        enqueue_categorization([expense.pk])
+        process_batch(10)
+        expense.refresh_from_db()
+        self.assertEqual((expense.ai_detected_category, expense.ai_confidence), ('Bills', 0.99))
+
+    def test_rebuild_replays_history(self):
+        self.expense('Bescom', self.bills)
+        self.expense('Bescom', self.home)
+        self.expense('Airtel', self.bills, user=self.other)
+        UserCategoryMapping.objects.all().delete()
+        call_command('rebuild_category_mappings', stdout=open(os.devnull, 'w'))
+        self.assertEqual(
+            set(UserCategoryMapping.objects.values_list('user__username', 'key', 'category__name')),
+            {('owner', 'bescom', 'Home'), ('other', 'airtel', 'Bills')},
+        )
+
+
+def png_bytes(size=(40, 60), color='white'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class ReceiptParsingTests(SimpleTestCase):
+    def test_grand_total_beats_subtotal_and_line_items(self):
+        fields = parse_receipt(
+            'SHREE BALAJI SUPERMARKET\nGSTIN 29ABCDE1234F1Z5\nInvoice No 4521  Date: 14/03/2025\n'
+            'Milk 2 x 28.00   56.00\nSub Total       1,101.00\nCGST 2.5%   5.06\n'
+            'Grand Total    Rs 1,106.06\nPhone 9876543210'
+        )
+        self.assertEqual(fields, {
+            'extracted_amount': Decimal('1106.06'),
+            'extracted_date': date(2025, 3, 14),
+            'extracted_merchant': 'SHREE BALAJI SUPERMARKET',
+        })
+
+    def test_without_a_total_only_priced_figures_count(self):
+        fields = parse_receipt('Cafe Coffee Day\nTable 12\n12 Jan 2024\nLatte 180.00\nCookie 60.50')
+        self.assertEqual(fields['extracted_amount'], Decimal('180.00'))
+        self.assertEqual(fields['extracted_date'], date(2024, 1, 12))
+
+    def test_unreadable_text(self):
+        self.assertEqual(parse_receipt('~~ ..\n'), {
+            'extracted_amount': None, 'extracted_date': None, 'extracted_merchant': '',
+        })
+
+
+class ReceiptTestCase(TestCase):
+    """Each test stores media under a temporary MEDIA_ROOT, with an empty cache, as self.user"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class ReceiptOCRJobTests(ReceiptTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass'
+        )
+        cls.expense = Expense.objects.create(
+            description='Groceries', amount=1106, date=date.today(),
+            paid_by=cls.user, created_by=cls.user,
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.pool = ThreadPoolExecutor(2)
+        self.addCleanup(self.pool.shutdown)
+
+    def upload(self, name='receipt.png', color='white'):
+        response = self.client.post('/api/expenses/receipts/', {
+            'expense': self.expense.pk,
+            'image': SimpleUploadedFile(name, png_bytes(color=color), content_type='image/png'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['ocr_text'], '')
+        self.assertIn('/media/derivatives/thumbnail/receipts/', response.json()['thumbnail'])
+        return response.json()['id']
+
+    def test_upload_queues_and_the_worker_fills_the_fields(self):
+        receipt_id = self.upload()
+        self.assertEqual(ReceiptOCRJob.objects.filter(receipt_id=receipt_id).count(), 1)
+
+        read = mock.Mock(return_value=[('FRESH MART', 0.9), ('Total 1,106.06', 0.7)])
+        with mock.patch('expenses.ocr._read', read):
+            stats = process_receipt_batch(self.pool, 10)
+        self.assertEqual((stats['claimed'], stats['read']), (1, 1))
+        # OCR reads the downscaled derivative, never the original
+        self.assertIn('/derivatives/ocr/', read.call_args.args[0])
+
+        receipt = ExpenseReceipt.objects.get(pk=receipt_id)
+        self.assertEqual(receipt.ocr_text, 'FRESH MART\nTotal 1,106.06')
+        self.assertEqual((receipt.extracted_amount, receipt.extracted_merchant), (Decimal('1106.06'), 'FRESH MART'))
+        self.assertAlmostEqual(receipt.confidence_score, 0.8)
+        self.assertFalse(ReceiptOCRJob.objects.exists())
+
+    def test_the_command_drains_the_queue(self):
+        self.upload()
+        output = io.StringIO()
+        # Threads stand in for the process pool, which would load a real OCR engine
+        pool = lambda workers, initializer, initargs: ThreadPoolExecutor(workers)
+        with mock.patch('expenses.management.commands.process_receipts.ProcessPoolExecutor', pool), \
+                mock.patch('expenses.ocr._read', return_value=[('Total 10.00', 0.9)]):
+            call_command('process_receipts', workers=2, stdout=output)
+        self.assertIn('Done: 1 receipts read (0 from duplicates), 0 jobs failed', output.getvalue())
+
+    def test_unreadable_images_are_retried_then_given_up(self):
+        # Different images, or the second would copy the first one's results
+        good, bad = self.upload('good.png'), self.upload('bad.png', color='black')
+
+        def read(path):
+            if 'bad' in os.path.basename(path):
+                raise OSError('cannot identify image file')
+            return [('Total 10.00', 0.9)]
+
+        with mock.patch('expenses.ocr._read', read):
+            stats = process_receipt_batch(self.pool, 10)
+            self.assertEqual((stats['read'], stats['retried']), (1, 1))
+            for _ in range(MAX_ATTEMPTS - 1):
+                stats = process_receipt_batch(self.pool, 10)
+        self.assertEqual(stats['failed'], 1)
+        job = ReceiptOCRJob.objects.get()
+        self.assertEqual((job.receipt_id, job.status), (bad, 'failed'))
+        self.assertIn('cannot identify image file', job.last_error)
+        self.assertEqual(ExpenseReceipt.objects.get(pk=good).extracted_amount, Decimal('10.00'))
+
+
+class ReceiptDerivativeTests(ReceiptTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass'
+        )
+
+    def store(self, name, content):
+        return default_storage.save(f'receipts/{name}', ContentFile(content))
+
+    def test_derivatives_are_bounded_and_cached(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (4000, 3000), 'white').save(buffer, 'JPEG')
+        name = self.store('photo.jpg', buffer.getvalue())
+
+        names = ensure_derivatives(name)
+        sizes = {}
+        for kind, derivative in names.items():
+            with Image.open(default_storage.path(derivative)) as image:
+                sizes[kind] = (image.size, image.mode)
+        self.assertEqual(sizes, {'thumbnail': ((320, 240), 'RGB'), 'ocr': ((1600, 1200), 'L')})
+
+        with mock.patch('expenses.derivatives.render') as render:
+            self.assertEqual(ensure_derivatives(name), names)
+        render.assert_not_called()
+
+    def test_the_list_exposes_thumbnails(self):
+        name = self.store('photo.png', png_bytes())
+        Expense.objects.create(
+            description='Dinner', amount=100, date=date.today(), receipt_image=name,
+            paid_by=self.user, created_by=self.user,
+        )
+        row = self.client.get('/api/expenses/expenses/').json()['results'][0]
+        self.assertTrue(row['receipt_image'].endswith('/media/receipts/photo.png'))
+        self.assertTrue(row['receipt_thumbnail'].endswith('/media/derivatives/thumbnail/receipts/photo.png.jpg'))
+
+    def test_originals_sharing_a_stem_get_their_own_derivatives(self):
+        jpeg = io.BytesIO()
+        Image.new('RGB', (400, 300), 'black').save(jpeg, 'JPEG')
+        first = ensure_derivatives(self.store('receipt.jpg', jpeg.getvalue()))
+        second = ensure_derivatives(self.store('receipt.png', png_bytes()))
+        self.assertNotEqual(first, second)
+        with Image.open(default_storage.path(second['thumbnail'])) as image:
+            self.assertNotEqual(image.convert('L').getextrema(), (0, 0))
+
+    def test_unreadable_images_have_no_thumbnail(self):
+        name = self.store('broken.png', b'not an image')
+        with self.assertLogs('expenses.derivatives', 'WARNING'):
+            self.assertFalse(render_derivatives(name))
+        self.assertFalse(default_storage.exists(derivative_name(name, 'thumbnail')))
+
+    def test_reads_only_build_urls(self):
+        for i in range(3):
+            Expense.objects.create(
+                description='Dinner', amount=100, date=date.today(), receipt_image=self.store('p.png', png_bytes()),
+                paid_by=self.user, created_by=self.user,
+            )
+        with mock.patch('expenses.derivatives.render') as render, \
+                mock.patch.object(default_storage, 'exists') as exists:
+            rows = self.client.get('/api/expenses/expenses/').json()['results']
+            detail = self.client.get(f"/api/expenses/expenses/{rows[0]['id']}/").json()
+        render.assert_not_called()
+        exists.assert_not_called()
+        self.assertEqual(detail['receipt_thumbnail'], rows[0]['receipt_thumbnail'])
+
+    def test_saving_a_receipt_image_renders_its_thumbnail(self):
+        expense = Expense.objects.create(
+            description='Dinner', amount=100, date=date.today(), paid_by=self.user, created_by=self.user,
+        )
+        response = self.client.patch(
+            f'/api/expenses/expenses/{expense.pk}/',
+            {'receipt_image': SimpleUploadedFile('bill.png', png_bytes(), content_type='image/png')},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        expense.refresh_from_db()
+        self.assertTrue(default_storage.exists(derivative_name(expense.receipt_image.name, 'thumbnail')))
+        self.assertTrue(response.json()['receipt_thumbnail'].endswith(
+            f'/media/{derivative_name(expense.receipt_image.name, "thumbnail")}'
+        ))
+
+    def test_command_renders_missing_thumbnails(self):
+        name = self.store('old.png', png_bytes())
+        Expense.objects.create(
+            description='Dinner', amount=100, date=date.today(), receipt_image=name,
+            paid_by=self.user, created_by=self.user,
+        )
+        output = io.StringIO()
+        call_command('render_thumbnails', stdout=output)
+        self.assertTrue(default_storage.exists(derivative_name(name, 'thumbnail')))
+        self.assertIn('Checked 1 images', output.getvalue())
+
+
+def receipt_bytes(seed, size=(600, 900), format='PNG'):
+    """A white slip with dark bars standing in for printed lines; seed varies the layout"""
+    image = Image.new('RGB', (600, 900), 'white')
+    draw = ImageDraw.Draw(image)
+    for line in range(12):
+        left = 40 + (seed * 37 + line * 53) % 300
+        right = 350 + (seed * 91 + line * 29) % 230
+        draw.rectangle((left, 60 + line * 65, right, 90 + line * 65), fill='black')
+    buffer = io.BytesIO()
+    image.resize(size).save(buffer, format)
+    return buffer.getvalue()
+
+
+class ReceiptDuplicateTests(ReceiptTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass'
+        )
+        cls.other = User.objects.create_user(
+            username='other', email='other@example.com', password='pass'
+        )
+        cls.expense = Expense.objects.create(
+            description='Groceries', amount=1106, date=date.today(),
+            paid_by=cls.user, created_by=cls.user,
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.pool = ThreadPoolExecutor(2)
+        self.addCleanup(self.pool.shutdown)
+
+    def upload(self, content, name='receipt.png', expense=None, user=None):
+        self.client.force_authenticate(user or self.user)
+        response = self.client.post('/api/expenses/receipts/', {
+            'expense': (expense or self.expense).pk,
+            'image': SimpleUploadedFile(name, content),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def read(self, batch_size=10):
+        read = mock.Mock(return_value=[('FRESH MART', 0.9), ('Total 1,106.06', 0.7)])
+        with mock.patch('expenses.ocr._read', read):
+            stats = process_receipt_batch(self.pool, batch_size)
+        return stats, read
+
+    def test_hash_survives_rescaling_and_recompression(self):
+        original = hash_fields(dhash(io.BytesIO(receipt_bytes(1))))
+        reshot = hash_fields(dhash(io.BytesIO(receipt_bytes(1, (400, 600), 'JPEG'))))
+        different = hash_fields(dhash(io.BytesIO(receipt_bytes(2))))
+        self.assertLessEqual(distance(original['image_hash'], reshot['image_hash']), MAX_DISTANCE)
+        self.assertGreater(distance(original['image_hash'], different['image_hash']), MAX_DISTANCE)
+
+    def test_a_duplicate_of_a_read_receipt_reuses_its_results(self):
+        first = self.upload(receipt_bytes(1))
+        self.assertFalse(first['likely_duplicate'])
+        self.read()
+
+        second = self.upload(receipt_bytes(1, (400, 600), 'JPEG'), 'reshot.jpg')
+        self.assertTrue(second['likely_duplicate'])
+        self.assertEqual(second['duplicate_of'], first['id'])
+        self.assertEqual((second['ocr_text'], second['extracted_amount']), ('FRESH MART\nTotal 1,106.06', '1106.06'))
+        self.assertFalse(ReceiptOCRJob.objects.exists())
+
+        third = self.upload(receipt_bytes(2), 'other.png')
+        self.assertFalse(third['likely_duplicate'])
+        self.assertEqual(ReceiptOCRJob.objects.get().receipt_id, third['id'])
+
+    def test_a_duplicate_of_a_queued_receipt_is_copied_by_the_worker(self):
+        first = self.upload(receipt_bytes(1))
+        second = self.upload(receipt_bytes(1))
+        self.assertEqual(second['duplicate_of'], first['id'])
+
+        self.read(batch_size=1)
+        # The original has been read by the time the worker reaches the copy
+        stats, read = self.read(batch_size=1)
+        self.assertEqual((stats['read'], stats['reused']), (1, 1))
+        read.assert_not_called()
+        self.assertEqual(ExpenseReceipt.objects.get(pk=second['id']).ocr_text, 'FRESH MART\nTotal 1,106.06')
+
+    def test_receipts_the_uploader_cannot_see_are_not_matched(self):
+        self.upload(receipt_bytes(1))
+        self.read()
+        theirs = Expense.objects.create(
+            description='Groceries', amount=1106, date=date.today(),
+            paid_by=self.other, created_by=self.other,
+        )
+        response = self.upload(receipt_bytes(1), expense=theirs, user=self.other)
+        self.assertFalse(response['likely_duplicate'])
+        self.assertEqual(response['ocr_text'], '')
+
+    def test_blank_images_only_match_exact_copies(self):
+        self.upload(png_bytes())
+        self.read()
+        self.assertFalse(self.upload(png_bytes(size=(50, 70)))['likely_duplicate'])
+        self.assertTrue(self.upload(png_bytes())['likely_duplicate'])
+
+
+class ReceiptUploadTests(ReceiptTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass'
+        )
+        cls.expense = Expense.objects.create(
+            description='Groceries', amount=1106, date=date.today(),
+            paid_by=cls.user, created_by=cls.user,
+        )
+
+    def upload(self, content, name='receipt.png'):
+        return self.client.post('/api/expenses/receipts/', {
+            'expense': self.expense.pk, 'image': SimpleUploadedFile(name, content),
+        }, format='multipart')
+
+    def test_uploads_are_hashed_and_checked_while_streaming(self):
+        content = receipt_bytes(1, format='JPEG')
+        # The handler has identified the image, so the serializer does not open it again
+        with mock.patch('django.forms.fields.ImageField.to_python') as reopen:
+            response = self.upload(content, 'receipt.jpg')
+        self.assertEqual(response.status_code, 201, response.content)
+        reopen.assert_not_called()
+        receipt = ExpenseReceipt.objects.get()
+        self.assertEqual(receipt.content_hash, hashlib.sha256(content).hexdigest())
+        self.assertEqual(receipt.image.read(), content)
+
+    def test_files_that_are_not_images_are_refused(self):
+        response = self.upload(b'%PDF-1.7 ' * 100, 'receipt.pdf')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'image': ['Upload a JPEG, PNG or WebP image.']})
+        response = self.upload(png_bytes()[:20])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ExpenseReceipt.objects.exists())
+
+    def test_oversized_uploads_are_refused(self):
+        content = receipt_bytes(1)
+        with override_settings(RECEIPT_UPLOAD_MAX_BYTES=len(content) - 1):
+            response = self.upload(content)
+        self.assertEqual(response.status_code, 413)
+
+        # Refused from the Content-Length alone, before any of the body is read
+        with override_settings(RECEIPT_UPLOAD_MAX_BYTES=1000, DATA_UPLOAD_MAX_MEMORY_SIZE=1000), \
+                mock.patch.object(ReceiptUploadHandler, 'receive_data_chunk') as receive:
+            response = self.upload(content)
+        self.assertEqual(response.status_code, 413)
+        receive.assert_not_called()
+        self.assertFalse(ExpenseReceipt.objects.exists())
+
+    def test_uploads_are_rate_limited_per_user(self):
+        with mock.patch.object(ReceiptUploadThrottle, 'THROTTLE_RATES', {'receipt_upload': '2/minute'}):
+            statuses = [self.upload(png_bytes(color=color)).status_code for color in ('red', 'green', 'blue')]
+            # Requests without files are not counted
+            listed = self.client.get('/api/expenses/receipts/')
+        self.assertEqual(statuses, [201, 201, 429])
+        self.assertEqual(listed.status_code, 200)
+
+    def test_uploads_are_counted_in_the_configured_cache(self):
+        throttle_cache = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'throttle'}
+        with override_settings(CACHES={**settings.CACHES, 'throttle': throttle_cache}, UPLOAD_THROTTLE_CACHE='throttle'):
+            self.assertEqual(self.upload(png_bytes()).status_code, 201)
+            self.assertEqual(len(caches['throttle'].get(f'throttle_receipt_upload_{self.user.pk}')), 1)
+        self.assertIsNone(cache.get(f'throttle_receipt_upload_{self.user.pk}'))
+
+
+class ReceiptBackfillTests(ReceiptTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass'
+        )
+        cls.expense = Expense.objects.create(
+            description='Groceries', amount=1106, date=date.today(),
+            paid_by=cls.user, created_by=cls.user,
+        )
+
+    def setUp(self):
+        super().setUp()
+        # Stored before OCR existed: no job, no fields
+        self.receipts = [
+            ExpenseReceipt.objects.create(
+                expense=self.expense,
+                image=default_storage.save(f'receipts/{seed}.png', ContentFile(receipt_bytes(seed))),
+            ).pk
+            for seed in range(5)
+        ]
+
+    def backfill(self, crash_after=None, **options):
+        """Run the command over a thread pool, whose map raises after crash_after chunks"""
+        chunks = []
+        executor = ThreadPoolExecutor(2)
+        self.addCleanup(executor.shutdown)
+
+        class Pool:
+            def __init__(self, workers, initializer, initargs):
+                pass
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def map(self, func, tasks, chunksize):
+                if len(chunks) == crash_after:
+                    raise RuntimeError('worker lost')
+                chunks.append([task[0] for task in tasks])
+                return executor.map(func, tasks)
+
+        read = mock.Mock(return_value=[('FRESH MART', 0.9), ('Total 10.00', 0.8)])
+        output = io.StringIO()
+        with mock.patch('expenses.management.commands.backfill_receipts.ProcessPoolExecutor', Pool), \
+                mock.patch('expenses.ocr._read', read):
+            call_command('backfill_receipts', chunk_size=2, stdout=output, **options)
+        return chunks, output.getvalue()
+
+    def test_fills_fields_and_hashes_in_chunks(self):
+        chunks, output = self.backfill()
+        self.assertEqual(chunks, [self.receipts[:2], self.receipts[2:4], self.receipts[4:]])
+        self.assertIn('Done: 5 receipts read', output)
+        for receipt in ExpenseReceipt.objects.all():
+            self.assertEqual((receipt.extracted_amount, receipt.extracted_merchant), (Decimal('10.00'), 'FRESH MART'))
+            self.assertIsNotNone(receipt.image_hash)
+        self.assertEqual(BackfillCheckpoint.objects.get().position, self.receipts[-1])
+        # Nothing left to do
+        self.assertEqual(self.backfill()[0], [])
+
+    def test_resumes_after_the_last_committed_chunk(self):
+        with self.assertRaises(RuntimeError):
+            self.backfill(crash_after=1)
+        self.assertEqual(BackfillCheckpoint.objects.get().position, self.receipts[1])
+
+        chunks, output = self.backfill()
+        self.assertIn(f'Resuming after receipt {self.receipts[1]}', output)
+        self.assertEqual(chunks, [self.receipts[2:4], self.receipts[4:]])
+        self.assertFalse(ExpenseReceipt.objects.filter(ocr_text='').exists())
+
+        chunks, _ = self.backfill(restart=True)
+        self.assertEqual(chunks, [])
+
+    def test_unreadable_receipts_go_to_the_ocr_queue(self):
+        broken = ExpenseReceipt.objects.create(
+            expense=self.expense, image=default_storage.save('receipts/broken.png', ContentFile(b'junk')),
+        )
+        with self.assertLogs('expenses.receipt_backfill', 'WARNING'):
+            _, output = self.backfill()
+        self.assertIn('1 queued for a retry', output)
+        self.assertEqual(ReceiptOCRJob.objects.get().receipt_id, broken.pk)
+
+
+class ExpenseSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass'
+        )
+        cls.friend = User.objects.create_user(
+            username='friend', email='friend@example.com', password='pass'
+        )
+        cls.stranger = User.objects.create_user(
+            username='stranger', email='stranger@example.com', password='pass'
+        )
+        cls.trip = ExpenseGroup.objects.create(name='Goa trip', created_by=cls.user)
+        cls.trip.members.add(cls.user, cls.friend)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def expense(self, description, user=None, **fields):
+        user = user or self.user
+        return Expense.objects.create(
+            description=description, amount=100, date=date.today(), paid_by=user, created_by=user, **fields
+        )
+
+    def search(self, query, user=None, **params):
+        self.client.force_authenticate(user or self.user)
+        response = self.client.get('/api/expenses/expenses/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['id'] for row in response.json()['results']]
+
+    def test_ranks_description_matches_first(self):
+        in_notes = self.expense('Dinner', notes='Pizza at the beach shack')
+        in_description = self.expense('Pizza night')
+        tagged = self.expense('Takeaway', tags=['pizza'])
+        self.expense('Groceries')
+        self.assertEqual(self.search('pizza'), [in_description.pk, tagged.pk, in_notes.pk])
+        self.assertEqual(self.search('pizza beach'), [in_notes.pk])
+        # The last word matches as a prefix
+        self.assertEqual(self.search('piz'), self.search('pizza'))
+
+    def test_finds_receipt_text_written_in_bulk(self):
+        expense = self.expense('Groceries')
+        receipt = ExpenseReceipt.objects.create(expense=expense, image='receipts/r.png')
+        self.assertEqual(self.search('balaji'), [])
+        # The OCR worker writes with bulk_update, which sends no signals
+        ExpenseReceipt.objects.bulk_update(
+            [ExpenseReceipt(pk=receipt.pk, ocr_text='Total 100.00', extracted_merchant='Shree Balaji Stores')],
+            ['ocr_text', 'extracted_merchant'],
+        )
+        self.assertEqual(self.search('balaji'), [expense.pk])
+        receipt.delete()
+        self.assertEqual(self.search('balaji'), [])
+
+    def test_follows_edits_and_deletes(self):
+        expense = self.expense('Taxi to airport')
+        expense.description = 'Train to airport'
+        expense.save()
+        self.assertEqual(self.search('taxi'), [])
+        self.assertEqual(self.search('train'), [expense.pk])
+        expense.delete()
+        self.assertEqual(self.search('airport'), [])
+
+    def test_only_visible_expenses_are_found(self):
+        shared = self.expense('Scuba diving', group=self.trip)
+        private = self.expense('Scuba gear')
+        theirs = self.expense('Scuba lessons', user=self.stranger)
+        self.assertEqual(set(self.search('scuba')), {shared.pk, private.pk})
+        self.assertEqual(self.search('scuba', user=self.friend), [shared.pk])
+        self.assertEqual(self.search('scuba', user=self.stranger), [theirs.pk])
+
+        self.trip.members.add(self.stranger)
+        self.assertEqual(set(self.search('scuba', user=self.stranger)), {shared.pk, theirs.pk})
+        self.friend.member_groups.clear()
+        self.assertEqual(self.search('scuba', user=self.friend), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        expense = self.expense('Movie night')
+        self.assertEqual(self.search('movie OR "NEAR(*'), [])
+        self.assertEqual(self.search('movie* -- "night'), [expense.pk])
+        response = self.client.get('/api/expenses/expenses/search/', {'q': '**'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_other_databases_fall_back_to_like(self):
+        expense = self.expense('Pizza night', group=self.trip)
+        self.expense('Pizza', user=self.stranger)
+        tagged = self.expense('Dinner', tags=['Pizza', 'friday'])
+        with mock.patch('expenses.search.connection', mock.Mock(vendor='postgresql')):
+            self.assertEqual(self.search('pizza', user=self.friend), [expense.pk])
+            self.assertEqual(self.search('pizza'), [tagged.pk, expense.pk])
+            self.assertEqual(self.search('friday'), [tagged.pk])
+
+
+class BulkExpenseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass'
+        )
+        cls.friend = User.objects.create_user(
+            username='friend', email='friend@example.com', password='pass'
+        )
+        cls.stranger = User.objects.create_user(
+            username='stranger', email='stranger@example.com', password='pass'
+        )
+        cls.trip = ExpenseGroup.objects.create(name='Goa trip', created_by=cls.user)
+        cls.trip.members.add(cls.user, cls.friend)
+        cls.theirs = ExpenseGroup.objects.create(name='Not mine', created_by=cls.stranger)
+        cls.theirs.members.add(cls.stranger)
+        cls.food = ExpenseCategory.objects.create(name='Food')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def row(self, index, **fields):
+        return {'description': f'Lunch {index}', 'amount': '12.50', 'date': str(date.today()), **fields}
+
+    def post(self, rows):
+        return self.client.post('/api/expenses/expenses/bulk/', {'expenses': rows}, format='json')
+
+    def test_creates_every_row_with_derived_data(self):
+        rows = [self.row(i, category_id=self.food.pk, group_id=self.trip.pk, paid_by_id=self.friend.pk)
+                for i in range(20)]
+        response = self.post(rows)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['created'], 20)
+
+        expenses = Expense.objects.filter(pk__in=response.json()['ids'])
+        self.assertEqual(expenses.filter(created_by=self.user, paid_by=self.friend, currency='INR').count(), 20)
+        self.assertEqual(CategorizationJob.objects.filter(expense__in=expenses).count(), 20)
+        self.assertTrue(UserCategoryMapping.objects.filter(user=self.user, category=self.food).exists())
+        # What the post_save signals would have done
+        self.client.force_authenticate(self.friend)
+        summary = self.client.get('/api/expenses/expenses/summary/').json()
+        self.assertEqual(Decimal(str(summary['total_expenses'])), Decimal('250.00'))
+
+    def test_lookups_do_not_grow_with_the_rows(self):
+        def queries(count):
+            rows = [self.row(i, category_id=self.food.pk, group_id=self.trip.pk) for i in range(count)]
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.post(rows).status_code, 201)
+            return [q['sql'] for q in context.captured_queries if q['sql'].startswith('SELECT')]
+
+        self.assertEqual(len(queries(5)), len(queries(300)))
+
+    def test_reports_errors_per_row_and_creates_nothing(self):
+        rows = [
+            self.row(0),
+            self.row(1, amount='not a number'),
+            self.row(2, category_id=999999),
+            self.row(3, group_id=self.theirs.pk),
+            self.row(4, paid_by_id=self.stranger.pk),
+            self.row(5, group_id=self.trip.pk, paid_by_id=self.stranger.pk),
+            'not an object',
+        ]
+        response = self.post(rows)
+        self.assertEqual(response.status_code, 400)
+        errors = {error['row']: error['errors'] for error in response.json()['errors']}
+        self.assertEqual(set(errors), {1, 2, 3, 4, 5, 6})
+        self.assertIn('amount', errors[1])
+        self.assertIn('category_id', errors[2])
+        self.assertIn('group_id', errors[3])
+        self.assertIn('paid_by_id', errors[4])
+        self.assertIn('paid_by_id', errors[5])
+        self.assertFalse(Expense.objects.exists())
+
+    def test_rejects_empty_and_oversized_requests(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        with mock.patch('expenses.views.MAX_EXPENSES', 2):
+            self.assertEqual(self.post([self.row(i) for i in range(3)]).status_code, 400)
+        self.assertFalse(Expense.objects.exists())
+
+
+class StatementImportTests(TestCase):
+    BANK = (
+        'Date,Narration,Chq./Ref.No.,Withdrawal,Deposit,Closing Balance\n'
+        '01/03/24,UPI/4821/Uber trip to airport,4821,"1,250.50",,10000.00\n'
+        '01/03/24,NEFT CR-SALARY,9911,,"85,000.00",95000.00\n'
+        '02/03/24,Bescom bill,7712,900.00,,94100.00\n'
+        '\n'
+        '31/02/24,Broken date,7713,10.00,,94090.00\n'
+        '03/03/24,PAYEE 42,7714,abc,,94090.00\n'
+        '04/03/24,PAYEE 42,7715,300.00,,93790.00\n'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass'
+        )
+        cls.home = ExpenseCategory.objects.create(name='Home')
+
+    def setUp(self):
+        cache.clear()
+        mapping_cache.clear()
+        detection_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, content, **data):
+        statement = SimpleUploadedFile('statement.csv', content.encode(), content_type='text/csv')
+        return self.client.post('/api/expenses/expenses/import/', {'file': statement, **data}, format='multipart')
+
+    def test_imports_spending_and_reports_bad_rows(self):
+        # What the user filed before wins over the keyword index
+        UserCategoryMapping.objects.create(user=self.user, key=mapping_key('Bescom bill'), category=self.home)
+        response = self.upload(self.BANK, profile='bank')
+        self.assertEqual(response.status_code, 201, response.content)
+        body = response.json()
+        self.assertEqual(
+            {name: body[name] for name in ['imported', 'categorized', 'queued', 'credits', 'invalid']},
+            {'imported': 3, 'categorized': 2, 'queued': 1, 'credits': 1, 'invalid': 2},
+        )
+        self.assertEqual([error['line'] for error in body['errors']], [6, 7])
+
+        expenses = {
+            expense.description: expense for expense in Expense.objects.filter(created_by=self.user, paid_by=self.user)
+        }
+        uber = expenses['UPI/4821/Uber trip to airport']
+        self.assertEqual((uber.amount, uber.date), (Decimal('1250.50'), date(2024, 3, 1)))
+        self.assertEqual(uber.ai_detected_category, 'Transport')
+        self.assertEqual(expenses['Bescom bill'].ai_detected_category, 'Home')
+        self.assertEqual(CategorizationJob.objects.get().expense, expenses['PAYEE 42'])
+        self.assertEqual(CategorizationJob.objects.get().status, 'pending')
+        summary = self.client.get('/api/expenses/expenses/summary/').json()
+        self.assertEqual(Decimal(str(summary['total_expenses'])), Decimal('2450.50'))
+
+        # Rows are inserted without model instances: the other fields still get their defaults
+        self.assertEqual((uber.currency, uber.tags, uber.notes, uber.is_split), ('INR', [], '', False))
+        self.assertIsNotNone(uber.created_at)
+        # and what the signals derive is there as well
+        found = self.client.get('/api/expenses/expenses/search/', {'q': 'bescom'}).json()['results']
+        self.assertEqual([row['description'] for row in found], ['Bescom bill'])
+        rollups = set(ExpenseMonthlyRollup.objects.values_list('user_id', 'month', 'category_id', 'total', 'count'))
+        rebuild_visibility()
+        self.assertEqual(
+            set(ExpenseMonthlyRollup.objects.values_list('user_id', 'month', 'category_id', 'total', 'count')), rollups
+        )
+
+    def test_unusable_statements_import_nothing(self):
+        self.assertEqual(self.upload(self.BANK, profile='nope').status_code, 400)
+        # The card profile wants Description and Amount columns
+        response = self.upload(self.BANK)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("'Description'", response.json()['file'])
+        self.assertEqual(self.client.post('/api/expenses/expenses/import/', {}).status_code, 400)
+        self.assertFalse(Expense.objects.exists())
+
+    def test_oversized_statements_are_refused(self):
+        with override_settings(STATEMENT_IMPORT_MAX_BYTES=len(self.BANK) - 1):
+            self.assertEqual(self.upload(self.BANK, profile='bank').status_code, 413)
+
+        # Refused from the Content-Length alone, before any of the body is read
+        with override_settings(STATEMENT_IMPORT_MAX_BYTES=100, DATA_UPLOAD_MAX_MEMORY_SIZE=100), \
+                mock.patch.object(StatementUploadHandler, 'receive_data_chunk') as receive:
+            self.assertEqual(self.upload(self.BANK, profile='bank').status_code, 413)
+        receive.assert_not_called()
+        self.assertFalse(Expense.objects.exists())
+
+    def test_imports_have_their_own_rate_limit(self):
+        with mock.patch.object(ReceiptUploadThrottle, 'THROTTLE_RATES', {'receipt_upload': '1/minute'}), \
+                mock.patch.object(StatementImportThrottle, 'THROTTLE_RATES', {'statement_import': '2/hour'}):
+            statuses = [
+                self.upload(self.BANK.replace('PAYEE 42', f'PAYEE {n}'), profile='bank').status_code
+                for n in range(3)
+            ]
+        self.assertEqual(statuses, [201, 201, 429])
+
+    def test_sending_a_file_again_resumes_after_committed_chunks(self):
+        rows = [f'0{day}/03/24,Shop {day},{day},{day}00.00,,0' for day in range(1, 8)]
+        statement = '\n'.join(['Date,Narration,Ref,Withdrawal,Deposit,Balance'] + rows)
+        import_chunk = statements.import_chunk
+        in_pairs = partial(statements.import_statement, chunk_size=2)
+        calls = []
+
+        def fail_third_chunk(user, chunk):
+            calls.append(chunk)
+            if len(calls) == 3:
+                raise RuntimeError('worker killed')
+            return import_chunk(user, chunk)
+
+        with mock.patch('expenses.views.import_statement', in_pairs), \
+                mock.patch('expenses.statements.import_chunk', side_effect=fail_third_chunk), \
+                self.assertRaises(RuntimeError):
+            self.upload(statement, profile='bank')
+        self.assertEqual(Expense.objects.count(), 4)
+
+        with mock.patch('expenses.views.import_statement', in_pairs):
+            body = self.upload(statement, profile='bank').json()
+        self.assertEqual((body['resumed_after'], body['imported']), (5, 3))
+        self.assertEqual(
+            sorted(Expense.objects.values_list('description', flat=True)), [f'Shop {day}' for day in range(1, 8)]
+        )
+        # A file imported in full adds nothing
+        self.assertEqual(self.upload(statement, profile='bank').json()['imported'], 0)
+
+    @override_settings(STATEMENT_PROFILES={'semicolons': {
+        'date': 'Booked', 'description': 'Text', 'amount': 'Value', 'spending': 'negative',
+        'delimiter': ';', 'date_formats': ['%Y-%m-%d'],
+    }})
+    def test_command_streams_custom_profiles_in_chunks(self):
+        lines = ['Booked;Text;Value'] + [f'2024-03-{day:02};Coffee {day};-{day}.00' for day in range(1, 6)]
+        lines.append('2024-03-06;Refund;25.00')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as statement:
+            statement.write('\n'.join(lines))
+        self.addCleanup(os.remove, statement.name)
+
+        output = io.StringIO()
+        call_command('import_statement', statement.name, user='owner', profile='semicolons', chunk_size=2,
+                     stdout=output)
+        self.assertEqual(output.getvalue().count('Imported'), 3)
+        self.assertIn('Done: 5 expenses', output.getvalue())
+        self.assertEqual(sorted(Expense.objects.values_list('amount', flat=True)), [Decimal(n) for n in range(1, 6)])
+
+        call_command('import_statement', statement.name, user='owner', profile='semicolons', stdout=output)
+        self.assertIn('Done: 0 expenses', output.getvalue())
+        call_command('import_statement', statement.name, user='owner', profile='semicolons', restart=True,
+                     stdout=output)
+        self.assertEqual(Expense.objects.count(), 10)
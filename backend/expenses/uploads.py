@@ -0,0 +1,186 @@
+"""
+Streaming receipt uploads.
+
+With Django's default handlers a file of up to 2.5 MB is held in
+memory, and DRF's ImageField then opens every upload with Pillow again
+to verify it, copying in-memory ones once more. When a whole group
+uploads after a trip, those buffers pile up on the worker.
+
+ReceiptUploadParser hands multipart bodies to ReceiptUploadHandler
+instead. The handler writes each chunk straight to a temporary file,
+hashes it on the way, and keeps only the first HEADER_BYTES long enough
+for Pillow to identify the format and dimensions. A body whose
+Content-Length is over RECEIPT_UPLOAD_MAX_BYTES is refused before any of
+it is read; a file that grows past the limit is refused as soon as it
+does, and one that is not a JPEG, PNG or WebP after its header. The
+stored file is moved, not copied, out of the temporary one.
+StreamedImageField accepts what the handler has checked without opening
+it again. ReceiptUploadThrottle limits how often each user sends files;
+throttles run before the view touches the body. The size limit applies to
+each request, so the rate is what bounds how much one user can send, and
+it only holds across workers if UPLOAD_THROTTLE_CACHE names a cache they
+share.
+
+CSV statements for POST /expenses/import/ go through StatementUploadParser,
+whose handler streams them to a temporary file under the same size
+checks against STATEMENT_IMPORT_MAX_BYTES. Imports are limited by
+StatementImportThrottle rather than the receipt quota.
+"""
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParser as DjangoMultiPartParser, MultiPartParserError
+from PIL import Image
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException, ParseError, ValidationError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+from rest_framework.throttling import UserRateThrottle
+
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+# Enough for a JPEG whose EXIF block carries an embedded preview
+HEADER_BYTES = 256 * 1024
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Uploads are limited in size.'
+    default_code = 'upload_too_large'
+
+
+def _too_large(what, limit):
+    return UploadTooLarge(f'{what} must be at most {limit / (1024 * 1024):g} MB.')
+
+
+class ReceiptUploadHandler(TemporaryFileUploadHandler):
+    """Stream every file to disk, hashing it and checking its image header as it arrives"""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Room for the ordinary form fields, which Django caps separately
+        if content_length > settings.RECEIPT_UPLOAD_MAX_BYTES + settings.DATA_UPLOAD_MAX_MEMORY_SIZE:
+            raise _too_large('Receipt images', settings.RECEIPT_UPLOAD_MAX_BYTES)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.received = 0
+        self.header = bytearray()
+        self.image = None
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.RECEIPT_UPLOAD_MAX_BYTES:
+            self._reject(_too_large('Receipt images', settings.RECEIPT_UPLOAD_MAX_BYTES))
+        self.digest.update(raw_data)
+        if self.image is None:
+            self.header += raw_data
+            self._identify()
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if self.image is None:
+            self._identify(complete=True)
+        upload = super().file_complete(file_size)
+        upload.sha256 = self.digest.hexdigest()
+        upload.image_format, upload.image_size = self.image
+        return upload
+
+    def _identify(self, complete=False):
+        """Try to read the header seen so far; reject once it cannot be an image we take"""
+        try:
+            with Image.open(io.BytesIO(self.header)) as image:
+                self.image = image.format, image.size
+        except Image.DecompressionBombError:
+            self._reject(ValidationError({self.field_name: ['Image dimensions are too large.']}))
+        except (OSError, SyntaxError, ValueError):
+            # Not identified yet; a longer prefix may still be a valid header
+            if complete or len(self.header) >= HEADER_BYTES:
+                self._reject(ValidationError({self.field_name: ['Upload a JPEG, PNG or WebP image.']}))
+            return
+        self.header = None
+        if self.image[0] not in ALLOWED_FORMATS:
+            self._reject(ValidationError({self.field_name: ['Upload a JPEG, PNG or WebP image.']}))
+
+    def _reject(self, error):
+        self.file.close()
+        raise error
+
+
+class StatementUploadHandler(TemporaryFileUploadHandler):
+    """Stream a statement to disk, refusing it as soon as it is known to be over the limit"""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length > settings.STATEMENT_IMPORT_MAX_BYTES + settings.DATA_UPLOAD_MAX_MEMORY_SIZE:
+            raise _too_large('Statements', settings.STATEMENT_IMPORT_MAX_BYTES)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.STATEMENT_IMPORT_MAX_BYTES:
+            self.file.close()
+            raise _too_large('Statements', settings.STATEMENT_IMPORT_MAX_BYTES)
+        return super().receive_data_chunk(raw_data, start)
+
+
+class StreamingUploadParser(MultiPartParser):
+    """MultiPartParser that streams files through handler_class alone"""
+    handler_class = None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+        handlers = [self.handler_class(request)]
+        try:
+            encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+            parser = DjangoMultiPartParser(meta, stream, handlers, encoding)
+            data, files = parser.parse()
+        except MultiPartParserError as exc:
+            raise ParseError(f'Multipart form parse error - {exc}')
+        return DataAndFiles(data, files)
+
+
+class ReceiptUploadParser(StreamingUploadParser):
+    handler_class = ReceiptUploadHandler
+
+
+class StatementUploadParser(StreamingUploadParser):
+    handler_class = StatementUploadHandler
+
+
+class StreamedImageField(serializers.ImageField):
+    """ImageField that trusts ReceiptUploadHandler's check instead of reopening the file"""
+
+    def to_internal_value(self, data):
+        if getattr(data, 'image_format', None) in ALLOWED_FORMATS:
+            return serializers.FileField.to_internal_value(self, data)
+        return super().to_internal_value(data)
+
+
+class UploadRateThrottle(UserRateThrottle):
+    """UserRateThrottle counting in the UPLOAD_THROTTLE_CACHE alias, which workers should share"""
+
+    @property
+    def cache(self):
+        return caches[settings.UPLOAD_THROTTLE_CACHE]
+
+
+class ReceiptUploadThrottle(UploadRateThrottle):
+    """Per-user rate limit on requests carrying files; everything else passes"""
+    scope = 'receipt_upload'
+
+    def allow_request(self, request, view):
+        if not request.content_type.startswith('multipart/form-data'):
+            return True
+        return super().allow_request(request, view)
+
+
+class StatementImportThrottle(UploadRateThrottle):
+    """Per-user rate limit on statement imports, kept apart from the receipt quota"""
+    scope = 'statement_import'
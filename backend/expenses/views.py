@@ -1,26 +1,62 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
-from django.db.models import Sum, Q, Count
+from rest_framework.parsers import JSONParser, FormParser
+from django.db import transaction
+from django.db.models import Q, Sum
 from django.utils import timezone
 from datetime import datetime, timedelta
-import requests
 import json
 
-from .models import ExpenseCategory, ExpenseGroup, Expense, ExpenseSplit, ExpenseReceipt
+from .models import (
+    ExpenseCategory, ExpenseGroup, ExpenseSplit, ExpenseReceipt, ExpenseMonthlyRollup,
+    GroupBalance
+)
+from .bulk import MAX_EXPENSES, create_expenses, validate_expenses
+from .categorization_jobs import enqueue_categorization
+from .conditional import (
+    categories_version, conditional_get, expenses_version, groups_version, summary_version,
+    timeseries_version,
+)
+from .detection import DETECTION_REASONS, detect, detect_many
+from .detection_cache import detection_cache
+from .pagination import ExpenseCursorPagination
+from .receipt_duplicates import match_upload
+from .receipt_jobs import enqueue_ocr
+from .search import DEFAULT_LIMIT, MAX_LIMIT, search_expense_ids, search_terms
+from .statements import (
+    StatementError, checkpoint_name, file_digest, get_profile, import_statement, text_lines
+)
+from .settlement import member_positions, settle
+from .summary_cache import cached_summary, reset_summary_cache_stats, summary_cache_stats
+from .timeseries import DEFAULT_SPAN, DIMENSIONS, INTERVALS, MAX_DAYS, spending_series
+from .uploads import (
+    ReceiptUploadParser, ReceiptUploadThrottle, StatementImportThrottle, StatementUploadParser
+)
+from .visibility import visible_expenses
 from .serializers import (
     ExpenseCategorySerializer, ExpenseGroupSerializer, ExpenseGroupCreateSerializer,
-    ExpenseSerializer, ExpenseCreateSerializer, ExpenseSplitSerializer,
-    ExpenseReceiptSerializer, AICategoryDetectionSerializer, AICategoryDetectionResponseSerializer
+    ExpenseSerializer, ExpenseListSerializer, ExpenseCreateSerializer, ExpenseSplitSerializer,
+    ExpenseReceiptSerializer, AICategoryDetectionSerializer, AICategoryBatchDetectionSerializer,
+    AICategoryDetectionResponseSerializer, GroupBalanceSerializer
 )
 
+
 class ExpenseCategoryViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for expense categories"""
     queryset = ExpenseCategory.objects.all()
     serializer_class = ExpenseCategorySerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @conditional_get(categories_version)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_get(categories_version)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 class ExpenseGroupViewSet(viewsets.ModelViewSet):
     """ViewSet for expense groups"""
     permission_classes = [permissions.IsAuthenticated]
@@ -34,105 +70,279 @@ class ExpenseGroupViewSet(viewsets.ModelViewSet):
             return ExpenseGroupCreateSerializer
         return ExpenseGroupSerializer
 
+    @conditional_get(groups_version)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_get(groups_version)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=True, methods=['get'])
+    def balances(self, request, pk=None):
+        """Net balances between the group's members from the ledger"""
+        group = self.get_object()
+        balances = group.balances.select_related('debtor', 'creditor')
+        return Response(GroupBalanceSerializer(balances, many=True).data)
+
+    @action(detail=True, methods=['get'], url_path='settle-up')
+    def settle_up(self, request, pk=None):
+        """Fewest transfers that settle every member's net position in the group"""
+        group = self.get_object()
+        positions = member_positions(group)
+        transfers = settle(positions)
+        return Response({
+            'positions': {str(user_id): str(amount) for user_id, amount in positions.items()},
+            'transfers': [
+                {'from_user': debtor_id, 'to_user': creditor_id, 'amount': str(amount)}
+                for debtor_id, creditor_id, amount in transfers
+            ],
+        })
+
 class ExpenseViewSet(viewsets.ModelViewSet):
     """ViewSet for expenses"""
     permission_classes = [permissions.IsAuthenticated]
-    parser_classes = [JSONParser, MultiPartParser, FormParser]
+    parser_classes = [JSONParser, ReceiptUploadParser, FormParser]
+    throttle_classes = [ReceiptUploadThrottle]
+    pagination_class = ExpenseCursorPagination
     
     def get_queryset(self):
         user = self.request.user
-        queryset = Expense.objects.filter(
-            Q(created_by=user) | Q(paid_by=user) | Q(group__members=user)
-        ).select_related('category', 'group', 'paid_by', 'created_by')
+        params = self.request.query_params
+        filters = {}
         
-        # Filter by category
-        category = self.request.query_params.get('category', None)
-        if category:
-            queryset = queryset.filter(category__name=category)
+        # Filter by category, by id or by name resolved to its id
+        category_id = self._id_param('category_id')
+        if category_id is None and params.get('category'):
+            category_id = ExpenseCategory.objects.filter(
+                name=params['category']
+            ).values_list('id', flat=True).first()
+            if category_id is None:
+                return visible_expenses(user).none()
+        if category_id is not None:
+            filters['category_id'] = category_id
         
-        # Filter by group
-        group = self.request.query_params.get('group', None)
-        if group:
-            queryset = queryset.filter(group__name=group)
+        # Filter by group, by id or by the name of one of the user's groups
+        group_id = self._id_param('group_id')
+        if group_id is not None:
+            filters['group_id'] = group_id
+        elif params.get('group'):
+            group_ids = list(ExpenseGroup.objects.filter(
+                members=user, name=params['group']
+            ).order_by().values_list('id', flat=True))
+            if not group_ids:
+                return visible_expenses(user).none()
+            if len(group_ids) == 1:
+                filters['group_id'] = group_ids[0]
+            else:
+                filters['group_id__in'] = group_ids
         
         # Filter by date range
-        start_date = self.request.query_params.get('start_date', None)
-        end_date = self.request.query_params.get('end_date', None)
+        start_date = params.get('start_date', None)
+        end_date = params.get('end_date', None)
         
         if start_date:
-            queryset = queryset.filter(date__gte=start_date)
+            filters['date__gte'] = start_date
         if end_date:
-            queryset = queryset.filter(date__lte=end_date)
+            filters['date__lte'] = end_date
         
-        return queryset.distinct()
+        return visible_expenses(user, **filters).select_related(
+            'category', 'group', 'paid_by', 'created_by'
+        )
+    
+    def _id_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({name: ['A valid integer is required.']})
     
     def get_serializer_class(self):
         if self.action == 'create':
             return ExpenseCreateSerializer
         return ExpenseSerializer
     
+    @conditional_get(expenses_version)
+    def list(self, request, *args, **kwargs):
+        """List expenses from values() rows; see ExpenseListSerializer for ?fields= and ?expand="""
+        serializer = ExpenseListSerializer(context=self.get_serializer_context())
+        queryset = serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response([serializer.to_representation(row) for row in page])
+    
+    @conditional_get(expenses_version)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
+    # Writes run in one transaction with the visibility and rollup updates
+    # their signals make, so the summary never sees half of a change.
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(created_by=self.request.user)
+        expense = serializer.save(created_by=self.request.user)
+        # The categorize_expenses worker fills the AI category after the response
+        enqueue_categorization([expense.pk])
+    
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+    
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Create many expenses at once; if any row is invalid, none are created"""
+        rows = request.data.get('expenses') if isinstance(request.data, dict) else None
+        if not isinstance(rows, list) or not rows:
+            raise ValidationError({'expenses': 'Send a non-empty list of expenses.'})
+        if len(rows) > MAX_EXPENSES:
+            raise ValidationError({'expenses': f'At most {MAX_EXPENSES} expenses per request.'})
+
+        validated, errors = validate_expenses(request.user, rows)
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        expenses = create_expenses(request.user, validated)
+        return Response(
+            {'created': len(expenses), 'ids': [expense.pk for expense in expenses]},
+            status=status.HTTP_201_CREATED,
+        )
+    
+    @action(detail=False, methods=['post'], url_path='import',
+            parser_classes=[StatementUploadParser], throttle_classes=[StatementImportThrottle])
+    def import_statement(self, request):
+        """
+        Import the spending rows of a CSV bank or card statement as
+        expenses. Sending the same file again resumes after the rows
+        already committed.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': 'Upload the statement as a CSV file.'})
+        try:
+            profile = get_profile(request.data.get('profile', 'card'))
+            checkpoint = checkpoint_name(request.user, file_digest(upload))
+            stats, errors = import_statement(request.user, text_lines(upload), profile, checkpoint=checkpoint)
+        except StatementError as error:
+            raise ValidationError({'file': str(error)})
+        return Response({**stats, 'errors': errors}, status=status.HTTP_201_CREATED)
     
     @action(detail=False, methods=['get'])
+    @conditional_get(summary_version)
     def summary(self, request):
         """Get expense summary statistics"""
         user = request.user
+        return Response(cached_summary(user, request.content_version, lambda: self._build_summary(user)))
+    
+    @action(detail=False, methods=['get', 'post'], url_path='summary/cache-stats',
+            permission_classes=[permissions.IsAdminUser])
+    def summary_cache_stats(self, request):
+        """Hit and miss counters of the summary cache; POST also resets them"""
+        stats = summary_cache_stats()
+        if request.method == 'POST':
+            reset_summary_cache_stats()
+        return Response(stats)
+    
+    def _build_summary(self, user):
         today = timezone.now().date()
         month_start = today.replace(day=1)
         
-        # Total expenses
-        total_expenses = Expense.objects.filter(
-            Q(created_by=user) | Q(paid_by=user) | Q(group__members=user)
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        # This month expenses
-        month_expenses = Expense.objects.filter(
-            Q(created_by=user) | Q(paid_by=user) | Q(group__members=user),
-            date__gte=month_start
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        # One indexed read of the user's monthly rollups; the handful of
+        # (month, category) rows is folded into every figure in Python
+        rollups = ExpenseMonthlyRollup.objects.filter(user=user).order_by().values_list(
+            'month', 'category__name', 'total', 'count'
+        )
         
-        # Total count
-        total_count = Expense.objects.filter(
-            Q(created_by=user) | Q(paid_by=user) | Q(group__members=user)
-        ).count()
+        total_expenses = 0
+        month_expenses = 0
+        total_count = 0
+        by_category = {}
+        for month, category_name, total, count in rollups:
+            total_expenses += total
+            total_count += count
+            if month == month_start:
+                month_expenses += total
+            bucket = by_category.setdefault(category_name, {'category__name': category_name, 'total': 0, 'count': 0})
+            bucket['total'] += total
+            bucket['count'] += count
         
-        # Category breakdown
-        category_breakdown = Expense.objects.filter(
-            Q(created_by=user) | Q(paid_by=user) | Q(group__members=user)
-        ).values('category__name').annotate(
-            total=Sum('amount'),
-            count=Count('id')
-        ).order_by('-total')
+        category_breakdown = sorted(by_category.values(), key=lambda row: row['total'], reverse=True)
         
         # Calculate owed amounts
         owed_amount = self._calculate_owed_amount(user)
         
-        return Response({
+        return {
             'total_expenses': float(total_expenses),
             'month_expenses': float(month_expenses),
             'total_count': total_count,
             'category_breakdown': list(category_breakdown),
             'owed_amount': float(owed_amount)
-        })
+        }
     
-    def _calculate_owed_amount(self, user):
-        """Calculate total amount owed to the user"""
-        # Get expenses paid by user in groups
-        user_paid_expenses = Expense.objects.filter(
-            paid_by=user,
-            group__isnull=False,
-            is_split=True
-        )
+    @action(detail=False, methods=['get'])
+    @conditional_get(timeseries_version)
+    def timeseries(self, request):
+        """Gap-filled daily, weekly or monthly spend series, optionally per category or group"""
+        params = request.query_params
+        interval = params.get('interval', 'month')
+        if interval not in INTERVALS:
+            raise ValidationError({'interval': [f"Choose one of: {', '.join(INTERVALS)}."]})
+        by = params.get('by') or None
+        if by is not None and by not in DIMENSIONS:
+            raise ValidationError({'by': [f"Choose one of: {', '.join(DIMENSIONS)}."]})
         
-        total_owed = 0
-        for expense in user_paid_expenses:
-            group_members = expense.group.members.exclude(id=user.id)
-            if group_members.exists():
-                split_amount = expense.amount / (group_members.count() + 1)  # +1 for user
-                total_owed += split_amount * group_members.count()
+        end_date = self._date_param('end_date') or timezone.now().date()
+        start_date = self._date_param('start_date') or end_date - DEFAULT_SPAN
+        if start_date > end_date:
+            raise ValidationError({'start_date': ['Must not be after end_date.']})
+        if (end_date - start_date).days > MAX_DAYS:
+            raise ValidationError({'start_date': [f'The range may span at most {MAX_DAYS} days.']})
         
-        return total_owed
+        filters = {}
+        for name in ('category_id', 'group_id'):
+            value = self._id_param(name)
+            if value is not None:
+                filters[name] = value
+        
+        return Response(spending_series(
+            request.user, start_date, end_date, interval=interval, by=by, **filters
+        ))
+    
+    def _date_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise ValidationError({name: ['Use the YYYY-MM-DD format.']})
+    
+    def _calculate_owed_amount(self, user):
+        """Calculate total amount owed to the user from the group balance ledger"""
+        return GroupBalance.objects.filter(creditor=user).aggregate(
+            total=Sum('amount')
+        )['total'] or 0
+    
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Expenses whose text or receipts match ?q=, best first; ?fields= and ?expand= work as in list"""
+        query = request.query_params.get('q', '')
+        if not search_terms(query):
+            raise ValidationError({'q': ['Enter a word to search for.']})
+        limit = min(self._id_param('limit') or DEFAULT_LIMIT, MAX_LIMIT)
+        
+        expense_ids = search_expense_ids(request.user, query, limit)
+        serializer = ExpenseListSerializer(context=self.get_serializer_context())
+        # Rows come back in rank order below, so the model's default ordering is dropped
+        rows = {
+            row['visible_id']: row
+            for row in serializer.values(visible_expenses(request.user).filter(id__in=expense_ids).order_by())
+        }
+        return Response({
+            'results': [serializer.to_representation(rows[pk]) for pk in expense_ids if pk in rows],
+        })
     
     @action(detail=False, methods=['post'])
     def detect_category(self, request):
@@ -140,15 +350,14 @@ class ExpenseViewSet(viewsets.ModelViewSet):
         serializer = AICategoryDetectionSerializer(data=request.data)
         if serializer.is_valid():
             description = serializer.validated_data['description']
-            amount = serializer.validated_data.get('amount', 0)
             
-            # Use Ollama for category detection
-            detected_category = self._detect_category_with_ollama(description, amount)
+            # The local model answers first; Ollama only sees what it is unsure of
+            detection = detect(description, user=request.user)
             
             response_data = {
-                'category': detected_category,
-                'confidence': 0.95,  # High confidence for LLM
-                'reasoning': f"AI detected '{detected_category}' using Ollama LLM"
+                'category': detection.category,
+                'confidence': detection.confidence,
+                'reasoning': DETECTION_REASONS[detection.source].format(category=detection.category)
             }
             
             response_serializer = AICategoryDetectionResponseSerializer(response_data)
@@ -156,110 +365,34 @@ class ExpenseViewSet(viewsets.ModelViewSet):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    def _detect_category_with_ollama(self, description, amount):
-        """Use Ollama LLM to detect expense category"""
-        try:
-            # Ollama API endpoint (default localhost:11434)
-            ollama_url = "http://localhost:11434/api/generate"
-            
-            # Create a prompt for the LLM (biased to map groceries → Food)
-            prompt = f"""
-            Classify the expense description into ONE of:
-            Food, Entertainment, Transport, Shopping, Bills, Healthcare, Education, Travel, Home, Other.
-
-            Rules:
-            - Return ONLY the category name.
-            - Groceries (milk, curd/yogurt, paneer, bread, butter, cheese, vegetables, fruits, banana, apple, eggs, rice, wheat/flour/atta, dal/lentils/pulses, oil, spices, sugar, tea, coffee, grocery/supermarket/kirana) => Food.
-            - Restaurant, meal, delivery, cafe, snack => Food.
-            - If unsure between Food and Shopping, choose Food.
-
-            Description: "{description}"
-            Category:
-            """
-            
-            payload = {
-                "model": "llama3.2",  # You can change this to any model you have
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.1,  # Low temperature for consistent results
-                    "top_p": 0.9
-                }
+    @action(detail=False, methods=['post'], url_path='detect_category/batch')
+    def detect_category_batch(self, request):
+        """Detect categories for many descriptions at once, e.g. the lines of a statement"""
+        serializer = AICategoryBatchDetectionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        descriptions = serializer.validated_data['descriptions']
+        
+        detections, unique, llm_calls = detect_many(descriptions, user=request.user)
+        items = [
+            {
+                'description': description,
+                'category': detection.category,
+                'source': detection.source,
+                'confidence': detection.confidence,
+                'latency_ms': round(detection.seconds * 1000, 2),
             }
-            
-            response = requests.post(ollama_url, json=payload, timeout=10)
-            
-            if response.status_code == 200:
-                result = response.json()
-                category = result.get('response', '').strip()
-                
-                # Validate the category
-                valid_categories = [
-                    'Food', 'Entertainment', 'Transport', 'Shopping', 
-                    'Bills', 'Healthcare', 'Education', 'Travel', 'Home', 'Other'
-                ]
-                
-                # Clean up the response and find the best match
-                category = category.replace('"', '').replace("'", "").strip()
-                
-                # Keyword hinting: prefer deterministic mapping for groceries → Food
-                def keyword_hint(text: str):
-                    t = text.lower()
-                    grocery_words = ['milk', 'curd', 'yogurt', 'paneer', 'butter', 'cheese', 'bread', 'vegetable', 'veggies', 'fruit', 'banana', 'apple', 'egg', 'eggs', 'rice', 'wheat', 'atta', 'flour', 'dal', 'lentil', 'lentils', 'pulse', 'pulses', 'oil', 'spice', 'spices', 'sugar', 'salt', 'tea', 'coffee', 'grocery', 'supermarket', 'kirana']
-                    return 'Food' if any(w in t for w in grocery_words) else None
-
-                hint = keyword_hint(description)
-
-                # Find exact match first
-                if category in valid_categories:
-                    if hint and category != hint:
-                        return hint
-                    return category
-                
-                # Try to find partial matches
-                for valid_cat in valid_categories:
-                    if valid_cat.lower() in category.lower() or category.lower() in valid_cat.lower():
-                        return hint or valid_cat
-                
-                # Default fallback
-                return hint or 'Other'
-            else:
-                # Fallback to keyword-based detection if Ollama fails
-                return self._fallback_category_detection(description, amount)
-                
-        except Exception as e:
-            print(f"Ollama API error: {e}")
-            # Fallback to keyword-based detection
-            return self._fallback_category_detection(description, amount)
+            for description, detection in zip(descriptions, detections)
+        ]
+        return Response({'results': items, 'unique': unique, 'llm_calls': llm_calls})
     
-    def _fallback_category_detection(self, description, amount):
-        """Fallback category detection using keywords"""
-        description_lower = description.lower()
-        
-        grocery_words = ['milk', 'curd', 'yogurt', 'paneer', 'butter', 'cheese', 'bread', 'vegetable', 'veggies', 'fruit', 'banana', 'apple', 'egg', 'eggs', 'rice', 'wheat', 'atta', 'flour', 'dal', 'lentil', 'lentils', 'pulse', 'pulses', 'oil', 'spice', 'spices', 'sugar', 'salt', 'tea', 'coffee', 'grocery', 'supermarket', 'kirana']
-        if any(word in description_lower for word in grocery_words):
-            return 'Food'
-
-        if any(word in description_lower for word in ['food', 'restaurant', 'dinner', 'lunch', 'breakfast', 'grocery', 'pizza', 'burger', 'coffee', 'tea', 'snack', 'meal', 'cafe', 'bakery', 'sweets', 'chocolate', 'ice cream', 'juice', 'water']):
-            return 'Food'
-        elif any(word in description_lower for word in ['movie', 'cinema', 'theatre', 'game', 'concert', 'party', 'show', 'ticket', 'entertainment', 'fun', 'amusement', 'park', 'museum', 'exhibition', 'festival', 'event', 'booking', 'reservation']):
-            return 'Entertainment'
-        elif any(word in description_lower for word in ['uber', 'taxi', 'cab', 'fuel', 'gas', 'parking', 'bus', 'train', 'metro', 'subway', 'flight', 'airplane', 'car', 'bike', 'scooter', 'maintenance', 'repair', 'insurance', 'toll', 'fare']):
-            return 'Transport'
-        elif any(word in description_lower for word in ['shirt', 'shoes', 'dress', 'clothes', 'fashion', 'shopping', 'store', 'mall', 'market', 'shop', 'buy', 'purchase', 'retail', 'electronics', 'phone', 'laptop', 'accessories', 'jewelry']):
-            return 'Shopping'
-        elif any(word in description_lower for word in ['electricity', 'water', 'internet', 'rent', 'bill', 'utility', 'phone', 'mobile', 'subscription', 'service', 'maintenance', 'insurance', 'tax', 'fees', 'charges']):
-            return 'Bills'
-        elif any(word in description_lower for word in ['medicine', 'doctor', 'hospital', 'pharmacy', 'medical', 'health', 'dental', 'eye', 'vision', 'therapy', 'treatment', 'consultation', 'prescription', 'vitamins', 'supplements']):
-            return 'Healthcare'
-        elif any(word in description_lower for word in ['course', 'book', 'training', 'workshop', 'education', 'school', 'college', 'university', 'class', 'lesson', 'tutorial']):
-            return 'Education'
-        elif any(word in description_lower for word in ['hotel', 'vacation', 'tourism', 'travel', 'trip', 'journey', 'flight', 'accommodation', 'resort', 'lodging']):
-            return 'Travel'
-        elif any(word in description_lower for word in ['furniture', 'repair', 'maintenance', 'household', 'home', 'kitchen', 'bathroom', 'bedroom', 'living room', 'garden', 'yard']):
-            return 'Home'
-        else:
-            return 'Other'
+    @action(detail=False, methods=['get', 'post'], url_path='detect_category/cache-stats',
+            permission_classes=[permissions.IsAdminUser])
+    def detection_cache_stats(self, request):
+        """Hit, miss and eviction counters of the detection cache; POST also clears it"""
+        stats = detection_cache.stats()
+        if request.method == 'POST':
+            detection_cache.clear()
+        return Response(stats)
 
 class ExpenseSplitViewSet(viewsets.ModelViewSet):
     """ViewSet for expense splits"""
@@ -276,7 +409,8 @@ class ExpenseReceiptViewSet(viewsets.ModelViewSet):
     """ViewSet for expense receipts"""
     serializer_class = ExpenseReceiptSerializer
     permission_classes = [permissions.IsAuthenticated]
-    parser_classes = [MultiPartParser, FormParser]
+    parser_classes = [ReceiptUploadParser, FormParser]
+    throttle_classes = [ReceiptUploadThrottle]
     
     def get_queryset(self):
         user = self.request.user
@@ -284,7 +418,10 @@ class ExpenseReceiptViewSet(viewsets.ModelViewSet):
             expense__created_by=user
         ).select_related('expense')
     
+    @transaction.atomic
     def perform_create(self, serializer):
-        # Here you could add OCR processing logic
-        # For now, we'll just save the receipt
-        serializer.save()
+        fields = match_upload(self.request.user, serializer.validated_data['image'])
+        receipt = serializer.save(**fields)
+        if 'ocr_text' not in fields:
+            # The process_receipts worker reads the image after the upload returns
+            enqueue_ocr([receipt.pk])
@@ -0,0 +1,257 @@
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Expense, ExpenseGroup, ExpenseVisibility
+from .rollups import apply_rollup_deltas, rebuild_rollups, rollup_deltas
+
+# Keeps IN (...) lists well under SQLite's bound-parameter limit
+CHUNK_SIZE = 500
+
+VISIBILITY_FIELDS = ('id', 'created_by_id', 'paid_by_id', 'group_id', 'category_id', 'date', 'created_at', 'amount')
+
+# Writes the search index documents (see search.py) of the listed expenses, viewers included
+INDEX_SQL = """
+    REPLACE INTO expenses_search (rowid, description, notes, location, tags, receipts, viewers)
+    SELECT id, description, notes, location, tags,
+        coalesce((
+            SELECT group_concat(extracted_merchant || ' ' || ocr_text, ' ')
+            FROM expenses_expensereceipt WHERE expense_id = expenses_expense.id
+        ), ''),
+        coalesce((
+            SELECT group_concat('u' || user_id, ' ')
+            FROM expenses_expensevisibility WHERE expense_id = expenses_expense.id
+        ), '')
+    FROM expenses_expense WHERE id IN ({ids})
+"""
+
+# Inserts the visibility rows of the listed new expenses: their creator,
+# their payer and the members of their group, each once
+ADD_SQL = """
+    INSERT INTO expenses_expensevisibility
+        (user_id, expense_id, date, created_at, amount, category_id, group_id, updated_at)
+    SELECT viewer.user_id, expense.id, expense.date, expense.created_at, expense.amount,
+        expense.category_id, expense.group_id, %s
+    FROM expenses_expense expense JOIN (
+        SELECT id AS expense_id, created_by_id AS user_id FROM expenses_expense WHERE id IN ({ids})
+        UNION SELECT id, paid_by_id FROM expenses_expense WHERE id IN ({ids})
+        UNION SELECT grouped.id, member.customuser_id
+        FROM expenses_expense grouped
+        JOIN expenses_expensegroup_members member ON member.expensegroup_id = grouped.group_id
+        WHERE grouped.id IN ({ids})
+    ) viewer ON viewer.expense_id = expense.id
+"""
+
+
+def visible_expenses(user, **filters):
+    """
+    Expenses the user can see, driven off the visibility table.
+
+    Keyword filters are lookups on the visibility row (date__gte,
+    category_id, group_id, ...). They are applied in the same filter() call
+    as the user predicate so they reuse its join. The sort key is annotated
+    from the visibility row as well, so filtering and ordering stay on the
+    (user, [category | group,] date, created_at, expense) indexes instead
+    of joining back through the expense table.
+    """
+    lookups = {f'visibility__{lookup}': value for lookup, value in filters.items()}
+    return Expense.objects.filter(visibility__user=user, **lookups).annotate(
+        visible_date=F('visibility__date'),
+        visible_created_at=F('visibility__created_at'),
+        visible_id=F('visibility__expense_id'),
+    )
+
+
+def chunked(ids):
+    """Split ids into lists small enough for an IN (...) clause"""
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def group_members(group_ids):
+    """Map each group id to the set of its member ids"""
+    members = defaultdict(set)
+    if group_ids:
+        memberships = ExpenseGroup.members.through.objects.filter(
+            expensegroup_id__in=group_ids
+        ).values_list('expensegroup_id', 'customuser_id')
+        for group_id, user_id in memberships:
+            members[group_id].add(user_id)
+    return members
+
+
+def compute_visibility(expense_ids):
+    """Return the visibility rows the given expenses should have, keyed by (user_id, expense_id)"""
+    return _visibility(list(Expense.objects.filter(id__in=expense_ids).values_list(*VISIBILITY_FIELDS)))
+
+
+def _visibility(rows):
+    members = group_members({row[3] for row in rows if row[3]})
+
+    visibility = {}
+    for row in rows:
+        expense_id, created_by_id, paid_by_id, group_id = row[:4]
+        for user_id in {created_by_id, paid_by_id} | members.get(group_id, set()):
+            visibility[(user_id, expense_id)] = _visibility_row(user_id, row)
+    return visibility
+
+
+def _visibility_row(user_id, row):
+    """The visibility row giving user_id the expense read as VISIBILITY_FIELDS"""
+    expense_id, _, _, group_id, category_id, date, created_at, amount = row
+    return ExpenseVisibility(
+        user_id=user_id,
+        expense_id=expense_id,
+        date=date,
+        created_at=created_at,
+        amount=amount,
+        category_id=category_id,
+        group_id=group_id,
+    )
+
+
+def _in(chunk):
+    return ', '.join(['%s'] * len(chunk))
+
+
+def index_expenses(expense_ids):
+    """
+    Write the search documents of the given expenses, viewers included,
+    once per expense however many of its visibility rows changed. A
+    no-op off SQLite, which has no index.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for chunk in chunked(expense_ids):
+            cursor.execute(INDEX_SQL.format(ids=_in(chunk)), chunk)
+
+
+def add_visibility(expense_ids):
+    """
+    Create the visibility rows, rollups and search documents of expenses
+    just inserted. Rows are copied in the database, one INSERT ... SELECT
+    per chunk, and the rollups come from one grouped read of them.
+    Returns the ids of the users who gained rows.
+    """
+    user_ids = set()
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with transaction.atomic(), connection.cursor() as cursor:
+        for chunk in chunked(expense_ids):
+            cursor.execute(ADD_SQL.format(ids=_in(chunk)), [now] + chunk * 3)
+            added = (
+                ExpenseVisibility.objects.filter(expense_id__in=chunk)
+                .annotate(month=TruncMonth('date')).order_by()
+                .values_list('user_id', 'month', 'category_id')
+                .annotate(total=Sum('amount'), count=Count('id'))
+            )
+            deltas = {
+                (user_id, month, category_id): [total, count]
+                for user_id, month, category_id, total, count in added
+            }
+            apply_rollup_deltas(deltas)
+            user_ids.update(user_id for user_id, _, _ in deltas)
+            index_expenses(chunk)
+    return user_ids
+
+
+def _rollup_rows(visibility_rows):
+    return [(row.user_id, row.date, row.category_id, row.amount) for row in visibility_rows]
+
+
+def _delete_visibility(expense_ids):
+    """Delete the visibility rows of the given expenses and return them as rollup rows"""
+    rows = ExpenseVisibility.objects.filter(expense_id__in=expense_ids)
+    removed = list(rows.values_list('user_id', 'date', 'category_id', 'amount'))
+    rows.delete()
+    return removed
+
+
+def refresh_visibility(expense_ids):
+    """
+    Recompute the visibility rows of the given expenses and move the
+    monthly rollups with them. Returns the ids of the users who lost or
+    gained rows.
+    """
+    user_ids = set()
+    for chunk in chunked(expense_ids):
+        with transaction.atomic():
+            removed = _delete_visibility(chunk)
+            added = _rollup_rows(
+                ExpenseVisibility.objects.bulk_create(compute_visibility(chunk).values())
+            )
+            apply_rollup_deltas(rollup_deltas(removed, added))
+            index_expenses(chunk)
+        user_ids.update(row[0] for rows in (removed, added) for row in rows)
+    return user_ids
+
+
+def remove_visibility(expense_ids):
+    """
+    Drop the visibility rows of expenses about to be deleted, taking them
+    out of the rollups. Returns the ids of the users who lost rows. Their
+    search index rows go with the expenses, so viewers are left as is.
+    """
+    user_ids = set()
+    for chunk in chunked(expense_ids):
+        with transaction.atomic():
+            removed = _delete_visibility(chunk)
+            apply_rollup_deltas(rollup_deltas(removed, []))
+        user_ids.update(row[0] for row in removed)
+    return user_ids
+
+
+def refresh_membership_visibility(group_ids, user_ids):
+    """
+    Bring the visibility rows of users who joined or left groups up to
+    date for those groups' expenses, moving their rollups. Only those
+    users' rows are read or written, so a membership change costs the
+    group's expenses times the users changing, not times every member.
+    Returns the ids of the users who lost or gained rows.
+    """
+    group_ids, user_ids = list(group_ids), set(user_ids)
+    if not group_ids or not user_ids:
+        return set()
+    with transaction.atomic():
+        # Which of the users see each group's expenses through membership
+        members = {group_id: users & user_ids for group_id, users in group_members(group_ids).items()}
+        wanted = {}
+        expenses = Expense.objects.filter(group_id__in=group_ids).values_list(*VISIBILITY_FIELDS)
+        for row in expenses.iterator(chunk_size=CHUNK_SIZE):
+            expense_id, created_by_id, paid_by_id, group_id = row[:4]
+            for user_id in ({created_by_id, paid_by_id} & user_ids) | members.get(group_id, set()):
+                wanted[(user_id, expense_id)] = row
+
+        stale, removed, unseen = [], [], set()
+        for chunk in chunked(user_ids):
+            existing = ExpenseVisibility.objects.filter(group_id__in=group_ids, user_id__in=chunk).values_list(
+                'id', 'user_id', 'expense_id', 'date', 'category_id', 'amount'
+            )
+            for row_id, user_id, expense_id, date, category_id, amount in existing:
+                if wanted.pop((user_id, expense_id), None) is None:
+                    stale.append(row_id)
+                    unseen.add(expense_id)
+                    removed.append((user_id, date, category_id, amount))
+
+        for chunk in chunked(stale):
+            ExpenseVisibility.objects.filter(id__in=chunk).delete()
+        added = ExpenseVisibility.objects.bulk_create(
+            [_visibility_row(user_id, row) for (user_id, _), row in wanted.items()], batch_size=CHUNK_SIZE
+        )
+        apply_rollup_deltas(rollup_deltas(removed, _rollup_rows(added)))
+        index_expenses(unseen | {row.expense_id for row in added})
+    return {row[0] for row in removed} | {row.user_id for row in added}
+
+
+def rebuild_visibility():
+    """Rebuild the whole visibility table, and the rollups derived from it, from the expenses"""
+    with transaction.atomic():
+        ExpenseVisibility.objects.all().delete()
+        for chunk in chunked(Expense.objects.values_list('id', flat=True)):
+            ExpenseVisibility.objects.bulk_create(compute_visibility(chunk).values())
+            index_expenses(chunk)
+        rebuild_rollups()
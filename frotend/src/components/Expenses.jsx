@@ -67,6 +67,7 @@ const Expenses = () => {
   const [aiCategory, setAiCategory] = useState('');
   const [aiLoading, setAiLoading] = useState(false);
   const [expenses, setExpenses] = useState([]);
+  const [nextExpensesUrl, setNextExpensesUrl] = useState(null);
   const [groups, setGroups] = useState([]);
   const [categories, setCategories] = useState([]);
   const [showForm, setShowForm] = useState(false);
@@ -118,12 +119,15 @@ const Expenses = () => {
     }
   };
 
-  const fetchExpenses = async () => {
+  const fetchExpenses = async (url = `${API_BASE_URL}/expenses/expenses/?expand=category,group,paid_by`) => {
     try {
-      const response = await authFetch(`${API_BASE_URL}/expenses/expenses/`);
+      const response = await authFetch(url);
       if (response.ok) {
         const data = await response.json();
-        setExpenses(data);
+        // The list is cursor-paginated: `next` carries the continuation token
+        const isNextPage = url.includes('cursor=');
+        setExpenses(prev => (isNextPage ? [...prev, ...data.results] : data.results));
+        setNextExpensesUrl(data.next);
       }
     } catch (error) {
       console.error('Failed to fetch expenses:', error);
@@ -603,6 +607,15 @@ const Expenses = () => {
                 </div>
               ))}
             </div>
+            {nextExpensesUrl && (
+              <button
+                type="button"
+                className="btn btn-outline"
+                onClick={() => fetchExpenses(nextExpensesUrl)}
+              >
+                Load more
+              </button>
+            )}
           </div>
         </main>
       </div>